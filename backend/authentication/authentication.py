@@ -0,0 +1,21 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+from .users import is_revoked
+
+
+class ClaimsJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    JWT authentication that trusts the user id in the access token instead of
+    selecting the user on every request. request.user is a ClaimsUser (see
+    users.py); the only per-request lookup is the revocation check, which
+    rejects the tokens of deactivated users and is read through the cache.
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        # A token without iat counts as issued before any revocation
+        if is_revoked(user.id, validated_token.get("iat", 0)):
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
@@ -1,3 +1,16 @@
 from django.db import models
 
-# Create your models here.
+
+class Revocation(models.Model):
+    """
+    The point from which a user's access tokens stopped authenticating: tokens
+    issued before `revoked_at` are rejected, and so is every token while the
+    user is still deactivated or deleted. See users.py.
+    """
+    # Not a foreign key, so that the row outlives a deleted user
+    user_id = models.BigIntegerField(primary_key=True)
+    revoked_at = models.DateTimeField()
+    is_active = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"User {self.user_id} revoked at {self.revoked_at}"
@@ -1,3 +1,119 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from listings.models import FurnitureListing
+from .models import Revocation
+from .users import ClaimsUser
+
+User = get_user_model()
+
+
+class ClaimsJWTAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username="seller", password="password", email="seller@example.com")
+        cls.other = User.objects.create_user(username="other", password="password")
+        cls.listing = FurnitureListing.objects.create(
+            seller=cls.seller, title="Chair", description="Oak", price=20, category="chairs",
+            condition="like_new", status="draft",
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def client_for(self, user, issued_ago=0):
+        token = AccessToken.for_user(user)
+        token.set_iat(at_time=token.current_time - timedelta(seconds=issued_ago))
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        return client
+
+    def move_revocations_back(self, seconds):
+        # iat has whole seconds: leave a gap between the revocation and the tokens issued after it
+        Revocation.objects.update(revoked_at=F("revoked_at") - timedelta(seconds=seconds))
+        cache.clear()
+
+    def assertRevoked(self, client):
+        response = client.get("/api/mylistings/draft/")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data["code"], "user_inactive")
+
+    def test_requests_do_not_select_the_user(self):
+        client = self.client_for(self.seller)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get("/api/mylistings/draft/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["id"] for row in response.data], [self.listing.id])
+        self.assertFalse([query for query in queries if "users_user" in query["sql"]])
+
+    def test_ownership_checks_use_the_token_id(self):
+        data = {"title": "Oak chair"}
+        response = self.client_for(self.other).patch(f"/api/listings/{self.listing.id}/", data, format="json")
+        self.assertEqual(response.status_code, 403)
+        response = self.client_for(self.seller).patch(f"/api/listings/{self.listing.id}/", data, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["title"], "Oak chair")
+
+    def test_other_attributes_load_the_cached_row(self):
+        user = ClaimsUser(AccessToken.for_user(self.seller))
+        self.assertEqual(user, self.seller)
+        self.assertEqual(self.seller, user)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, "seller@example.com")
+            self.assertEqual(user.username, "seller")
+        with self.assertNumQueries(0):
+            self.assertFalse(ClaimsUser(AccessToken.for_user(self.seller)).is_staff)
+
+    def test_saving_a_user_drops_the_cached_row(self):
+        ClaimsUser(AccessToken.for_user(self.seller)).email
+        with self.captureOnCommitCallbacks(execute=True):
+            self.seller.email = "new@example.com"
+            self.seller.save()
+        self.assertEqual(ClaimsUser(AccessToken.for_user(self.seller)).email, "new@example.com")
+
+    def test_deactivated_users_tokens_stop_working(self):
+        client = self.client_for(self.seller, issued_ago=10)
+        self.assertEqual(client.get("/api/mylistings/draft/").status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.seller.is_active = False
+            self.seller.save()
+        self.assertRevoked(client)
+        # Including tokens issued while deactivated, e.g. from a refresh token
+        self.assertRevoked(self.client_for(self.seller))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.seller.is_active = True
+            self.seller.save()
+        self.move_revocations_back(5)
+        self.assertRevoked(client)
+        self.assertEqual(self.client_for(self.seller).get("/api/mylistings/draft/").status_code, 200)
+
+    def test_revocations_survive_cache_eviction(self):
+        client = self.client_for(self.seller)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.seller.delete()
+        cache.clear()
+        self.assertRevoked(client)
+        self.assertEqual(self.client_for(self.other).get("/api/mylistings/draft/").status_code, 200)
+
+    def test_queryset_updates_revoke_tokens(self):
+        client = self.client_for(self.seller, issued_ago=10)
+        self.assertEqual(client.get("/api/mylistings/draft/").status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.seller.pk).update(is_active=False)
+        self.assertRevoked(client)
 
-# Create your tests here.
+        self.seller.is_active = True
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.bulk_update([self.seller], ["is_active"])
+        self.move_revocations_back(5)
+        self.assertEqual(self.client_for(self.seller).get("/api/mylistings/draft/").status_code, 200)
@@ -0,0 +1,188 @@
+"""
+Users resolved from access token claims.
+
+ClaimsJWTAuthentication authenticates a request without loading its user:
+request.user is a ClaimsUser carrying the id from the token, which is all
+that ownership checks and per-user filters need. Any other attribute, such as
+request.user.email, loads the full row on first use from a short-lived cache
+shared by every process.
+
+Saving a user drops their cached row once the save commits. Deactivating or
+deleting one records a Revocation in the same transaction: the access tokens
+they hold stop authenticating, new ones are rejected while they stay
+inactive, and tokens issued before the revocation stay rejected after they are
+reactivated. Queryset updates of is_active are covered through the
+active_changed signal; other queryset updates are only picked up when the
+cached row expires.
+
+The revocation check runs on every request, so it reads through the cache. A
+missing entry, whether never cached or evicted, is read again from the
+database, so eviction cannot lift a revocation. Revoking refreshes the entry
+on commit, which reaches every process as long as the cache is shared, as
+deployment settings require.
+"""
+import math
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.models import TokenUser
+
+from users.signals import active_changed
+from .models import Revocation
+
+USER_CACHE_TIMEOUT = 300
+
+User = get_user_model()
+
+
+def user_key(user_id):
+    return f"users:user:{user_id}"
+
+
+def revoked_key(user_id):
+    return f"users:revoked:{user_id}"
+
+
+def get_cached_user(user_id):
+    """The User with id `user_id`, from the cache or the database. Raises User.DoesNotExist."""
+    key = user_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = User.objects.get(pk=user_id)
+        cache.set(key, user, USER_CACHE_TIMEOUT)
+    return user
+
+
+def tokens_valid_after(user_id):
+    """
+    The earliest `iat` accepted in an access token of `user_id`: 0 if they
+    were never revoked, infinity while they are deactivated or deleted, and
+    their last revocation once they are active again.
+    """
+    key = revoked_key(user_id)
+    valid_after = cache.get(key)
+    if valid_after is None:
+        revocation = Revocation.objects.filter(user_id=user_id).values_list("revoked_at", "is_active").first()
+        if revocation is None:
+            valid_after = 0
+        elif revocation[1]:
+            # iat has whole seconds; a token issued in the second of the revocation is rejected
+            valid_after = math.ceil(revocation[0].timestamp())
+        else:
+            valid_after = math.inf
+        # add, not set: a revocation that committed since the query has stored its own value
+        cache.add(key, valid_after, USER_CACHE_TIMEOUT)
+    return valid_after
+
+
+def is_revoked(user_id, issued_at):
+    return issued_at < tokens_valid_after(user_id)
+
+
+def revoke_users(user_ids):
+    """Stop the access tokens of `user_ids` from authenticating, until they are restored."""
+    now = timezone.now()
+    Revocation.objects.bulk_create(
+        [Revocation(user_id=user_id, revoked_at=now, is_active=False) for user_id in user_ids],
+        update_conflicts=True, unique_fields=["user_id"], update_fields=["revoked_at", "is_active"],
+    )
+    transaction.on_commit(lambda: cache.set_many(
+        {revoked_key(user_id): math.inf for user_id in user_ids}, USER_CACHE_TIMEOUT
+    ))
+
+
+def restore_users(user_ids):
+    """Accept access tokens `user_ids` are issued from now on; those issued before revocation stay rejected."""
+    if Revocation.objects.filter(user_id__in=user_ids, is_active=False).update(is_active=True):
+        transaction.on_commit(lambda: cache.delete_many([revoked_key(user_id) for user_id in user_ids]))
+
+
+class ClaimsUser(TokenUser):
+    """
+    The user of an access token. id and pk come from the token; everything
+    else is read from the user's row, loaded once per request.
+    """
+
+    @cached_property
+    def user(self):
+        return get_cached_user(self.id)
+
+    @cached_property
+    def username(self):
+        return self.user.username
+
+    @cached_property
+    def is_staff(self):
+        return self.user.is_staff
+
+    @cached_property
+    def is_superuser(self):
+        return self.user.is_superuser
+
+    @property
+    def groups(self):
+        return self.user.groups
+
+    @property
+    def user_permissions(self):
+        return self.user.user_permissions
+
+    def get_group_permissions(self, obj=None):
+        return self.user.get_group_permissions(obj)
+
+    def get_all_permissions(self, obj=None):
+        return self.user.get_all_permissions(obj)
+
+    def has_perm(self, perm, obj=None):
+        return self.user.has_perm(perm, obj)
+
+    def has_perms(self, perm_list, obj=None):
+        return self.user.has_perms(perm_list, obj)
+
+    def has_module_perms(self, module):
+        return self.user.has_module_perms(module)
+
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.pk == other.pk
+        return super().__eq__(other)
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __getattr__(self, attr):
+        # Only reached for attributes the class does not define
+        if attr.startswith("_") or attr in ("token", "user"):
+            raise AttributeError(attr)
+        return getattr(self.user, attr)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    if instance.is_active:
+        restore_users([instance.pk])
+    else:
+        revoke_users([instance.pk])
+    transaction.on_commit(lambda: cache.delete(user_key(instance.pk)))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    revoke_users([instance.pk])
+    transaction.on_commit(lambda: cache.delete(user_key(instance.pk)))
+
+
+@receiver(active_changed, sender=User)
+def users_active_changed(sender, user_ids, **kwargs):
+    active = dict(User.objects.filter(pk__in=user_ids).values_list("pk", "is_active"))
+    revoked = [user_id for user_id in user_ids if not active.get(user_id)]
+    if revoked:
+        revoke_users(revoked)
+    if len(revoked) < len(user_ids):
+        restore_users([user_id for user_id in user_ids if active.get(user_id)])
+    transaction.on_commit(lambda: cache.delete_many([user_key(user_id) for user_id in user_ids]))
@@ -17,6 +17,8 @@ DEBUG = False
 SECRET_KEY = env("SECRET_KEY")
 
 MIDDLEWARE = [
+    "core.instrumentation.InstrumentationMiddleware",
+    "core.profiling.ProfilingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
@@ -49,11 +51,18 @@ DATABASES = {
     "default": dj_database_url.config(default=env("DATABASE_URL"), conn_max_age=600)
 }
 
+# Required, with no local-memory fallback: the detail cache, the feed version
+# and other invalidations must reach every worker, so point it at Redis
+# (redis://host:6379/0).
+CACHES = {
+    "default": env.cache("CACHE_URL"),
+}
+
 
 AUTH_USER_MODEL = "users.User"
 
 # S3 Configuration
-DEFAULT_FILE_STORAGE = "storages.backends.s3boto3.S3Boto3Storage"
+# Listing images use the InstrumentedS3Storage set on ListingImage.image.
 AWS_ACCESS_KEY_ID = env("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = env("AWS_SECRET_ACCESS_KEY")
 AWS_STORAGE_BUCKET_NAME = env("AWS_STORAGE_BUCKET_NAME")  
@@ -0,0 +1,236 @@
+"""
+Per-request instrumentation.
+
+InstrumentationMiddleware measures every request: its database queries and
+their time, storage (S3) calls and their time, the time spent serializing and
+the whole request. The totals go back in a Server-Timing header, so they show
+up in the browser's network panel, and a sample of the requests
+(INSTRUMENTATION_LOG_SAMPLE_RATE) is logged as one JSON line.
+
+Views declare how many queries a request may make with a `query_budget`
+attribute: an int, or a dict of budgets by action on viewsets. Function views
+use the @query_budget decorator. A request over its budget is always logged,
+and raises QueryBudgetExceeded when ENFORCE_QUERY_BUDGETS is set, as it is
+under core.test_runner.
+
+Measurements follow the request into sync_to_async and into threads that run
+a copy of its context (see listings.storage.run_concurrently), but not into
+threads started any other way.
+"""
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOG_SAMPLE_RATE = 0.01
+
+_metrics = contextvars.ContextVar("request_metrics", default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.view = None
+        self.query_budget = None
+        self.queries = 0
+        self.db_ms = 0.0
+        self.storage_calls = 0
+        self.storage_ms = 0.0
+        self.serialize_ms = 0.0
+        self.serializing = False
+        # Storage calls can run on several threads at once
+        self.lock = threading.Lock()
+
+    def add_query(self, ms):
+        with self.lock:
+            self.queries += 1
+            self.db_ms += ms
+
+    def add_storage_call(self, ms):
+        with self.lock:
+            self.storage_calls += 1
+            self.storage_ms += ms
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def server_timing(self):
+        return ", ".join([
+            f'db;dur={self.db_ms:.1f};desc="{self.queries} queries"',
+            f'storage;dur={self.storage_ms:.1f};desc="{self.storage_calls} calls"',
+            f"serialize;dur={self.serialize_ms:.1f}",
+            f"total;dur={self.elapsed_ms():.1f}",
+        ])
+
+    def as_dict(self):
+        return {
+            "view": self.view,
+            "total_ms": round(self.elapsed_ms(), 1),
+            "queries": self.queries,
+            "query_budget": self.query_budget,
+            "db_ms": round(self.db_ms, 1),
+            "storage_calls": self.storage_calls,
+            "storage_ms": round(self.storage_ms, 1),
+            "serialize_ms": round(self.serialize_ms, 1),
+        }
+
+
+def current_metrics():
+    """The RequestMetrics of the request being handled, or None."""
+    return _metrics.get()
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query((time.perf_counter() - start) * 1000)
+
+
+def instrument_connection(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    instrument_connection(connection)
+
+
+def start_storage_call(context, **kwargs):
+    context["instrumentation_start"] = time.perf_counter()
+
+
+def finish_storage_call(context, **kwargs):
+    metrics = _metrics.get()
+    start = context.pop("instrumentation_start", None)
+    if metrics is not None and start is not None:
+        metrics.add_storage_call((time.perf_counter() - start) * 1000)
+
+
+def instrument_boto3_session(session):
+    """Report the S3 calls of clients made by `session` to the current request."""
+    session.events.register("before-call.s3", start_storage_call)
+    session.events.register("after-call.s3", finish_storage_call)
+    return session
+
+
+@contextmanager
+def timed_serialization():
+    metrics = _metrics.get()
+    if metrics is None or metrics.serializing:
+        # Nested serializers are timed by the outermost one.
+        yield
+        return
+    metrics.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serialize_ms += (time.perf_counter() - start) * 1000
+        metrics.serializing = False
+
+
+class TimedSerializerMixin:
+    """Counts the serializer's to_representation() as serialize time."""
+
+    def to_representation(self, instance):
+        with timed_serialization():
+            return super().to_representation(instance)
+
+
+def query_budget(budget):
+    """Declare the most queries a request to the decorated function view may make."""
+
+    def decorator(view_func):
+        view_func.query_budget = budget
+        return view_func
+
+    return decorator
+
+
+def get_query_budget(view_func, method):
+    view = getattr(view_func, "cls", view_func)
+    budget = getattr(view, "query_budget", None)
+    if isinstance(budget, dict):
+        actions = getattr(view_func, "actions", None) or {}
+        budget = budget.get(actions.get(method.lower()))
+    return budget
+
+
+class InstrumentationMiddleware:
+    """Measures each request; see the module docstring. Place it first in MIDDLEWARE."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Connections opened before this module was imported
+        for connection in connections.all(initialized_only=True):
+            instrument_connection(connection)
+        token = _metrics.set(RequestMetrics())
+        try:
+            return self.finish(request, self.get_response(request))
+        finally:
+            _metrics.reset(token)
+
+    async def __acall__(self, request):
+        token = _metrics.set(RequestMetrics())
+        try:
+            return self.finish(request, await self.get_response(request))
+        finally:
+            _metrics.reset(token)
+
+    def finish(self, request, response):
+        metrics = _metrics.get()
+        # Read from the resolver match rather than in process_view(), which
+        # Django would run in a thread under ASGI.
+        match = getattr(request, "resolver_match", None)
+        if match is not None:
+            view = getattr(match.func, "cls", match.func)
+            metrics.view = f"{view.__module__}.{view.__qualname__}"
+            metrics.query_budget = get_query_budget(match.func, request.method)
+        response["Server-Timing"] = metrics.server_timing()
+
+        over_budget = metrics.query_budget is not None and metrics.queries > metrics.query_budget
+        sample_rate = getattr(settings, "INSTRUMENTATION_LOG_SAMPLE_RATE", DEFAULT_LOG_SAMPLE_RATE)
+        if over_budget or random.random() < sample_rate:
+            fields = {
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                **metrics.as_dict(),
+            }
+            logger.log(logging.WARNING if over_budget else logging.INFO, json.dumps(fields))
+        if over_budget and getattr(settings, "ENFORCE_QUERY_BUDGETS", False):
+            raise QueryBudgetExceeded(
+                f"{request.method} {request.path} ({metrics.view}) made {metrics.queries} "
+                f"queries, over its budget of {metrics.query_budget}"
+            )
+        return response
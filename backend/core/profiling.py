@@ -0,0 +1,302 @@
+"""
+On-demand sampling profiler for live requests.
+
+Staff start a profiling session through the API (ProfilingView) for a
+percentage of the requests to some URL names, for a limited time. While a
+chosen request runs, a background thread samples its stack every few
+milliseconds and counts each distinct stack; nothing is traced, so the
+request itself runs at full speed. Every process keeps its counts in memory
+and copies them to its slot of the session in the shared cache every second
+and whenever it stops sampling. ProfileStacksView merges the slots into
+collapsed stacks (for flamegraph.pl and similar tools) or a speedscope
+profile.
+
+Only requests served synchronously are profiled. An async view shares its
+thread with every other request on the event loop, so its samples could not
+be told apart.
+"""
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.urls import Resolver404, get_resolver, resolve
+from rest_framework import permissions, serializers, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+SESSION_KEY = "profiling:session"
+# Sessions are short; keep their stacks around for a while to export them.
+STACKS_TIMEOUT = 60 * 60
+MAX_DURATION = 15 * 60
+DEFAULT_INTERVAL_MS = 10
+# How long a process trusts its copy of the session before reading it again
+SESSION_REFRESH = 1.0
+FLUSH_INTERVAL = 1.0
+
+
+def slots_key(session_id):
+    return f"profiling:{session_id}:slots"
+
+
+def stacks_key(session_id, slot):
+    return f"profiling:{session_id}:stacks:{slot}"
+
+
+def frame_name(frame):
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_qualname}"
+
+
+def collapse(frame):
+    """The stack of `frame`, outermost call first, as one collapsed-stack line."""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Sampler:
+    """
+    Samples the stacks of the threads registered with it from a background
+    thread, which runs only while at least one thread is registered.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.threads = {}
+        self.sampling = None
+        self.session_id = None
+        self.interval = DEFAULT_INTERVAL_MS / 1000
+        self.stacks = Counter()
+        self.slot = None
+        self.flushed_at = 0.0
+        self.flush_lock = threading.Lock()
+
+    def start(self, thread_id, session):
+        with self.lock:
+            if session["id"] != self.session_id:
+                self.session_id = session["id"]
+                self.stacks = Counter()
+                self.slot = None
+                self.flushed_at = 0.0
+            self.interval = session["interval_ms"] / 1000
+            self.threads[thread_id] = session["id"]
+            if self.sampling is None:
+                self.sampling = threading.Thread(target=self.run, name="profiling-sampler", daemon=True)
+                self.sampling.start()
+
+    def stop(self, thread_id):
+        with self.lock:
+            self.threads.pop(thread_id, None)
+
+    def run(self):
+        while True:
+            with self.lock:
+                if not self.threads:
+                    self.sampling = None
+                    break
+                profiled = [
+                    thread_id for thread_id, session_id in self.threads.items()
+                    if session_id == self.session_id
+                ]
+                interval = self.interval
+            frames = sys._current_frames()
+            samples = [collapse(frames[thread_id]) for thread_id in profiled if thread_id in frames]
+            with self.lock:
+                self.stacks.update(samples)
+            if time.monotonic() - self.flushed_at >= FLUSH_INTERVAL:
+                self.flush()
+            time.sleep(interval)
+        self.flush()
+
+    def flush(self):
+        """Copy this process's counts to its slot of the session in the cache."""
+        with self.flush_lock:
+            with self.lock:
+                session_id, stacks = self.session_id, dict(self.stacks)
+                self.flushed_at = time.monotonic()
+            if session_id is None or not stacks:
+                return
+            if self.slot is None:
+                cache.add(slots_key(session_id), 0, STACKS_TIMEOUT)
+                self.slot = cache.incr(slots_key(session_id))
+            cache.set(stacks_key(session_id, self.slot), stacks, STACKS_TIMEOUT)
+
+
+sampler = Sampler()
+
+_session = (0.0, None)
+
+
+def get_session():
+    """The active profiling session, re-read from the cache at most once a second."""
+    global _session
+    expires, session = _session
+    now = time.monotonic()
+    if now >= expires:
+        session = cache.get(SESSION_KEY)
+        _session = (now + SESSION_REFRESH, session)
+    if session is not None and time.time() >= session["until"]:
+        return None
+    return session
+
+
+def forget_session():
+    # Make this process read the session again on its next request
+    global _session
+    _session = (0.0, None)
+
+
+def start_session(url_names, percent, duration, interval_ms=DEFAULT_INTERVAL_MS):
+    previous = cache.get(SESSION_KEY)
+    session = {
+        "id": (previous["id"] + 1) if previous else 1,
+        "url_names": sorted(set(url_names)),
+        "percent": percent,
+        "interval_ms": interval_ms,
+        "started": time.time(),
+        "until": time.time() + duration,
+    }
+    cache.set(SESSION_KEY, session, STACKS_TIMEOUT)
+    forget_session()
+    return session
+
+
+def stop_session():
+    session = cache.get(SESSION_KEY)
+    if session is not None:
+        session["until"] = min(session["until"], time.time())
+        cache.set(SESSION_KEY, session, STACKS_TIMEOUT)
+    forget_session()
+    return session
+
+
+def get_stacks(session_id):
+    """The stack counts of session `session_id`, merged across processes."""
+    slots = cache.get(slots_key(session_id), 0)
+    found = cache.get_many([stacks_key(session_id, slot) for slot in range(1, slots + 1)])
+    stacks = Counter()
+    for counts in found.values():
+        stacks.update(counts)
+    return stacks
+
+
+def collapsed(stacks):
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def speedscope(stacks, name):
+    """A speedscope file (https://www.speedscope.app) with one sampled profile."""
+    frames = {}
+    samples = []
+    weights = []
+    for stack, count in stacks.most_common():
+        samples.append([frames.setdefault(frame, len(frames)) for frame in stack.split(";")])
+        weights.append(count)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": [{"name": frame} for frame in frames]},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "none",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights,
+        }],
+    }
+
+
+class ProfilingMiddleware:
+    """Profiles the requests chosen by the active session; place it after InstrumentationMiddleware."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.get_response(request)
+        session = get_session()
+        if session is None or not self.chosen(request, session):
+            return self.get_response(request)
+
+        thread_id = threading.get_ident()
+        sampler.start(thread_id, session)
+        try:
+            return self.get_response(request)
+        finally:
+            sampler.stop(thread_id)
+
+    def chosen(self, request, session):
+        if random.random() * 100 >= session["percent"]:
+            return False
+        try:
+            return resolve(request.path_info).url_name in session["url_names"]
+        except Resolver404:
+            return False
+
+
+class ProfilingSessionSerializer(serializers.Serializer):
+    url_names = serializers.ListField(child=serializers.CharField(), allow_empty=False)
+    percent = serializers.FloatField(min_value=0, max_value=100)
+    duration = serializers.IntegerField(min_value=1, max_value=MAX_DURATION, help_text="Seconds")
+    interval_ms = serializers.IntegerField(min_value=1, max_value=1000, default=DEFAULT_INTERVAL_MS)
+
+    def validate_url_names(self, value):
+        known = {name for name in get_resolver().reverse_dict if isinstance(name, str)}
+        unknown = sorted(set(value) - known)
+        if unknown:
+            raise serializers.ValidationError(f"Unknown URL names: {', '.join(unknown)}")
+        return value
+
+
+class ProfilingView(APIView):
+    """Show (GET), start (POST) or stop (DELETE) the profiling session. Staff only."""
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({"session": cache.get(SESSION_KEY)})
+
+    def post(self, request):
+        serializer = ProfilingSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        session = start_session(**serializer.validated_data)
+        return Response({"session": session}, status=status.HTTP_201_CREATED)
+
+    def delete(self, request):
+        return Response({"session": stop_session()})
+
+
+class ProfileStacksView(APIView):
+    """
+    The sampled stacks of the latest session (or ?session=<id>), as collapsed
+    stacks or, with ?output=speedscope, a speedscope file. Staff only.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        session_id = request.query_params.get("session")
+        if session_id is None:
+            session = cache.get(SESSION_KEY)
+            if session is None:
+                return Response({"detail": "No profiling session"}, status=status.HTTP_404_NOT_FOUND)
+            session_id = session["id"]
+        stacks = get_stacks(session_id)
+
+        if request.query_params.get("output") == "speedscope":
+            return Response(speedscope(stacks, f"Profiling session {session_id}"))
+        return HttpResponse(collapsed(stacks), content_type="text/plain")
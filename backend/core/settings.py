@@ -41,7 +41,7 @@ ALLOWED_HOSTS = []
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "authentication.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
@@ -51,6 +51,8 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    # Built from the access token without a user query
+    "TOKEN_USER_CLASS": "authentication.users.ClaimsUser",
 }
 
 # Application definition
@@ -72,6 +74,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its request time covers the other middleware too
+    'core.instrumentation.InstrumentationMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,6 +89,13 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'core.urls'
 
+# Fraction of requests whose measurements (see core.instrumentation) are
+# logged. Requests over their view's query budget are always logged, and fail
+# with QueryBudgetExceeded when budgets are enforced, as they are in tests.
+INSTRUMENTATION_LOG_SAMPLE_RATE = 0.01
+ENFORCE_QUERY_BUDGETS = False
+TEST_RUNNER = 'core.test_runner.QueryBudgetTestRunner'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -110,9 +122,18 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than SQLite's shared in-memory database, whose table
+        # locks fail concurrent writers at once instead of waiting for them.
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Local memory by default; point CACHE_URL at Redis (redis://host:6379/0) in
+# production so cache invalidations reach every worker process.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -164,7 +185,7 @@ CORS_ALLOW_CREDENTIALS = True
 
 AUTH_USER_MODEL = 'users.User'
 
-DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+# Listing images use the InstrumentedS3Storage set on ListingImage.image.
 AWS_ACCESS_KEY_ID = env('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = env('AWS_SECRET_ACCESS_KEY')
 AWS_STORAGE_BUCKET_NAME = env('AWS_STORAGE_BUCKET_NAME')  # Replace with your actual bucket name
@@ -176,3 +197,27 @@ AWS_S3_CUSTOM_DOMAIN = env('CLOUDFRONT_DISTRIBUTION_DOMAIN_NAME')
 # AWS_CLOUDFRONT_KEY_ID = env.str('AWS_CLOUDFRONT_KEY_ID').strip()
 # AWS_CLOUDFRONT_KEY = env.str('AWS_CLOUDFRONT_KEY', multiline=True).strip()
 
+# Listing image URLs are memoized for this many seconds. Keep it below
+# AWS_QUERYSTRING_EXPIRE so a cached signed URL is never served expired.
+LISTINGS_IMAGE_URL_TTL = AWS_QUERYSTRING_EXPIRE // 2
+
+# Published listing detail payloads are cached in this cache alias. They embed
+# memoized image URLs, so expire them before those URLs' signatures do.
+LISTINGS_DETAIL_CACHE = 'default'
+LISTINGS_DETAIL_CACHE_TIMEOUT = AWS_QUERYSTRING_EXPIRE - LISTINGS_IMAGE_URL_TTL - 60
+
+# Homepage feed windows (listings.feed) embed the same signed thumbnail URLs.
+LISTINGS_FEED_CACHE = 'default'
+LISTINGS_FEED_CACHE_TIMEOUT = AWS_QUERYSTRING_EXPIRE - LISTINGS_IMAGE_URL_TTL - 60
+
+
+# Uploaded listing images are stored raw and compressed by this pipeline after
+# the request commits. Set to None to compress inline on save instead.
+LISTINGS_IMAGE_PIPELINE = {
+    'BACKEND': 'listings.tasks.ProcessPoolImagePipeline',
+    'OPTIONS': {
+        'workers': 2,
+        'max_attempts': 3,
+        'retry_delay': 5,
+    },
+}
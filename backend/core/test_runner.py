@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class QueryBudgetTestRunner(DiscoverRunner):
+    """The default test runner, with the query budgets of views enforced (see core.instrumentation)."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.ENFORCE_QUERY_BUDGETS = True
+        # Tests that check the log turn sampling on themselves
+        settings.INSTRUMENTATION_LOG_SAMPLE_RATE = 0
@@ -2,15 +2,21 @@ from django.contrib import admin
 from django.urls import path, include
 from users.views import CreateUserView
 from rest_framework.routers import DefaultRouter
+from listings import async_views
 from listings.views import (
     HomePageListingsView,
     MyPageListingsView,
     ListingDetailView,
     ListingViewSet,
+    ListingSearchView,
+    ListingFacetsView,
     PurchasedListingsView,
+    SavedListingsView,
+    UploadSlotsView,
 )
 from rest_framework_simplejwt.views import TokenRefreshView
 from authentication.views import MyTokenObtainPairView
+from core.profiling import ProfileStacksView, ProfilingView
 
 router = DefaultRouter()
 router.register(r"listings", ListingViewSet, basename="listing")
@@ -20,14 +26,23 @@ urlpatterns = [
     path("api/user/register/", CreateUserView.as_view(), name="register"),
     path("api/token/", MyTokenObtainPairView.as_view(), name="get_token"),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="refresh"),
+    path("api/profiling/", ProfilingView.as_view(), name="profiling"),
+    path("api/profiling/stacks/", ProfileStacksView.as_view(), name="profiling-stacks"),
     path("api-auth/", include("rest_framework.urls", namespace="rest_framework")),
     path("api/users/", include("users.urls")),
     # Listings
     path("api/", include(router.urls)),
     path("api/homepage/", HomePageListingsView.as_view(), name="homepage"),
+    path("api/search/", ListingSearchView.as_view(), name="listing-search"),
+    path("api/search/facets/", ListingFacetsView.as_view(), name="listing-facets"),
+    path("api/uploads/", UploadSlotsView.as_view(), name="upload-slots"),
     path("api/listings/details/<str:listing_id>/", ListingDetailView.as_view(), name="listing-details"),
+    # Async twins of the read-heavy endpoints, for ASGI deployments
+    path("api/async/homepage/", async_views.homepage, name="async-homepage"),
+    path("api/async/listings/details/<str:listing_id>/", async_views.listing_detail, name="async-listing-details"),
     
     # My Page URLs
     path("api/mylistings/<str:status>/", MyPageListingsView.as_view(), name="my-listings"),
     path('api/purchases/', PurchasedListingsView.as_view(), name='purchased-listings'),
+    path('api/saved/', SavedListingsView.as_view(), name='saved-listings'),
 ]
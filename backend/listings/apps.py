@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ListingsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'listings'
+
+    def ready(self):
+        # Connect the search index, facet, detail and feed cache and seller
+        # counter signal handlers.
+        from . import counters, detail_cache, facets, feed, search  # noqa: F401
@@ -0,0 +1,105 @@
+"""
+Async versions of the read-heavy listing endpoints, for ASGI servers
+(uvicorn core.asgi:application).
+
+While a request waits on the cache, the database or a slow client it holds a
+coroutine instead of a worker thread. Cache hits are served with async cache
+and ORM calls only; misses run the synchronous serializers in a thread and
+fill the same caches as the sync views. Image URLs are only built on misses,
+and need no I/O: S3 and CloudFront URLs are signed locally.
+
+Responses go through DRF's JSON renderer and carry the same ETags, so they
+match the sync endpoints.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from core.instrumentation import query_budget
+
+from .conditional import not_modified
+from .detail_cache import aget_cached_detail, get_detail_entry
+from .models import FurnitureListing, asaved_listing_ids
+from .pagination import CachedFeedPagination
+from .serializers import ListingDetailSerializer
+from .views import HomePageListingsView, feed_etag, get_published_detail
+
+homepage_page_numbers = HomePageListingsView.as_view()
+
+
+def render(data, status=status.HTTP_200_OK, etag=None):
+    response = HttpResponse(JSONRenderer().render(data), status=status, content_type="application/json")
+    if etag is not None:
+        response["ETag"] = etag
+    return response
+
+
+async def authenticate(request):
+    """The user `request` authenticates as with the API's authentication classes."""
+    if "HTTP_AUTHORIZATION" not in request.META:
+        # The API only authenticates by header; skip the thread hop.
+        return AnonymousUser()
+    return await sync_to_async(run_authenticators)(request)
+
+
+def run_authenticators(request):
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        result = authentication_class().authenticate(request)
+        if result is not None:
+            return result[0]
+    return AnonymousUser()
+
+
+@query_budget(4)
+@require_GET
+async def homepage(request):
+    drf_request = Request(request)
+    paginator = CachedFeedPagination()
+    if paginator.uses_page_numbers(drf_request):
+        # Page numbers need a COUNT(*) over the live queryset anyway.
+        return await sync_to_async(homepage_page_numbers)(request)
+
+    try:
+        user = await authenticate(request)
+    except exceptions.AuthenticationFailed as error:
+        return render({"detail": error.detail}, status=error.status_code)
+
+    seller = user.pk if user.is_authenticated else None
+    rows = await paginator.apaginate_feed(drf_request, exclude_seller=seller)
+    saved = await asaved_listing_ids(user, [row["id"] for row in rows]) if seller else set()
+    etag = feed_etag(paginator, seller, saved)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    if seller:
+        rows = [{**row, "is_saved": row["id"] in saved} for row in rows]
+    return render({"next": paginator.get_next_link(), "results": rows}, etag=etag)
+
+
+@query_budget(5)
+@require_GET
+async def listing_detail(request, listing_id):
+    try:
+        user = await authenticate(request)
+    except exceptions.AuthenticationFailed as error:
+        return render({"detail": error.detail}, status=error.status_code)
+    if not user.is_authenticated:
+        error = exceptions.NotAuthenticated()
+        return render({"detail": error.detail}, status=error.status_code)
+
+    try:
+        entry = await aget_cached_detail(listing_id)
+        if entry is None:
+            entry = await sync_to_async(get_detail_entry)(
+                listing_id, lambda: ListingDetailSerializer(get_published_detail(listing_id)).data
+            )
+    except FurnitureListing.DoesNotExist:
+        # The same error as ListingDetailView
+        error = exceptions.APIException(f"Published FurnitureListing with id {listing_id} not found.")
+        return render({"detail": error.detail}, status=error.status_code)
+    return not_modified(request, entry["etag"]) or render(entry["payload"], etag=entry["etag"])
@@ -0,0 +1,315 @@
+"""
+Helpers shared by the benchmark management commands.
+
+Benchmarks run against a throwaway test database created next to the
+configured one, so they never touch development or production data.
+seed_marketplace() fills a database with a synthetic marketplace, and
+run_marketplace_benchmarks() times the main API paths against it.
+"""
+import contextlib
+import io
+import json
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import InMemoryStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .counters import reconcile_counters
+from .models import FurnitureListing, ListingImage, Purchase
+from .search import get_search_backend
+
+User = get_user_model()
+
+STATUS_WEIGHTS = {
+    FurnitureListing.Status.PUBLISHED: 70,
+    FurnitureListing.Status.DRAFT: 10,
+    FurnitureListing.Status.IN_PROGRESS: 5,
+    FurnitureListing.Status.COMPLETED: 5,
+    FurnitureListing.Status.SOLD: 10,
+}
+
+WORDS = [
+    "oak", "walnut", "pine", "leather", "velvet", "vintage", "modern", "compact",
+    "solid", "antique", "rustic", "white", "black", "grey", "large", "small",
+]
+
+
+@contextlib.contextmanager
+def scratch_database(verbosity=0):
+    """Create an empty, migrated test database and drop it afterwards."""
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def measure(func, repeat):
+    """Call `func` `repeat` times and return latency percentiles in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return percentiles(samples)
+
+
+def percentiles(samples):
+    """p50/p95/max of latency `samples` in milliseconds."""
+    samples = sorted(samples)
+    return {
+        "p50": round(statistics.median(samples), 3),
+        "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "max": round(samples[-1], 3),
+    }
+
+
+def create_sellers(count, prefix="seller", password=None):
+    # Hash once for everyone: hashing dominates for large counts. Without a
+    # password the accounts cannot log in.
+    hashed = make_password(password) if password else "!"
+    users = [User(username=f"{prefix}{i}", password=hashed) for i in range(count)]
+    return User.objects.bulk_create(users, batch_size=1000)
+
+
+def synthetic_listings(sellers, count, seed=0):
+    """Yield unsaved listings with realistic status/category/condition mixes."""
+    rng = random.Random(seed)
+    statuses = list(STATUS_WEIGHTS)
+    weights = list(STATUS_WEIGHTS.values())
+    categories = FurnitureListing.Category.values
+    conditions = FurnitureListing.Condition.values
+    for _ in range(count):
+        category = rng.choice(categories)
+        title = " ".join(rng.sample(WORDS, 2) + [category.lower()])
+        yield FurnitureListing(
+            seller=rng.choice(sellers),
+            title=title.capitalize(),
+            description=" ".join(rng.choices(WORDS, k=12)),
+            # Log-uniform between 5 and 5000, like a real second-hand catalogue
+            price=Decimal(round(5 * 1000 ** rng.random(), 2)).quantize(Decimal("0.01")),
+            category=category,
+            condition=rng.choice(conditions),
+            status=rng.choices(statuses, weights)[0],
+        )
+
+
+def bulk_insert(objects, batch_size=5000):
+    batch = []
+    model = None
+    for obj in objects:
+        model = type(obj)
+        batch.append(obj)
+        if len(batch) == batch_size:
+            model.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+
+
+@contextlib.contextmanager
+def local_image_storage(storage=None):
+    """Store listing images in `storage`, in memory by default, instead of S3."""
+    field = ListingImage._meta.get_field("image")
+    previous = field.storage
+    field.storage = storage or InMemoryStorage()
+    try:
+        yield field.storage
+    finally:
+        field.storage = previous
+
+
+def sample_jpeg(size=(1600, 1200)):
+    # Noise keeps the JPEG realistically large instead of a flat color.
+    noise = Image.effect_noise(size, 64)
+    buffer = io.BytesIO()
+    Image.merge("RGB", (noise, noise.transpose(Image.FLIP_LEFT_RIGHT), noise)).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def seed_marketplace(users, listings, images_per_listing=3, seed=0, password=None, image_bytes=None):
+    """
+    Fill the database with `users` users, who both sell and buy, and
+    `listings` synthetic listings with 1 to `images_per_listing` images each.
+    Every sold listing gets a purchase by another user. With `image_bytes`,
+    every image is also written to the listing image storage. Returns the
+    number of rows created per kind.
+    """
+    rng = random.Random(seed)
+    people = create_sellers(users, prefix="user", password=password)
+    first_listing = (FurnitureListing.objects.order_by("-id").values_list("id", flat=True).first() or 0) + 1
+    bulk_insert(synthetic_listings(people, listings, seed))
+    created = (
+        FurnitureListing.objects.filter(id__gte=first_listing)
+        .order_by("id")
+        .values_list("id", "seller_id", "status", "price")
+    )
+
+    storage = ListingImage._meta.get_field("image").storage
+    images = []
+    purchases = []
+    for listing_id, seller_id, status, price in created.iterator():
+        for order in range(1, rng.randint(1, images_per_listing) + 1):
+            name = f"listings/{listing_id}/{order}.jpg"
+            if image_bytes is not None:
+                name = storage.save(name, ContentFile(image_bytes))
+            images.append(ListingImage(
+                listing_id=listing_id, image=name, image_name=f"{listing_id}-{order}.jpg", order=order,
+            ))
+        if status == FurnitureListing.Status.SOLD and len(people) > 1:
+            buyer = rng.choice(people)
+            while buyer.pk == seller_id:
+                buyer = rng.choice(people)
+            purchases.append(Purchase(listing_id=listing_id, buyer=buyer, price_at_time_of_purchase=price))
+    bulk_insert(images)
+    bulk_insert(purchases)
+
+    # Bulk inserts send no signals, so bring the derived data up to date.
+    reconcile_counters()
+    get_search_backend().rebuild(
+        FurnitureListing.objects.filter(id__gte=first_listing, status=FurnitureListing.Status.PUBLISHED)
+    )
+    return {"users": len(people), "listings": listings, "images": len(images), "purchases": len(purchases)}
+
+
+def benchmark(call, repeat, before=None):
+    """
+    Time `repeat` calls of call(i), after calling before(i) untimed. Returns
+    latency percentiles in milliseconds and the median and most queries.
+    """
+    samples = []
+    queries = []
+    for i in range(repeat):
+        if before is not None:
+            before(i)
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = call(i)
+            samples.append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            raise AssertionError(f"{response.status_code}: {response.content[:200]!r}")
+        queries.append(len(captured))
+    return {
+        **percentiles(samples),
+        "queries_p50": statistics.median(queries),
+        "queries_max": max(queries),
+        "requests": repeat,
+    }
+
+
+def authenticated_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+    return client
+
+
+# Requests queue their image processing without running it, as a worker would.
+DEFERRED_PIPELINE = {"BACKEND": "listings.tasks.LocalImagePipeline", "OPTIONS": {"eager": False}}
+
+
+@override_settings(
+    LISTINGS_IMAGE_PIPELINE=DEFERRED_PIPELINE,
+    # The test client's host, for runs outside the test runner
+    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+)
+def run_marketplace_benchmarks(repeat, image_bytes, seed=0):
+    """
+    Time the homepage feed, listing detail, create-with-images,
+    update-with-reorder and purchase paths of a seeded database through the
+    full request stack. Needs at least two users and `repeat` published
+    listings of other sellers than the second user.
+    """
+    rng = random.Random(seed)
+    seller, buyer = User.objects.order_by("id")[:2]
+    published = list(
+        FurnitureListing.objects.filter(status=FurnitureListing.Status.PUBLISHED)
+        .exclude(seller=buyer)
+        .values_list("id", flat=True)
+    )
+    rng.shuffle(published)
+    anonymous = APIClient()
+    as_seller = authenticated_client(seller)
+    as_buyer = authenticated_client(buyer)
+    results = {}
+
+    def cold(i):
+        cache.clear()
+
+    def homepage(i):
+        return anonymous.get("/api/homepage/")
+
+    cache.clear()
+    results["homepage_cold"] = benchmark(homepage, repeat, before=cold)
+    results["homepage_warm"] = benchmark(homepage, repeat)
+    next_page = homepage(0).json()["next"]
+    as_buyer.get(next_page)
+    results["homepage_next_page_signed_in"] = benchmark(lambda i: as_buyer.get(next_page), repeat)
+
+    def detail(i):
+        return as_buyer.get(f"/api/listings/details/{published[i]}/")
+
+    results["detail_cold"] = benchmark(detail, repeat, before=cold)
+    for i in range(repeat):
+        detail(i)
+    results["detail_warm"] = benchmark(detail, repeat)
+
+    listing_fields = {
+        "title": "Oak dining table",
+        "description": "Seats six, solid oak",
+        "price": "450.00",
+        "category": FurnitureListing.Category.values[0],
+        "condition": FurnitureListing.Condition.values[0],
+    }
+
+    def create(i):
+        files = {
+            f"image_{order}": SimpleUploadedFile(f"{order}.jpg", image_bytes, content_type="image/jpeg")
+            for order in (1, 2, 3)
+        }
+        return as_seller.post("/api/listings/", {
+            **listing_fields,
+            **files,
+            "status": FurnitureListing.Status.PUBLISHED,
+            "image_updates": json.dumps([{"order": order} for order in (1, 2, 3)]),
+        })
+
+    results["create_with_images"] = benchmark(create, repeat)
+
+    listing = as_seller.post("/api/listings/", listing_fields).json()
+    image_ids = [image["id"] for image in listing["images"]]
+    for order in range(len(image_ids) + 1, 4):
+        image_ids.append(ListingImage.objects.create(
+            listing_id=listing["id"], image=f"listings/{listing['id']}/{order}.jpg",
+            image_name=f"{listing['id']}-{order}.jpg", order=order,
+        ).id)
+
+    def reorder(i):
+        ids = image_ids[::-1] if i % 2 == 0 else image_ids
+        image_updates = [{"id": str(image_id), "order": order} for order, image_id in enumerate(ids, start=1)]
+        return as_seller.patch(
+            f"/api/listings/{listing['id']}/", {"title": f"Oak table {i}", "image_updates": image_updates},
+            format="json",
+        )
+
+    results["update_with_reorder"] = benchmark(reorder, repeat)
+
+    def purchase(i):
+        # Detail runs read the first `repeat`; buy from the other end.
+        return as_buyer.post(f"/api/listings/{published[-1 - i]}/purchase/")
+
+    results["purchase"] = benchmark(purchase, repeat)
+    return results
@@ -0,0 +1,37 @@
+"""
+Conditional GET for the listing detail and the homepage feed.
+
+Both serve payloads kept in the cache: detail entries (see detail_cache) and
+feed windows (see feed). Each entry stores a digest of its JSON, taken when it
+is built, and a response's ETag is made from the digests of what it serves.
+A client whose If-None-Match still matches gets a 304 as soon as the usual
+currency checks pass: the listing's updated_at lookup for the detail, and for
+the feed the cache reads plus, when signed in, the saved-listings query. The
+payload is not serialized or rendered.
+
+The digest covers the whole payload: the listing's id, updated_at, images
+and their signed URLs. A 304 therefore never lets a client keep a copy past
+the point where re-serving the cached entry would stop. No Last-Modified is
+sent, because updated_at does not move when only the images change.
+"""
+import hashlib
+import json
+
+from django.utils.cache import get_conditional_response
+
+
+def digest(data):
+    """A digest of JSON-serializable `data`, stable across processes."""
+    return hashlib.md5(json.dumps(data, default=str).encode()).hexdigest()
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5("\n".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def not_modified(request, etag):
+    """A 304 response if `request` already holds the representation tagged `etag`, else None."""
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response["ETag"] = etag
+    return response
@@ -0,0 +1,91 @@
+"""
+Per-seller listing counters.
+
+User.number_of_active_listings and number_of_sold_listings are moved with
+F() increments and decrements whenever a listing is created in, leaves or
+enters a counted status, so the admin changelist and profile pages read them
+instead of counting. A save compares the listing's status with the status it
+was loaded with (see FurnitureListing.from_db). Paths that send no signals,
+such as bulk_create and queryset updates, are corrected by the
+reconcile_listing_counters management command.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import FurnitureListing
+from .signals import listing_status_changed
+
+COUNTERS = {
+    FurnitureListing.Status.PUBLISHED: "number_of_active_listings",
+    FurnitureListing.Status.SOLD: "number_of_sold_listings",
+}
+
+
+def move_counters(seller_id, previous_status, status):
+    """Move one listing of `seller_id` from the counter of `previous_status` to that of `status`."""
+    if previous_status == status:
+        return
+    changes = {}
+    if previous_status in COUNTERS:
+        # Never below zero, even if the counter drifted before a reconcile.
+        field = COUNTERS[previous_status]
+        changes[field] = Greatest(F(field) - 1, Value(0))
+    if status in COUNTERS:
+        field = COUNTERS[status]
+        changes[field] = F(field) + 1
+    if changes:
+        get_user_model().objects.filter(pk=seller_id).update(**changes)
+
+
+def counted_listings(status):
+    """Subquery counting the listings in `status` of the outer user."""
+    return Coalesce(
+        Subquery(
+            FurnitureListing.objects.filter(seller=OuterRef("pk"), status=status)
+            .order_by()
+            .values("seller")
+            .annotate(count=Count("pk"))
+            .values("count"),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def reconcile_counters():
+    """Recompute every user's counters from their listings. Returns the number of users corrected."""
+    counts = {field: counted_listings(status) for status, field in COUNTERS.items()}
+    drifted = Q()
+    for field in counts:
+        drifted |= ~Q(**{field: F(f"actual_{field}")})
+    users = (
+        get_user_model().objects
+        .annotate(**{f"actual_{field}": count for field, count in counts.items()})
+        .filter(drifted)
+    )
+    return users.update(**counts)
+
+
+@receiver(post_save, sender=FurnitureListing)
+def listing_saved(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None and "status" not in update_fields):
+        return
+    if created:
+        move_counters(instance.seller_id, None, instance.status)
+    elif hasattr(instance, "_loaded_status"):
+        move_counters(instance.seller_id, instance._loaded_status, instance.status)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=FurnitureListing)
+def listing_deleted(sender, instance, **kwargs):
+    move_counters(instance.seller_id, getattr(instance, "_loaded_status", instance.status), None)
+
+
+@receiver(listing_status_changed)
+def listing_status_updated(sender, listing, previous_status, **kwargs):
+    move_counters(listing.seller_id, previous_status, listing.status)
+    listing._loaded_status = listing.status
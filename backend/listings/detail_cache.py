@@ -0,0 +1,192 @@
+"""
+Cached detail payloads of published listings.
+
+Entries are stored per listing id, stamped with the listing's updated_at and a
+per-listing generation, and only served while both still match. A hit costs
+one primary-key lookup and one cache round trip instead of the listing,
+seller and image queries plus serialization. Saves and deletes of listings
+and their images bump the generation once they commit (see the receivers
+below).
+
+A hot entry is refreshed a little before it expires: one request rebuilds it
+under a short lock while the others keep serving the current payload. On a
+cold miss, requests that lose the lock wait briefly for the winner instead
+of all rebuilding at once.
+
+Every entry also carries the ETag of its payload, for conditional GETs (see
+conditional). get_detail_entry() returns the whole entry. aget_cached_detail()
+is the hit path for async views, which fall back to get_detail_entry() in a
+thread on a miss.
+
+The cache alias is set by LISTINGS_DETAIL_CACHE. Use a shared backend such as
+Redis in production, so invalidations from one process reach every other.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .conditional import digest, make_etag
+from .models import FurnitureListing, ListingImage
+from .signals import listing_images_changed, listing_status_changed
+
+# Payloads embed signed image URLs, so they must expire before those do.
+DEFAULT_TIMEOUT = 240
+# Start refreshing an entry once this fraction of its timeout has passed.
+REFRESH_AFTER = 0.8
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 1.0
+LOCK_POLL_INTERVAL = 0.05
+
+
+def get_detail_cache():
+    return caches[getattr(settings, "LISTINGS_DETAIL_CACHE", "default")]
+
+
+def get_timeout():
+    return getattr(settings, "LISTINGS_DETAIL_CACHE_TIMEOUT", DEFAULT_TIMEOUT)
+
+
+def detail_key(listing_id):
+    return f"listings:detail:{listing_id}"
+
+
+def generation_key(listing_id):
+    return f"listings:detail:{listing_id}:generation"
+
+
+def lock_key(listing_id):
+    return f"listings:detail:{listing_id}:lock"
+
+
+def invalidate_listing_detail(listing_id):
+    """Drop the cached payload of `listing_id` once the current transaction commits."""
+
+    def invalidate():
+        cache = get_detail_cache()
+        # A payload built concurrently from the old rows is stored under the
+        # old generation and never served.
+        try:
+            cache.incr(generation_key(listing_id))
+        except ValueError:
+            cache.set(generation_key(listing_id), 1, timeout=None)
+        cache.delete(detail_key(listing_id))
+
+    transaction.on_commit(invalidate)
+
+
+def published_listings():
+    return FurnitureListing.objects.filter(status=FurnitureListing.Status.PUBLISHED)
+
+
+def current_entry(found, listing_id, stamp):
+    """
+    Return (entry, generation) from the get_many() result `found`, with entry
+    None unless it is still current for a listing last updated at `stamp`.
+    """
+    generation = found.get(generation_key(listing_id), 0)
+    entry = found.get(detail_key(listing_id))
+    # Entries cached before they carried an ETag are rebuilt.
+    if entry and entry["updated_at"] == stamp and entry["generation"] == generation and "etag" in entry:
+        return entry, generation
+    return None, generation
+
+
+def new_entry(payload, stamp=None, generation=None, timeout=0):
+    return {
+        "updated_at": stamp,
+        "generation": generation,
+        "refresh_at": time.time() + timeout * REFRESH_AFTER,
+        "payload": payload,
+        "etag": make_etag(digest(payload)),
+    }
+
+
+async def aget_cached_detail(listing_id):
+    """
+    Return the cached entry of published listing `listing_id` if it is
+    current and not due for a refresh, else None. Raises
+    FurnitureListing.DoesNotExist if the listing is not published.
+    """
+    updated_at = await published_listings().filter(pk=listing_id).values_list("updated_at", flat=True).aget()
+    found = await get_detail_cache().aget_many([detail_key(listing_id), generation_key(listing_id)])
+    entry, _ = current_entry(found, listing_id, updated_at.isoformat())
+    if entry and time.time() < entry["refresh_at"]:
+        return entry
+    return None
+
+
+def get_listing_detail(listing_id, build):
+    """
+    Return the detail payload of published listing `listing_id`, calling
+    build() to serialize it when no current payload is cached. Raises
+    FurnitureListing.DoesNotExist if the listing is not published.
+    """
+    return get_detail_entry(listing_id, build)["payload"]
+
+
+def get_detail_entry(listing_id, build):
+    """get_listing_detail(), returning the entry with the payload and its ETag."""
+    cache = get_detail_cache()
+    updated_at = published_listings().filter(pk=listing_id).values_list("updated_at", flat=True).get()
+    stamp = updated_at.isoformat()
+
+    def lookup():
+        found = cache.get_many([detail_key(listing_id), generation_key(listing_id)])
+        return current_entry(found, listing_id, stamp)
+
+    entry, generation = lookup()
+    if entry and time.time() < entry["refresh_at"]:
+        return entry
+
+    if cache.add(lock_key(listing_id), 1, timeout=LOCK_TIMEOUT):
+        try:
+            timeout = get_timeout()
+            entry = new_entry(build(), stamp, generation, timeout)
+            cache.set(detail_key(listing_id), entry, timeout)
+            return entry
+        finally:
+            cache.delete(lock_key(listing_id))
+
+    if entry:
+        # Another request is refreshing it; this one is still current.
+        return entry
+
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry, _ = lookup()
+        if entry:
+            return entry
+    # The rebuild is taking too long; serve this request without caching.
+    return new_entry(build())
+
+
+@receiver(post_save, sender=FurnitureListing)
+@receiver(post_delete, sender=FurnitureListing)
+def listing_changed(sender, instance, created=False, **kwargs):
+    # Nothing can be cached yet for a listing that was just created.
+    if not created:
+        invalidate_listing_detail(instance.pk)
+
+
+@receiver(listing_status_changed)
+def listing_status_updated(sender, listing, **kwargs):
+    invalidate_listing_detail(listing.pk)
+
+
+# Image deletes send listing_images_changed instead of relying on post_delete:
+# a post_delete receiver would make Django fetch and signal every row of a
+# queryset delete.
+@receiver(post_save, sender=ListingImage)
+def listing_image_saved(sender, instance, **kwargs):
+    invalidate_listing_detail(instance.listing_id)
+
+
+@receiver(listing_images_changed)
+def listing_images_updated(sender, listing_ids, **kwargs):
+    for listing_id in listing_ids:
+        invalidate_listing_detail(listing_id)
@@ -0,0 +1,142 @@
+import hashlib
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import FurnitureListing
+from .signals import listing_status_changed
+
+# (key, lower bound inclusive, upper bound exclusive); None means unbounded.
+PRICE_BUCKETS = [
+    ("0-50", None, 50),
+    ("50-100", 50, 100),
+    ("100-250", 100, 250),
+    ("250-500", 250, 500),
+    ("500-1000", 500, 1000),
+    ("1000+", 1000, None),
+]
+
+FACETS_CACHE_TIMEOUT = 300
+FACETS_VERSION_KEY = "listings:facets:version"
+
+
+def parse_price(value, name):
+    if value in (None, ""):
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: "A valid number is required."})
+
+
+def get_filter_params(query_params):
+    """Normalize the facet filters of a request into a plain, hashable dict."""
+    params = {
+        "q": query_params.get("q", "").strip(),
+        "category": sorted(query_params.getlist("category")),
+        "condition": sorted(query_params.getlist("condition")),
+        "min_price": parse_price(query_params.get("min_price"), "min_price"),
+        "max_price": parse_price(query_params.get("max_price"), "max_price"),
+    }
+    return {key: value for key, value in params.items() if value not in (None, "", [])}
+
+
+def filter_listings(queryset, params):
+    if "category" in params:
+        queryset = queryset.filter(category__in=params["category"])
+    if "condition" in params:
+        queryset = queryset.filter(condition__in=params["condition"])
+    if "min_price" in params:
+        queryset = queryset.filter(price__gte=params["min_price"])
+    if "max_price" in params:
+        queryset = queryset.filter(price__lte=params["max_price"])
+    return queryset
+
+
+def price_bucket_filter(lower, upper):
+    condition = Q(price__isnull=False)
+    if lower is not None:
+        condition &= Q(price__gte=lower)
+    if upper is not None:
+        condition &= Q(price__lt=upper)
+    return condition
+
+
+def compute_facets(queryset):
+    """
+    Count every category, condition and price bucket of `queryset` in one
+    aggregate query, using a filtered COUNT per bucket.
+    """
+    aggregates = {"total": Count("pk")}
+    for value, _ in FurnitureListing.Category.choices:
+        aggregates[f"category:{value}"] = Count("pk", filter=Q(category=value))
+    for value, _ in FurnitureListing.Condition.choices:
+        aggregates[f"condition:{value}"] = Count("pk", filter=Q(condition=value))
+    for key, lower, upper in PRICE_BUCKETS:
+        aggregates[f"price:{key}"] = Count("pk", filter=price_bucket_filter(lower, upper))
+
+    counts = queryset.aggregate(**aggregates)
+    return {
+        "total": counts["total"],
+        "category": [
+            {"value": value, "label": label, "count": counts[f"category:{value}"]}
+            for value, label in FurnitureListing.Category.choices
+        ],
+        "condition": [
+            {"value": value, "label": label, "count": counts[f"condition:{value}"]}
+            for value, label in FurnitureListing.Condition.choices
+        ],
+        "price": [
+            {"value": key, "min": lower, "max": upper, "count": counts[f"price:{key}"]}
+            for key, lower, upper in PRICE_BUCKETS
+        ],
+    }
+
+
+def get_facets_version():
+    return cache.get_or_set(FACETS_VERSION_KEY, 1, timeout=None)
+
+
+def invalidate_facets():
+    # Bumping the version orphans every cached facet set at once; the stale
+    # entries simply expire.
+    try:
+        cache.incr(FACETS_VERSION_KEY)
+    except ValueError:
+        cache.set(FACETS_VERSION_KEY, 1, timeout=None)
+
+
+def get_facets(queryset, params):
+    """
+    Return facet counts for the published listings matching `params`, from the
+    cache when nothing has been saved or deleted since they were computed.
+    """
+    digest = hashlib.md5(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+    key = f"listings:facets:{get_facets_version()}:{digest}"
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(filter_listings(queryset, params))
+        cache.set(key, facets, FACETS_CACHE_TIMEOUT)
+    return facets
+
+
+class ListingFacetFilter(BaseFilterBackend):
+    """Apply the ?category=, ?condition=, ?min_price= and ?max_price= filters."""
+
+    def filter_queryset(self, request, queryset, view):
+        return filter_listings(queryset, get_filter_params(request.query_params))
+
+
+@receiver(post_save, sender=FurnitureListing)
+@receiver(post_delete, sender=FurnitureListing)
+@receiver(listing_status_changed)
+def listing_changed(sender, **kwargs):
+    # After the commit, so no facet set is rebuilt from rows about to change
+    transaction.on_commit(invalidate_facets)
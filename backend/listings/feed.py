@@ -0,0 +1,177 @@
+"""
+Cached homepage feed.
+
+The published feed is cached as windows: serialized keyset pages of the
+anonymous feed, keyed by the position they start after, their size and a feed
+version that is bumped whenever a change to a listing or listing image
+commits. Every user reads the same windows. Signed-in users skip their own listings in
+Python and backfill the page from the following windows, and their cursor
+remembers where the window they stopped in starts, so the next page is read
+from the cache too.
+
+read_feed() and its async twin aread_feed() share the paging logic of
+scan_feed() and differ only in how they fetch windows. Each window keeps a
+digest of its rows, and a page reports the combined digest of the windows
+it read, which its ETag is made from (see conditional).
+
+The cache alias and the windows' timeout are set by LISTINGS_FEED_CACHE and
+LISTINGS_FEED_CACHE_TIMEOUT. As for the detail cache, use a shared backend in
+production, so a version bump from one process reaches every other.
+"""
+import hashlib
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .conditional import digest
+from .models import FurnitureListing, ListingImage
+from .serializers import ListingListSerializer
+from .signals import listing_images_changed, listing_status_changed
+
+FEED_VERSION_KEY = "listings:feed:version"
+# Windows embed signed thumbnail URLs, so they must expire before those do.
+DEFAULT_TIMEOUT = 240
+
+
+def get_feed_cache():
+    return caches[getattr(settings, "LISTINGS_FEED_CACHE", "default")]
+
+
+def get_timeout():
+    return getattr(settings, "LISTINGS_FEED_CACHE_TIMEOUT", DEFAULT_TIMEOUT)
+
+
+def get_feed_version():
+    return get_feed_cache().get_or_set(FEED_VERSION_KEY, 1, timeout=None)
+
+
+async def aget_feed_version():
+    return await get_feed_cache().aget_or_set(FEED_VERSION_KEY, 1, timeout=None)
+
+
+def invalidate_feed():
+    cache = get_feed_cache()
+    try:
+        cache.incr(FEED_VERSION_KEY)
+    except ValueError:
+        cache.set(FEED_VERSION_KEY, 1, timeout=None)
+
+
+def build_window(paginator, start, size):
+    queryset = FurnitureListing.objects.filter(status="published").with_thumbnail()
+    if start is not None:
+        queryset = queryset.filter(paginator.get_position_filter(start))
+    listings = list(queryset.order_by(*paginator.ordering).feed_values("seller_id")[: size + 1])
+    data = ListingListSerializer(listings[:size], many=True).data
+    rows = [
+        (tuple(paginator.get_position(listing)), listing["seller_id"], row)
+        for listing, row in zip(listings, data)
+    ]
+    more = len(listings) > size
+    return {"rows": rows, "more": more, "digest": digest([rows, more])}
+
+
+def window_key(start, size, version):
+    digest = hashlib.md5(json.dumps(start, default=str).encode()).hexdigest()
+    return f"listings:feed:{version}:{size}:{digest}"
+
+
+def get_window(paginator, start, size, version):
+    """The cached window of `size` published listings after position `start`."""
+    cache = get_feed_cache()
+    key = window_key(start, size, version)
+    window = cache.get(key)
+    if window is None:
+        window = build_window(paginator, start, size)
+        cache.set(key, window, get_timeout())
+    return window
+
+
+async def aget_window(paginator, start, size, version):
+    cache = get_feed_cache()
+    key = window_key(start, size, version)
+    window = await cache.aget(key)
+    if window is None:
+        # Serializing a window is ORM and DRF work, which stays synchronous.
+        window = await sync_to_async(build_window)(paginator, start, size)
+        await cache.aset(key, window, get_timeout())
+    return window
+
+
+def read_feed(paginator, size, after=None, window_start=None, exclude_seller=None):
+    """
+    Return (rows, next, digest) for the page of `size` rows following
+    position `after`, reading windows from `window_start` on. `next` is the
+    (after, window start) pair for the following page, or None at the end;
+    `digest` identifies the windows read.
+    """
+    version = get_feed_version()
+    scan = scan_feed(size, after, window_start, exclude_seller)
+    digests = []
+    try:
+        start = next(scan)
+        while True:
+            window = get_window(paginator, start, size, version)
+            digests.append(window.get("digest"))
+            start = scan.send(window)
+    except StopIteration as done:
+        return (*done.value, ",".join(map(str, digests)))
+
+
+async def aread_feed(paginator, size, after=None, window_start=None, exclude_seller=None):
+    """read_feed() for async views."""
+    version = await aget_feed_version()
+    scan = scan_feed(size, after, window_start, exclude_seller)
+    digests = []
+    try:
+        start = next(scan)
+        while True:
+            window = await aget_window(paginator, start, size, version)
+            digests.append(window.get("digest"))
+            start = scan.send(window)
+    except StopIteration as done:
+        return (*done.value, ",".join(map(str, digests)))
+
+
+def scan_feed(size, after, window_start, exclude_seller):
+    """
+    Generator behind read_feed(): yields the start of each window it needs,
+    is sent that window, and returns (rows, next).
+
+    A page that fills up exactly at the end of a window reports a next page
+    without reading the following window, so a signed-in user whose own
+    listings are all that remain can get one empty last page.
+    """
+    rows = []
+    start = window_start
+    while True:
+        window = yield start
+        for position, seller_id, row in window["rows"]:
+            # Every feed column is descending, so later rows compare lower.
+            if after is not None and not position < after:
+                continue
+            if seller_id == exclude_seller:
+                continue
+            if len(rows) == size:
+                return [row for _, row in rows], (rows[-1][0], start)
+            rows.append((position, row))
+        if not window["more"]:
+            return [row for _, row in rows], None
+        start = window["rows"][-1][0]
+        if len(rows) == size:
+            return [row for _, row in rows], (rows[-1][0], start)
+
+
+@receiver(post_save, sender=FurnitureListing)
+@receiver(post_delete, sender=FurnitureListing)
+@receiver(post_save, sender=ListingImage)
+@receiver(listing_images_changed)
+@receiver(listing_status_changed)
+def feed_changed(sender, **kwargs):
+    # After the commit, so no window is rebuilt from rows about to change
+    transaction.on_commit(invalidate_feed)
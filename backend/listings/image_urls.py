@@ -0,0 +1,94 @@
+"""
+Memoized URLs for listing image files.
+
+Building a URL for S3 or CloudFront can mean signing it, so URLs are memoized
+per storage name. Entries expire after LISTINGS_IMAGE_URL_TTL seconds, which
+defaults to half of AWS_QUERYSTRING_EXPIRE so a served URL always has at least
+that long left before its signature expires. List serializers warm the cache
+for a whole page at once (see ImageURLListSerializer).
+"""
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .storage import image_storage
+
+
+class ImageURLCache:
+    def __init__(self, ttl, max_entries=10_000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = {}  # (storage, name): (url, expires at)
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, storage, names):
+        """Return {name: url} for `names`, building only the missing or expired URLs."""
+        now = time.monotonic()
+        urls = {}
+        missing = []
+        with self.lock:
+            for name in dict.fromkeys(names):
+                entry = self.entries.get((storage, name))
+                if entry and entry[1] > now:
+                    urls[name] = entry[0]
+                else:
+                    missing.append(name)
+            self.hits += len(urls)
+            self.misses += len(missing)
+
+        built = {name: storage.url(name) for name in missing}
+        if built:
+            with self.lock:
+                expires = now + self.ttl
+                for name, url in built.items():
+                    self.entries[(storage, name)] = (url, expires)
+                self.evict(now)
+        return {**urls, **built}
+
+    def get(self, storage, name):
+        return self.get_many(storage, [name])[name]
+
+    def evict(self, now):
+        if len(self.entries) <= self.max_entries:
+            return
+        self.entries = {key: entry for key, entry in self.entries.items() if entry[1] > now}
+        # Still full of live entries: drop the oldest, which were inserted first
+        for key in list(self.entries)[:len(self.entries) - self.max_entries]:
+            del self.entries[key]
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+
+@lru_cache(maxsize=None)
+def get_image_url_cache():
+    default_ttl = getattr(settings, "AWS_QUERYSTRING_EXPIRE", 3600) // 2
+    return ImageURLCache(getattr(settings, "LISTINGS_IMAGE_URL_TTL", default_ttl))
+
+
+@receiver(setting_changed)
+def reset_image_url_cache(setting, **kwargs):
+    if setting in ("LISTINGS_IMAGE_URL_TTL", "AWS_QUERYSTRING_EXPIRE"):
+        get_image_url_cache.cache_clear()
+
+
+def image_url(name):
+    """URL of a listing image file."""
+    return get_image_url_cache().get(image_storage(), name)
+
+
+def image_urls(names):
+    """{name: url} for many listing image files at once."""
+    return get_image_url_cache().get_many(image_storage(), names)
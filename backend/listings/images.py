@@ -0,0 +1,131 @@
+import io
+import math
+from collections import namedtuple
+
+from django.core.files import File
+from PIL import Image
+
+# Widths of the square renditions generated next to the main image.
+RENDITION_SIZES = (160, 320, 640, 1080)
+
+ENCODERS = {
+    # format: (Pillow format, file extension, save options)
+    "jpeg": ("JPEG", "jpg", {"quality": 85, "optimize": True}),
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 4}),
+    "avif": ("AVIF", "avif", {"quality": 60}),
+}
+
+# Refuse sources above 64 megapixels (a 48MP phone photo is 8000x6000),
+# checked from the header before any pixel data is decoded.
+MAX_SOURCE_PIXELS = 64_000_000
+
+ProcessedImage = namedtuple("ProcessedImage", ["image", "renditions"])
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def rendition_formats():
+    """Formats to render, best compression first. AVIF needs Pillow support."""
+    Image.init()
+    return [name for name, (pil_format, _, _) in ENCODERS.items() if pil_format in Image.SAVE][::-1]
+
+
+def center_crop_box(width, height):
+    """Return the (left, top, right, bottom) box of the largest centered square."""
+    if width > height:
+        left = (width - height) // 2
+        return (left, 0, left + height, height)
+    top = (height - width) // 2
+    return (0, top, width, top + width)
+
+
+def encode(image, format_name, **options):
+    pil_format, _, defaults = ENCODERS[format_name]
+    output = io.BytesIO()
+    image.save(output, format=pil_format, **{**defaults, **options})
+    output.seek(0)
+    return output
+
+
+def process_image(file, size=1080, quality=85, rendition_sizes=()):
+    """
+    Center-crop `file` to a square and encode it as a `size` x `size` optimized
+    JPEG, plus every (format, width) rendition in `rendition_sizes`, from a
+    single decode. Each smaller rendition is downscaled from the previous one
+    rather than from the full image. Returns BytesIO objects positioned at the
+    start.
+
+    Raises ImageTooLarge for sources above MAX_SOURCE_PIXELS.
+    """
+    image = Image.open(file)
+
+    source_width, source_height = image.size
+    if source_width * source_height > MAX_SOURCE_PIXELS:
+        raise ImageTooLarge(f"{source_width}x{source_height} exceeds {MAX_SOURCE_PIXELS} pixels")
+
+    # JPEGs can be decoded at 1/2, 1/4 or 1/8 scale for a fraction of the
+    # memory; ask for the smallest scale whose shorter side still covers `size`.
+    scale = size / min(source_width, source_height)
+    image.draft("RGB", (math.ceil(source_width * scale), math.ceil(source_height * scale)))
+
+    # Crop to square before converting, so only the kept pixels are copied
+    image = image.crop(center_crop_box(*image.size))
+
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    # Resize to size x size
+    image = image.resize((size, size), Image.LANCZOS, reducing_gap=3.0)
+    main = encode(image, "jpeg", quality=quality)
+
+    renditions = {}
+    source = image
+    for width in sorted(rendition_sizes, reverse=True):
+        if width != source.width:
+            source = source.resize((width, width), Image.LANCZOS)
+        for format_name in rendition_formats():
+            if format_name == "jpeg" and width == size:
+                continue  # Identical to the main image
+            renditions[(format_name, width)] = encode(source, format_name)
+
+    return ProcessedImage(main, renditions)
+
+
+def save_renditions(storage, image_name, renditions, size=1080):
+    """
+    Store `renditions` next to the already stored main image and return the
+    {format: {width: name}} mapping recorded on ListingImage.renditions.
+    """
+    stem = image_name.rsplit(".", 1)[0]
+    saved = {"jpeg": {str(size): image_name}}
+    for (format_name, width), data in renditions.items():
+        extension = ENCODERS[format_name][1]
+        name = storage.save(f"{stem}_{width}.{extension}", File(data))
+        saved.setdefault(format_name, {})[str(width)] = name
+    return saved
+
+
+def rendition_names(renditions, exclude=None):
+    """Every stored name in a renditions mapping, except `exclude`."""
+    return [
+        name
+        for widths in renditions.values()
+        for name in widths.values()
+        if name != exclude
+    ]
+
+
+def build_srcset(renditions, url):
+    """
+    Return {format: "url 160w, url 320w, ..."} for a renditions mapping,
+    where `url` maps a stored name to its URL.
+    """
+    return {
+        format_name: ", ".join(
+            f"{url(name)} {width}w"
+            for width, name in sorted(widths.items(), key=lambda item: int(item[0]))
+        )
+        for format_name, widths in renditions.items()
+    }
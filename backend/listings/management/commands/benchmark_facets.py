@@ -0,0 +1,62 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+
+from listings.benchmarks import bulk_insert, create_sellers, measure, scratch_database, synthetic_listings
+from listings.facets import PRICE_BUCKETS, compute_facets, get_facets, price_bucket_filter
+from listings.models import FurnitureListing
+
+
+def naive_facets(queryset):
+    """One COUNT per facet value: the approach compute_facets replaces."""
+    counts = {}
+    for value in FurnitureListing.Category.values:
+        counts[f"category:{value}"] = queryset.filter(category=value).count()
+    for value in FurnitureListing.Condition.values:
+        counts[f"condition:{value}"] = queryset.filter(condition=value).count()
+    for key, lower, upper in PRICE_BUCKETS:
+        counts[f"price:{key}"] = queryset.filter(price_bucket_filter(lower, upper)).count()
+    return counts
+
+
+class Command(BaseCommand):
+    help = "Compare facet count strategies on a synthetic catalogue in a scratch database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=1_000_000)
+        parser.add_argument("--sellers", type=int, default=10_000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            start = time.perf_counter()
+            sellers = create_sellers(options["sellers"])
+            bulk_insert(synthetic_listings(sellers, options["listings"]))
+            self.stdout.write(
+                f"Seeded {options['listings']} listings in {time.perf_counter() - start:.1f}s"
+            )
+
+            published = FurnitureListing.objects.filter(status=FurnitureListing.Status.PUBLISHED)
+            filtered = published.filter(Q(category="TABLE") | Q(category="DESK"), price__lt=500)
+            params = {"category": ["DESK", "TABLE"], "max_price": 500}
+
+            for name, queryset in (("all published", published), ("filtered", filtered)):
+                self.report(f"{name}: one COUNT per value", lambda: naive_facets(queryset), options)
+                self.report(f"{name}: single aggregation", lambda: compute_facets(queryset), options)
+
+            cache.clear()
+            get_facets(published, params)
+            self.report("cached", lambda: get_facets(published, params), options)
+
+    def report(self, name, func, options):
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        timings = measure(func, options["repeat"])
+        self.stdout.write(
+            f"{name:<40} queries={len(queries):<3} "
+            f"p50={timings['p50']:.1f}ms p95={timings['p95']:.1f}ms"
+        )
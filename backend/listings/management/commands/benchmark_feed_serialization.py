@@ -0,0 +1,84 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from listings.benchmarks import bulk_insert, create_sellers, measure, scratch_database, synthetic_listings
+from listings.images import ENCODERS, RENDITION_SIZES
+from listings.models import FurnitureListing, ListingImage
+from listings.serializers import ImageURLListSerializer, ListingListSerializer
+
+
+def synthetic_images(listings):
+    # A thumbnail with renditions per listing, so srcsets are part of the work
+    for listing_id in listings.values_list("id", flat=True):
+        yield ListingImage(
+            listing_id=listing_id,
+            image=f"listings/{listing_id}/1.jpg",
+            image_name=f"{listing_id}-1.jpg",
+            renditions={
+                format_name: {
+                    str(width): f"listings/{listing_id}/1-{width}.{ENCODERS[format_name][1]}"
+                    for width in RENDITION_SIZES
+                }
+                for format_name in ("webp", "jpeg")
+            },
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare serializing feed pages field by field (ListingListSerializer's fields) "
+        "with FeedListSerializer, in a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=1000)
+        parser.add_argument("--page-size", type=int, default=100)
+        parser.add_argument("--repeat", type=int, default=200)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            start = time.perf_counter()
+            sellers = create_sellers(10)
+            bulk_insert(synthetic_listings(sellers, options["listings"]))
+            bulk_insert(synthetic_images(FurnitureListing.objects.all()))
+            self.stdout.write(f"Seeded {options['listings']} listings in {time.perf_counter() - start:.1f}s")
+
+            queryset = (
+                FurnitureListing.objects.filter(status=FurnitureListing.Status.PUBLISHED)
+                .with_thumbnail()
+                .with_is_saved(sellers[0])
+                .order_by("-created_at", "-id")
+            )[: options["page_size"]]
+            listings = list(queryset)
+            rows = list(queryset.feed_values("is_saved"))
+
+            def field_by_field(page):
+                return ImageURLListSerializer(page, child=ListingListSerializer()).data
+
+            def feed(page):
+                return ListingListSerializer(page, many=True).data
+
+            rendered = JSONRenderer().render(field_by_field(listings))
+            identical = rendered == JSONRenderer().render(feed(rows)) == JSONRenderer().render(feed(listings))
+            self.stdout.write(f"{len(listings)} rows per page, byte-identical JSON: {identical}")
+
+            baseline = self.report("field by field, instances", lambda: field_by_field(listings), options)
+            self.report("FeedListSerializer, instances", lambda: feed(listings), options, baseline)
+            self.report("FeedListSerializer, .values() rows", lambda: feed(rows), options, baseline)
+            # The same, including the query that fetches the page
+            baseline = self.report("query + field by field", lambda: field_by_field(list(queryset)), options)
+            self.report(
+                "query + FeedListSerializer (.values())",
+                lambda: feed(list(queryset.feed_values("is_saved"))), options, baseline,
+            )
+
+    def report(self, name, func, options, baseline=None):
+        func()  # Warm up
+        timings = measure(func, options["repeat"])
+        speedup = f" ({baseline['p50'] / timings['p50']:.1f}x faster)" if baseline else ""
+        self.stdout.write(
+            f"{name:<40} p50={timings['p50']:.2f}ms p95={timings['p95']:.2f}ms{speedup}"
+        )
+        return timings
@@ -0,0 +1,85 @@
+import io
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from listings.images import RENDITION_SIZES, center_crop_box, process_image
+
+
+def legacy_process_image(file, size=1080, quality=85, rendition_sizes=()):
+    """The compression path before draft decoding: full decode, convert, then crop."""
+    image = Image.open(file)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image = image.crop(center_crop_box(*image.size))
+    image = image.resize((size, size), Image.LANCZOS)
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality, optimize=True)
+    return output
+
+
+PIPELINES = {
+    "before": legacy_process_image,
+    "after": process_image,
+}
+
+
+def write_source_image(path, size):
+    # Noise keeps the JPEG realistically large instead of a flat color.
+    noise = Image.effect_noise(size, 64)
+    Image.merge("RGB", (noise, noise.transpose(Image.FLIP_LEFT_RIGHT), noise)).save(path, quality=90)
+
+
+def measure_in_child(pipeline, path, rendition_sizes, results):
+    # Runs in a fresh process so ru_maxrss only reflects this one image.
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    with open(path, "rb") as file:
+        PIPELINES[pipeline](file, rendition_sizes=rendition_sizes)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in KiB on Linux
+    results.put((baseline / 1024, peak / 1024, elapsed))
+
+
+class Command(BaseCommand):
+    help = "Measure peak RSS of compressing one large JPEG, before and after draft decoding."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--width", type=int, default=8000)
+        parser.add_argument("--height", type=int, default=6000)
+        parser.add_argument("--renditions", action="store_true", help="Also render every rendition.")
+
+    def handle(self, *args, **options):
+        size = (options["width"], options["height"])
+        rendition_sizes = RENDITION_SIZES if options["renditions"] else ()
+
+        with tempfile.TemporaryDirectory() as directory:
+            # Every step runs in its own process forked from a small fork server,
+            # so no child inherits another step's memory high-water mark.
+            context = multiprocessing.get_context("forkserver")
+            path = os.path.join(directory, "photo.jpg")
+            writer = context.Process(target=write_source_image, args=(path, size))
+            writer.start()
+            writer.join()
+            megapixels = size[0] * size[1] / 1_000_000
+            self.stdout.write(f"Source: {size[0]}x{size[1]} ({megapixels:.0f}MP), "
+                              f"{os.path.getsize(path) / 1_048_576:.1f}MB JPEG")
+
+            for pipeline in PIPELINES:
+                results = context.Queue()
+                child = context.Process(
+                    target=measure_in_child, args=(pipeline, path, rendition_sizes, results)
+                )
+                child.start()
+                baseline, peak, elapsed = results.get()
+                child.join()
+                self.stdout.write(
+                    f"{pipeline:<7} peak RSS {peak:7.1f}MB  "
+                    f"(+{peak - baseline:6.1f}MB for the image)  {elapsed * 1000:7.0f}ms"
+                )
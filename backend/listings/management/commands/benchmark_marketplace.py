@@ -0,0 +1,79 @@
+import json
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import django
+from django.core.management.base import BaseCommand
+
+from listings.benchmarks import (
+    local_image_storage, run_marketplace_benchmarks, sample_jpeg, scratch_database, seed_marketplace,
+)
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a scratch database with a synthetic marketplace and time the homepage feed, "
+        "listing detail, create-with-images, update-with-reorder and purchase paths. "
+        "Writes latency percentiles and query counts as JSON, to compare commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--listings", type=int, default=5000)
+        parser.add_argument("--images", type=int, default=3, help="Most images per listing.")
+        parser.add_argument("--repeat", type=int, default=50, help="Requests per benchmark.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the results to this JSON file instead of stdout.")
+        parser.add_argument("--baseline", help="A previous --output file to compare against.")
+
+    def handle(self, *args, **options):
+        image_bytes = sample_jpeg()
+        with scratch_database(), local_image_storage():
+            start = time.perf_counter()
+            # Only the image rows: the feed and detail never open the files,
+            # and writing them would keep gigabytes in the in-memory storage.
+            counts = seed_marketplace(options["users"], options["listings"], options["images"], seed=options["seed"])
+            self.stderr.write(f"Seeded {counts} in {time.perf_counter() - start:.1f}s")
+            results = run_marketplace_benchmarks(options["repeat"], image_bytes, seed=options["seed"])
+
+        report = {
+            "commit": current_commit(),
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "options": {key: options[key] for key in ("users", "listings", "images", "repeat", "seed")},
+            "seeded": counts,
+            "benchmarks": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(report, file, indent=2)
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+        if options["baseline"]:
+            with open(options["baseline"]) as file:
+                self.compare(json.load(file), report)
+
+    def compare(self, baseline, report):
+        self.stderr.write(f"Compared with {baseline.get('commit')}:")
+        for name, result in report["benchmarks"].items():
+            before = baseline["benchmarks"].get(name)
+            if before is None:
+                continue
+            change = (result["p50"] - before["p50"]) / before["p50"] * 100 if before["p50"] else 0
+            self.stderr.write(
+                f"  {name:<30} p50 {before['p50']:.1f} -> {result['p50']:.1f}ms ({change:+.0f}%)  "
+                f"queries {before['queries_max']} -> {result['queries_max']}"
+            )
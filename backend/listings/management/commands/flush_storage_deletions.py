@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from listings.models import StorageDeletion
+from listings.storage import flush_deletions
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete storage files left in the StorageDeletion outbox, e.g. after a "
+        "crash between a commit and its deletes, or a failed S3 request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than", type=int, default=5,
+            help="Only pick up deletions recorded at least this many minutes ago.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=options["older_than"])
+        deleted, failed = flush_deletions(
+            queryset=StorageDeletion.objects.filter(created_at__lte=cutoff)
+        )
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} files, {failed} failed."))
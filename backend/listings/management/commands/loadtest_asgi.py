@@ -0,0 +1,149 @@
+import asyncio
+import socket
+import subprocess
+import sys
+import time
+from contextlib import ExitStack, contextmanager
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.benchmarks import percentiles
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f"No server came up on port {port}")
+
+
+@contextmanager
+def server(command, port):
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def fetch(url, client_delay, headers):
+    """
+    GET `url` and return the status code. The request line goes out at once
+    and the rest of the headers `client_delay` seconds later, like a slow
+    client's.
+    """
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    try:
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n".encode())
+        await writer.drain()
+        await asyncio.sleep(client_delay)
+        extra = "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(f"{extra}Connection: close\r\n\r\n".encode())
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    return int(response.split(b" ", 2)[1]) if response else 0
+
+
+async def load(url, requests, concurrency, slow_every, client_delay, headers):
+    """
+    Send `requests` GETs to `url`, `concurrency` at a time, every
+    `slow_every`-th one from a slow client. Returns ({"fast"/"slow":
+    [(status, latency ms)]}, seconds).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {"fast": [], "slow": []}
+
+    async def one(index):
+        slow = slow_every and index % slow_every == 0
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                status = await fetch(url, client_delay if slow else 0, headers)
+            except OSError:
+                status = 0
+            results["slow" if slow else "fast"].append((status, (time.perf_counter() - start) * 1000))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    return results, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync endpoints under a WSGI server with their async twins "
+        "under an ASGI server, for a mix of fast clients and slow ones that hold "
+        "their connection open while they trickle in their request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--wsgi", help="Base URL of a running WSGI server, e.g. gunicorn core.wsgi")
+        parser.add_argument("--asgi", help="Base URL of a running ASGI server, e.g. uvicorn core.asgi:application")
+        parser.add_argument(
+            "--spawn", action="store_true",
+            help="Start gunicorn and uvicorn on free ports against the configured database.",
+        )
+        parser.add_argument("--workers", type=int, default=2, help="Worker processes per spawned server.")
+        parser.add_argument("--wsgi-path", default="/api/homepage/")
+        parser.add_argument("--asgi-path", default="/api/async/homepage/")
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=100)
+        parser.add_argument(
+            "--slow-every", type=int, default=4,
+            help="Make every Nth client a slow one; 0 for none.",
+        )
+        parser.add_argument(
+            "--client-delay", type=float, default=1.0,
+            help="Seconds a slow client takes to finish sending its request headers.",
+        )
+        parser.add_argument("--token", help="Access token to send as a Bearer Authorization header.")
+
+    def handle(self, *args, **options):
+        headers = {"Authorization": f"Bearer {options['token']}"} if options["token"] else {}
+        with ExitStack() as stack:
+            wsgi, asgi = options["wsgi"], options["asgi"]
+            if options["spawn"]:
+                wsgi_port, asgi_port = free_port(), free_port()
+                wsgi = stack.enter_context(server([
+                    sys.executable, "-m", "gunicorn", "core.wsgi:application",
+                    "--workers", str(options["workers"]), "--bind", f"127.0.0.1:{wsgi_port}",
+                ], wsgi_port))
+                asgi = stack.enter_context(server([
+                    sys.executable, "-m", "uvicorn", "core.asgi:application",
+                    "--workers", str(options["workers"]), "--port", str(asgi_port), "--no-access-log",
+                ], asgi_port))
+            if not wsgi or not asgi:
+                raise CommandError("Pass --wsgi and --asgi server URLs, or --spawn.")
+
+            for name, url in (("wsgi", wsgi + options["wsgi_path"]), ("asgi", asgi + options["asgi_path"])):
+                results, seconds = asyncio.run(load(
+                    url, options["requests"], options["concurrency"], options["slow_every"],
+                    options["client_delay"], headers,
+                ))
+                total = sum(len(samples) for samples in results.values())
+                self.stdout.write(f"{name} {url}: {total / seconds:.1f} req/s")
+                for kind, samples in results.items():
+                    if not samples:
+                        continue
+                    ok = sum(1 for status, _ in samples if status == 200)
+                    timings = percentiles([latency for _, latency in samples])
+                    self.stdout.write(
+                        f"  {kind:<5} clients ok={ok:<5} failed={len(samples) - ok:<5} "
+                        f"p50={timings['p50']:.1f}ms p95={timings['p95']:.1f}ms"
+                    )
@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from listings.models import ListingImage
+from listings.tasks import LocalImagePipeline, get_image_pipeline
+
+
+class Command(BaseCommand):
+    help = (
+        "Compress listing images left in 'processing', e.g. after a worker crash "
+        "or a restart lost queued jobs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than", type=int, default=10,
+            help="Only pick up images uploaded at least this many minutes ago.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=options["older_than"])
+        stuck = list(
+            ListingImage.objects.filter(
+                status=ListingImage.Status.PROCESSING, uploaded_at__lte=cutoff
+            ).values_list("pk", flat=True)
+        )
+        # Each run grants a fresh set of attempts.
+        ListingImage.objects.filter(pk__in=stuck).update(attempts=0)
+
+        configured = get_image_pipeline()
+        pipeline = LocalImagePipeline(
+            eager=False, max_attempts=configured.max_attempts if configured else 3
+        )
+        pipeline.queue.extend(stuck)
+        pipeline.run_pending()
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {len(stuck)} pending images."))
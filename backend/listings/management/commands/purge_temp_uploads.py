@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from listings.models import ListingImage
+from listings.storage import batches, delete_objects, image_storage
+from listings.uploads import list_uploads
+
+
+class Command(BaseCommand):
+    help = "Delete direct uploads under the temp prefix that were never attached to a listing."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than", type=int, default=48,
+            help="Only delete uploads at least this many hours old.",
+        )
+
+    def handle(self, *args, **options):
+        storage = image_storage()
+        cutoff = timezone.now() - timedelta(hours=options["older_than"])
+        stale = [key for key, modified in list_uploads(storage) if modified <= cutoff]
+        # Attached uploads stay until the pipeline replaces them.
+        attached = {
+            name
+            for batch in batches(stale)
+            for name in ListingImage.objects.filter(image__in=batch).values_list("image", flat=True)
+        }
+        abandoned = [key for key in stale if key not in attached]
+
+        failed = delete_objects(storage, abandoned)
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {len(abandoned) - len(failed)} abandoned uploads, {len(failed)} failed."
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from listings.models import FurnitureListing, ListingSearchTerm
+from listings.search import DatabaseSearchBackend, get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the listing search index from scratch."
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        listings = FurnitureListing.objects.filter(status=FurnitureListing.Status.PUBLISHED)
+
+        with transaction.atomic():
+            if isinstance(backend, DatabaseSearchBackend):
+                ListingSearchTerm.objects.all().delete()
+            backend.rebuild(listings)
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {listings.count()} published listings."))
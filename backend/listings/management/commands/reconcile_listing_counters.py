@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from listings.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every user's active and sold listing counters from their "
+        "listings, fixing drift from bulk writes that bypass the counter signals."
+    )
+
+    def handle(self, *args, **options):
+        corrected = reconcile_counters()
+        self.stdout.write(self.style.SUCCESS(f"Corrected the listing counters of {corrected} users."))
@@ -0,0 +1,49 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from listings.benchmarks import local_image_storage, sample_jpeg, seed_marketplace
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the configured database with a synthetic marketplace: users, listings with "
+        "realistic status/category/condition mixes, their images and purchases."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--listings", type=int, default=10_000)
+        parser.add_argument("--images", type=int, default=3, help="Most images per listing.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed; the same seed gives the same data.")
+        parser.add_argument("--password", help="Password of every created user. Without one they cannot log in.")
+        parser.add_argument(
+            "--media-dir",
+            help="Write the image files (about 100 KB each) into this directory instead of S3. "
+            "Without it only the image rows are created.",
+        )
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith="user").exists():
+            raise CommandError("The database already has users named user<N>; seed an empty database.")
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            if options["media_dir"]:
+                with local_image_storage(FileSystemStorage(location=options["media_dir"])):
+                    counts = self.seed(options, sample_jpeg(size=(400, 300)))
+            else:
+                counts = self.seed(options, None)
+        summary = ", ".join(f"{count} {kind}" for kind, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Created {summary} in {time.perf_counter() - start:.1f}s."))
+
+    def seed(self, options, image_bytes):
+        return seed_marketplace(
+            options["users"], options["listings"], options["images"],
+            seed=options["seed"], password=options["password"], image_bytes=image_bytes,
+        )
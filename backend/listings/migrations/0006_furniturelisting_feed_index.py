@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_alter_listingimage_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='furniturelisting',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='listing_status_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 08:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0008_listingimage_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listingimage',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-18 09:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0010_storagedeletion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='furniturelisting',
+            index=models.Index(fields=['seller', 'status'], name='listing_seller_status_idx'),
+        ),
+    ]
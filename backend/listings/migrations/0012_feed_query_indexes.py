@@ -0,0 +1,37 @@
+# Generated by Django 5.1.3 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0011_listing_seller_status_idx'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='furniturelisting',
+            options={'ordering': ['-created_at', '-id']},
+        ),
+        migrations.RemoveIndex(
+            model_name='furniturelisting',
+            name='listing_status_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='furniturelisting',
+            name='listing_seller_status_idx',
+        ),
+        migrations.AddIndex(
+            model_name='furniturelisting',
+            index=models.Index(condition=models.Q(('status', 'published')), fields=['-created_at', '-id'], name='listing_published_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='furniturelisting',
+            index=models.Index(fields=['seller', 'status', '-created_at', '-id'], name='listing_seller_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['buyer', '-purchase_date'], name='purchase_buyer_date_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.3 on 2026-10-18 09:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0012_feed_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SavedListing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('saved_at', models.DateTimeField(auto_now_add=True)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saves', to='listings.furniturelisting')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saves', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-saved_at', '-id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='furniturelisting',
+            name='saved_by',
+            field=models.ManyToManyField(blank=True, related_name='saved_listings', through='listings.SavedListing', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='savedlisting',
+            index=models.Index(fields=['user', '-saved_at', '-id'], name='saved_listing_user_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='savedlisting',
+            unique_together={('user', 'listing')},
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0013_savedlisting'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='listingimage',
+            constraint=models.UniqueConstraint(condition=models.Q(('image', ''), _negated=True), fields=('image',), name='unique_listing_image_file'),
+        ),
+    ]
@@ -2,12 +2,18 @@ from django.db import models
 from django.conf import settings
 import uuid
 from django.dispatch import receiver
-from django.db.models.signals import post_delete
+from django.db.models.signals import post_delete, pre_delete
+from django.db.models import Exists, OuterRef, Subquery, Value
 from django.core.validators import ValidationError
-from PIL import Image
-import io
-from django.db import transaction
-from storages.backends.s3boto3 import S3Boto3Storage
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .images import RENDITION_SIZES, build_srcset, process_image, rendition_names, save_renditions
+from .image_urls import image_url
+from .signals import listing_images_changed, listing_status_changed
+from .storage import InstrumentedS3Storage, delete_after_commit, stored_images
+from .tasks import image_pipeline_enabled, queue_image_processing
+from .uploads import InvalidUpload, claim_upload
 
 import logging
 logger = logging.getLogger()
@@ -15,20 +21,164 @@ logging.basicConfig(level=logging.INFO)
 
 # Create your models here.
 
-class ListingManager(models.Manager):
+# What FeedListSerializer reads from each row of a feed: the listing's own
+# columns and the annotations of with_thumbnail().
+FEED_COLUMNS = (
+    "id", "title", "description", "price", "created_at", "status", "category",
+    "thumbnail_name", "thumbnail_renditions",
+)
+
+
+class ListingQuerySet(models.QuerySet):
+    def with_thumbnail(self):
+        # Resolve the first image of every listing inside the feed query itself,
+        # so rendering a page never issues one images query per row.
+        first_image = ListingImage.objects.filter(
+            listing=OuterRef("pk"), status=ListingImage.Status.READY
+        ).order_by("order")
+        return self.annotate(
+            thumbnail_name=Subquery(first_image.values("image")[:1]),
+            thumbnail_renditions=Subquery(first_image.values("renditions")[:1]),
+        )
+
+    def with_is_saved(self, user):
+        # Whether `user` saved each listing, resolved inside the same query
+        if not user.is_authenticated:
+            return self.annotate(is_saved=Value(False))
+        return self.annotate(
+            is_saved=Exists(SavedListing.objects.filter(user_id=user.pk, listing=OuterRef("pk")))
+        )
+
+    def feed_values(self, *fields):
+        # Plain rows for FeedListSerializer, skipping model instances; `fields`
+        # adds annotations such as is_saved and the pagination columns.
+        return self.values(*FEED_COLUMNS, *fields)
+
+
+def new_image_status():
+    # With a pipeline configured, uploads are stored raw and compressed later.
+    if image_pipeline_enabled():
+        return ListingImage.Status.PROCESSING
+    return ListingImage.Status.READY
+
+
+def new_listing_image(listing, update, files, claimed):
+    """
+    Build the unsaved ListingImage for a new entry of `image_updates`: either
+    a finished direct upload named by its "upload" token, or the multipart
+    file "image_<order>". Returns None when the entry has neither. `claimed`
+    collects the upload keys of the request (see claim_upload).
+    """
+    order = update.get("order")
+    if update.get("upload"):
+        # Already in the bucket; only its key is attached, and the pipeline
+        # compresses it into the listing's prefix.
+        key = claim_upload(listing.seller, update["upload"], claimed)
+        return ListingImage(
+            listing=listing,
+            image=key,
+            order=order,
+            image_name=f"{uuid.uuid4()}{key.rsplit('/', 1)[-1]}",
+            status=ListingImage.Status.PROCESSING,
+        )
+
+    file = files.get(f"image_{order}")
+    if not file:
+        return None
+    return ListingImage(
+        listing=listing,
+        image=file,
+        order=order,
+        image_name=f"{uuid.uuid4()}{file.name}",
+        status=new_image_status(),
+    )
+
+
+def insert_images(images, claimed):
+    """
+    Insert `images` at once. If another request attached one of the upload
+    keys in `claimed` first, the unique constraint on ListingImage.image
+    rejects the insert and InvalidUpload is raised.
+    """
+    if not claimed:
+        ListingImage.objects.bulk_create(images)
+        return
+    try:
+        # A savepoint, so the transaction is still usable to find the key
+        with transaction.atomic():
+            ListingImage.objects.bulk_create(images)
+    except IntegrityError:
+        taken = ListingImage.objects.filter(image__in=claimed).values_list("image", flat=True).first()
+        if taken is None:
+            raise
+        raise InvalidUpload(f"{taken} is already attached to a listing")
+
+
+class PurchaseError(ValueError):
+    pass
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+class ListingManager(models.Manager.from_queryset(ListingQuerySet)):
+    def change_status(self, listing, previous_status, status):
+        """
+        Move `listing` from `previous_status` to `status` with one conditional
+        UPDATE of its status and updated_at, and send listing_status_changed.
+        Returns False, changing nothing, if the stored status is no longer
+        `previous_status`.
+        """
+        now = timezone.now()
+        changed = self.filter(pk=listing.pk, status=previous_status).update(
+            status=status, updated_at=now
+        )
+        if not changed:
+            return False
+        listing.status, listing.updated_at = status, now
+        listing_status_changed.send(
+            sender=FurnitureListing, listing=listing, previous_status=previous_status
+        )
+        return True
+
+    @transaction.atomic
+    def purchase_listing(self, listing, buyer):
+        """
+        Sell `listing` to `buyer` and return the Purchase, or raise
+        PurchaseError. The listing is marked sold with a conditional UPDATE
+        (see change_status), so among concurrent buyers exactly one matches
+        the published row and every other updates nothing.
+        """
+        if listing.seller_id == buyer.pk:
+            raise PurchaseError("You cannot buy your own listing")
+
+        Status = FurnitureListing.Status
+        if not self.change_status(listing, Status.PUBLISHED, Status.SOLD):
+            if self.filter(pk=listing.pk, status=Status.SOLD).exists():
+                raise PurchaseError("This item has already been sold")
+            raise PurchaseError("This item is not available for purchase")
+
+        # The row is ours until commit, so the price cannot change under us.
+        listing.price = self.filter(pk=listing.pk).values_list("price", flat=True).get()
+        return Purchase.objects.create(
+            buyer_id=buyer.pk, listing=listing, price_at_time_of_purchase=listing.price
+        )
+
     @transaction.atomic
     def update_listing_with_images(self, instance, validated_data, image_updates, files):
-        # Update listing fields
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
+        # Status changes go through a transition once the images are in place
+        status = validated_data.pop("status", instance.status)
+        instance.update_fields(validated_data)
+        images_to_delete = []
+        images_to_update = []
+        images_to_create = []
+        claimed = set()
 
         if image_updates:
         # Handle image updates
             existing_images = {str(img.id): img for img in instance.images.all()}
-            images_to_delete = []
-            images_to_update = []
-            images_to_create = []
+            top_order = max((img.order for img in existing_images.values()), default=0)
 
             for update in image_updates:
                 image_id = update.get("id")
@@ -41,54 +191,70 @@ class ListingManager(models.Manager):
                     existing_images[image_id].order = order
                     images_to_update.append(existing_images[image_id])
                 else:
-                    file_key = f"image_{order}"
-                    if file_key in files:
-                        unique_filename = f"{uuid.uuid4()}{files[file_key].name}"
-                        images_to_create.append(
-                            ListingImage(
-                                listing=instance,
-                                image=files[file_key],
-                                order=order,
-                                image_name=unique_filename
-                            )
-                        )
+                    image = new_listing_image(instance, update, files, claimed)
+                    if image:
+                        images_to_create.append(image)
 
             # Process deletions
-            for image_id in images_to_delete:
-                image = ListingImage.objects.get(id=image_id)
-                image.delete()
-
-            # Process updates
-            ListingImage.objects.bulk_update(images_to_update, ['order'])
-
-            # Process creations
-            for new_image in images_to_create:
-                new_image.save()
-
-            logger.info(f"Updated listing {instance.id}: {len(images_to_delete)} deleted, {len(images_to_update)} updated, {len(images_to_create)} created")
+            if images_to_delete:
+                ListingImage.objects.filter(listing=instance, id__in=images_to_delete).delete()
+
+            # Process updates. Park the images above every order in use first,
+            # so swapping two orders never collides on (listing, order).
+            if images_to_update:
+                orders = [image.order for image in images_to_update]
+                top_order = max(top_order, *orders)
+                for position, image in enumerate(images_to_update, start=1):
+                    image.order = top_order + position
+                ListingImage.objects.bulk_update(images_to_update, ['order'])
+                for image, order in zip(images_to_update, orders):
+                    image.order = order
+                ListingImage.objects.bulk_update(images_to_update, ['order'])
+
+            # A status the listing cannot reach fails before anything is uploaded
+            if images_to_create:
+                instance.check_transition_to(status, new_images=images_to_create)
+
+        # Process creations: upload concurrently, then insert every row at once
+        with stored_images(images_to_create):
+            insert_images(images_to_create, claimed)
+            queue_image_processing(images_to_create)
+
+            # Bulk writes send no post_save; the deletes signalled already.
+            if images_to_update or images_to_create:
+                listing_images_changed.send(sender=ListingImage, listing_ids={instance.pk})
+
+            if image_updates:
+                logger.info(f"Updated listing {instance.id}: {len(images_to_delete)} deleted, {len(images_to_update)} updated, {len(images_to_create)} created")
+
+            instance.transition_to(status)
         return instance
 
     @transaction.atomic
     def create_listing_with_images(self, validated_data, image_updates, files):
-        listing = self.create(**validated_data)
+        # Listings start as drafts; publishing is a transition once the images exist
+        status = validated_data.pop("status", FurnitureListing.Status.DRAFT)
+        listing = self.create(**validated_data, status=FurnitureListing.Status.DRAFT)
         
         logger.info(f"Created listing {listing.id}")
         logger.info(image_updates)
+        images = []
+        claimed = set()
         for update in image_updates:
-            order = update.get("order")
-            file_key = f"image_{order}"
-            logger.info(f"file_key: {file_key}")
-            logger.info(f"files: {files}")
-            if file_key in files:
-                logger.info(f"Adding image {order} to listing {listing.id}")
-                unique_filename = f"{uuid.uuid4()}{files[file_key].name}"
-                ListingImage.objects.create(
-                    listing=listing,
-                    image=files[file_key],
-                    order=order,
-                    image_name=unique_filename
-                )
-        
+            image = new_listing_image(listing, update, files, claimed)
+            if image:
+                logger.info(f"Adding image {image.order} to listing {listing.id}")
+                images.append(image)
+
+        # A status the listing cannot reach fails before anything is uploaded
+        if images:
+            listing.check_transition_to(status, new_images=images)
+
+        # Upload concurrently, then insert every row at once
+        with stored_images(images):
+            insert_images(images, claimed)
+            queue_image_processing(images)
+            listing.transition_to(status)
         return listing
 
 def validate_positive_or_none(value):
@@ -123,9 +289,25 @@ class FurnitureListing(models.Model):
         WARDROBE = "WARDROBE", "Wardrobe"
         OTHER = "OTHER", "Other"
     
-    def can_be_published(self):
+    # Transition name: (statuses it starts from, status it leads to)
+    TRANSITIONS = {
+        "publish": ({Status.DRAFT}, Status.PUBLISHED),
+        "unpublish": ({Status.PUBLISHED}, Status.DRAFT),
+        "reserve": ({Status.PUBLISHED}, Status.IN_PROGRESS),
+        "complete": ({Status.IN_PROGRESS}, Status.COMPLETED),
+        "sell": ({Status.PUBLISHED, Status.IN_PROGRESS}, Status.SOLD),
+    }
+
+    def can_be_published(self, new_images=()):
+        """Whether the listing can be published, counting `new_images` about to be added."""
         required_fields = [self.title, self.description, self.price, self.category]
-        return all(required_fields) and self.images.exists()
+        if not all(required_fields):
+            return False
+        if new_images:
+            return True
+        if "images" in getattr(self, "_prefetched_objects_cache", {}):
+            return len(self.images.all()) > 0
+        return self.images.exists()
 
     seller = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -155,12 +337,45 @@ class FurnitureListing(models.Model):
     public_comments = models.ManyToManyField(
         settings.AUTH_USER_MODEL, through="Comment", related_name="comments", blank=True
     )
+    saved_by = models.ManyToManyField(
+        settings.AUTH_USER_MODEL, through="SavedListing", related_name="saved_listings", blank=True
+    )
 
     def __str__(self):
         return f"{self.title} uploaded by {self.seller}"
 
     objects = ListingManager()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored status, so a save knows which seller counters to move
+        # (see listings.counters).
+        if "status" in instance.__dict__:
+            instance._loaded_status = instance.status
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        if fields is None or "status" in fields:
+            self._loaded_status = self.status
+
+    class Meta:
+        # Newest first, matching the indexes below
+        ordering = ["-created_at", "-id"]
+        indexes = [
+            # Keyset pagination of the homepage feed: only published rows, in
+            # (created_at, id) cursor order, walked backwards.
+            models.Index(
+                fields=["-created_at", "-id"],
+                condition=models.Q(status="published"),
+                name="listing_published_feed_idx",
+            ),
+            # A seller's listings in one status, newest first (my listings,
+            # counter reconciles)
+            models.Index(fields=["seller", "status", "-created_at", "-id"], name="listing_seller_status_idx"),
+        ]
+
     def update_with_images(self, validated_data, image_updates, files):
         return self.__class__.objects.update_listing_with_images(self, validated_data, image_updates, files)
 
@@ -168,16 +383,98 @@ class FurnitureListing(models.Model):
         return self.__class__.objects.create_listing_with_images(self, validated_data, image_updates, files)
 
     def update_fields(self, validated_data):
-        for attr, value in validated_data.items():
-            setattr(self, attr, value)
-        self.save()
+        """Set and save only the fields in `validated_data` that changed."""
+        changed = [attr for attr, value in validated_data.items() if getattr(self, attr) != value]
+        for attr in changed:
+            setattr(self, attr, validated_data[attr])
+        if changed:
+            self.save(update_fields=[*changed, "updated_at"])
         return self
+
+    def check_transition(self, name, new_images=()):
+        """
+        Raise InvalidTransition if transition `name` cannot start from the
+        listing's current state, counting `new_images` about to be added.
+        """
+        sources, status = self.TRANSITIONS[name]
+        if self.status not in sources:
+            raise InvalidTransition(f"Cannot {name} a listing that is {self.get_status_display().lower()}")
+        if status == self.Status.PUBLISHED and not self.can_be_published(new_images):
+            raise InvalidTransition(
+                "A title, description, price, category and at least one image are required to publish"
+            )
+
+    def transition(self, name):
+        """
+        Apply transition `name` (see TRANSITIONS). Raises InvalidTransition if
+        the listing is not in one of its starting statuses, cannot be published,
+        or changed status since it was loaded.
+        """
+        self.check_transition(name)
+        if not self.__class__.objects.change_status(self, self.status, self.TRANSITIONS[name][1]):
+            raise InvalidTransition("The listing changed status; reload it and try again")
+
+    def transition_name(self, status):
+        """
+        The transition leading from the current status to `status`, or None if
+        none is needed. Raises InvalidTransition if no transition leads there.
+        """
+        if status == self.status:
+            return None
+        for name, (sources, target) in self.TRANSITIONS.items():
+            if target == status and self.status in sources:
+                return name
+        raise InvalidTransition(
+            f"A listing cannot go from {self.get_status_display().lower()} to {self.Status(status).label.lower()}"
+        )
+
+    def check_transition_to(self, status, new_images=()):
+        """Raise InvalidTransition if transition_to(`status`) would, counting `new_images` about to be added."""
+        name = self.transition_name(status)
+        if name:
+            self.check_transition(name, new_images)
+
+    def transition_to(self, status):
+        """Apply the transition leading from the current status to `status`, if any is needed."""
+        name = self.transition_name(status)
+        if name:
+            self.transition(name)
+
+    def publish(self):
+        self.transition("publish")
+
+    def unpublish(self):
+        self.transition("unpublish")
+
+    def reserve(self):
+        self.transition("reserve")
+
+    def complete(self):
+        self.transition("complete")
+
+    def sell(self):
+        self.transition("sell")
     
+    def get_thumbnail_image(self):
+        if not hasattr(self, "thumbnail_name"):
+            # Not annotated by ListingQuerySet.with_thumbnail(); look it up.
+            image = self.images.filter(status=ListingImage.Status.READY).order_by("order").first()
+            self.thumbnail_name = image.image.name if image else None
+            self.thumbnail_renditions = image.renditions if image else None
+        return self.thumbnail_name, self.thumbnail_renditions
+
     @property
     def thumbnail(self):
-        thumbnail_image = self.images.order_by("order").first()
-        if thumbnail_image and thumbnail_image.image:
-            return thumbnail_image.image.url
+        name, _ = self.get_thumbnail_image()
+        if name:
+            return image_url(name)
+        return None
+
+    @property
+    def thumbnail_srcset(self):
+        _, renditions = self.get_thumbnail_image()
+        if renditions:
+            return build_srcset(renditions, image_url)
         return None
 
 def listing_path(instance, filename):
@@ -189,90 +486,162 @@ class CompressedImageField(models.ImageField):
     def __init__(self, *args, **kwargs):
         self.max_width = kwargs.pop("size", 1080)
         self.quality = kwargs.pop("quality", 85)
+        # Smaller copies to render alongside, stored in `renditions_field`
+        self.rendition_sizes = kwargs.pop("rendition_sizes", ())
+        self.renditions_field = kwargs.pop("renditions_field", None)
         super().__init__(*args, **kwargs)
 
-    def pre_save(self, model_instance, add):
-        file = super().pre_save(model_instance, add)
-        if file and not file._committed:
-            image = Image.open(file)
-
-            if image.mode != "RGB":
-                image = image.convert("RGB")
-
-            # Calculate dimensions for center crop
-            width, height = image.size
-            if width > height:
-                left = (width - height) // 2
-                top = 0
-                right = left + height
-                bottom = height
-            else:
-                left = 0
-                top = (height - width) // 2
-                right = width
-                bottom = top + width
+    def process(self, model_instance, file):
+        """Replace `file` with its compressed version and store its renditions."""
+        processed = process_image(file, self.max_width, self.quality, self.rendition_sizes)
 
-            # Crop to square
-            image = image.crop((left, top, right, bottom))
+        # Save the compressed image; upload_to gives it a fresh .jpg name
+        file.save("image.jpg", File(processed.image), save=False)
 
-            # Resize to 1080x1080
-            image = image.resize((self.max_width, self.max_width), Image.LANCZOS)
+        if self.renditions_field:
+            renditions = save_renditions(file.storage, file.name, processed.renditions, self.max_width)
+            setattr(model_instance, self.renditions_field, renditions)
 
-            output = io.BytesIO()
-            image.save(output, format="JPEG", quality=self.quality, optimize=True)
-            output.seek(0)
-
-            # Generate a new filename without random strings
-            new_filename = listing_path(model_instance, file.name)
-
-            # Save the compressed image
-            model_instance.image.save(new_filename, output, save=False)
-
-            # Close the original file to prevent it from being saved
-            file.close()
+    def pre_save(self, model_instance, add):
+        file = getattr(model_instance, self.attname)
+        # Compress before super() commits the upload to storage. Instances that
+        # defer compression keep the raw upload for the image pipeline.
+        if file and not file._committed and not getattr(model_instance, "defer_compression", False):
+            self.process(model_instance, file)
+
+        return super().pre_save(model_instance, add)
+
+class ListingImageQuerySet(models.QuerySet):
+    def delete(self):
+        # Every file of every image is deleted in batches after the commit.
+        with transaction.atomic():
+            images = list(self.only("listing_id", "image", "renditions"))
+            deleted = super().delete()
+            delete_after_commit(name for image in images for name in image.stored_names())
+            listing_images_changed.send(
+                sender=ListingImage, listing_ids={image.listing_id for image in images}
+            )
+        return deleted
+
+    delete.alters_data = True
+    delete.queryset_only = True
 
-        return model_instance.image
 
 class ListingImage(models.Model):
+    class Status(models.TextChoices):
+        PROCESSING = "processing", "Processing"
+        READY = "ready", "Ready"
+        FAILED = "failed", "Failed"
+
     listing = models.ForeignKey(
         FurnitureListing, on_delete=models.CASCADE, related_name="images"
     )
     image = CompressedImageField(
-        storage=S3Boto3Storage(),
+        storage=InstrumentedS3Storage(),
         upload_to=listing_path,
+        rendition_sizes=RENDITION_SIZES,
+        renditions_field="renditions",
     )
+    # {format: {width: storage name}}, including the main image as jpeg/1080
+    renditions = models.JSONField(default=dict, blank=True)
     image_name = models.CharField(max_length=255, unique=True, blank=True)
     order = models.PositiveIntegerField(default=1)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.READY)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    objects = ListingImageQuerySet.as_manager()
 
     class Meta:
         unique_together = ("listing", "order")
         ordering = ["order"]
+        constraints = [
+            # An upload is attached to one image only (see claim_upload)
+            models.UniqueConstraint(fields=["image"], condition=~models.Q(image=""), name="unique_listing_image_file"),
+        ]
 
     def __str__(self):
         return f"Image {self.order} for Listing {self.listing.id}"
 
+    @property
+    def defer_compression(self):
+        return self.status == self.Status.PROCESSING
+
+    @property
+    def srcset(self):
+        return build_srcset(self.renditions, image_url)
+
+    def stored_names(self):
+        """Every storage name owned by this image: the image and its renditions."""
+        names = [self.image.name] if self.image else []
+        return names + rendition_names(self.renditions, exclude=self.image.name)
+
     def save(self, *args, **kwargs):
         if not self.image_name:
             self.image_name = f"{uuid.uuid4()}{self.image.name}"
-        if self.pk:
-            old_instance = ListingImage.objects.get(pk=self.pk)
-            if old_instance.image != self.image:
-                old_instance.image.delete(save=False)
-        super().save(*args, **kwargs)
-        
-
-@receiver(post_delete, sender=ListingImage)
-def delete_s3_image(sender, instance, **kwargs):
-    # Delete the file from S3
-    instance.image.delete(save=False)
+        with transaction.atomic():
+            if self.pk:
+                old_instance = ListingImage.objects.get(pk=self.pk)
+                if old_instance.image != self.image:
+                    delete_after_commit(old_instance.stored_names())
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            names = self.stored_names()
+            deleted = super().delete(*args, **kwargs)
+            # Delete the file and its renditions from S3
+            delete_after_commit(names)
+            listing_images_changed.send(sender=ListingImage, listing_ids={self.listing_id})
+        return deleted
+
+
+# Images deleted through a listing's cascade bypass ListingImage.delete() and
+# ListingImageQuerySet.delete(), so their files are collected here.
+@receiver(pre_delete, sender=FurnitureListing)
+def collect_listing_image_files(sender, instance, **kwargs):
+    instance._image_files = [
+        name
+        for image in ListingImage.objects.filter(listing=instance).only("image", "renditions")
+        for name in image.stored_names()
+    ]
 
 
 @receiver(post_delete, sender=FurnitureListing)
 def delete_listing_images(sender, instance, **kwargs):
-    # Delete all associated images when a listing is deleted
-    for image in instance.images.all():
-        image.delete()
+    # Runs inside the delete's transaction; the files go once it commits.
+    delete_after_commit(getattr(instance, "_image_files", []))
+
+
+class StorageDeletion(models.Model):
+    """
+    Outbox of storage names whose rows are gone. Written in the transaction
+    that deletes the rows and cleared once the files are deleted.
+    """
+    name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class ListingSearchTerm(models.Model):
+    """
+    Posting in the listing search index: `listing` contains `term` with the
+    given field-weighted frequency. Maintained by listings.search.
+    """
+    term = models.CharField(max_length=40)
+    listing = models.ForeignKey(
+        FurnitureListing, on_delete=models.CASCADE, related_name="search_terms"
+    )
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        # Leading `term` serves both exact lookups and prefix range scans.
+        unique_together = ("term", "listing")
+
+    def __str__(self):
+        return f"{self.term} -> Listing {self.listing_id}"
 
 class Comment(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -280,6 +649,46 @@ class Comment(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+class SavedListing(models.Model):
+    """A listing a user saved to come back to, i.e. FurnitureListing.saved_by."""
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="saves")
+    listing = models.ForeignKey(FurnitureListing, on_delete=models.CASCADE, related_name="saves")
+    saved_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-saved_at", "-id"]
+        unique_together = ["user", "listing"]
+        indexes = [
+            # A user's saved listings feed, most recently saved first
+            models.Index(fields=["user", "-saved_at", "-id"], name="saved_listing_user_date_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user} saved {self.listing_id}"
+
+
+def saved_listings_of(user, listing_ids):
+    return (
+        SavedListing.objects.filter(user_id=user.pk, listing_id__in=listing_ids)
+        .order_by()
+        .values_list("listing_id", flat=True)
+    )
+
+
+def saved_listing_ids(user, listing_ids):
+    """The ids among `listing_ids` that `user` has saved, in one query."""
+    if not user.is_authenticated:
+        return set()
+    return set(saved_listings_of(user, listing_ids))
+
+
+async def asaved_listing_ids(user, listing_ids):
+    if not user.is_authenticated:
+        return set()
+    return {listing_id async for listing_id in saved_listings_of(user, listing_ids)}
+
+
 class Purchase(models.Model):
     buyer = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -297,6 +706,10 @@ class Purchase(models.Model):
     class Meta:
         ordering = ['-purchase_date']
         unique_together = ['listing', 'buyer']  # Prevent duplicate purchases
+        indexes = [
+            # A buyer's purchases, newest first
+            models.Index(fields=['buyer', '-purchase_date'], name='purchase_buyer_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.buyer.username} purchased {self.listing.title}"
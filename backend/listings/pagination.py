@@ -0,0 +1,209 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .feed import aread_feed, read_feed
+from .models import FurnitureListing
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Forward-only cursor pagination over a unique ordering tuple.
+
+    The cursor stores the ordering values of the last row on the page and the
+    next page is fetched with a row-value comparison against them, so every
+    page costs the same index range scan and no COUNT(*) is issued. The last
+    column of `ordering` must be unique (normally the primary key).
+    """
+
+    ordering = ("-created_at", "-id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+
+        results = list(queryset.order_by(*self.ordering)[: self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        return self.page
+
+    def get_position_filter(self, position):
+        # (a, b) < (x, y)  ==  a < x OR (a = x AND b < y), for any number of columns
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            equal = {f.lstrip("-"): value for f, value in zip(self.ordering[:index], position)}
+            condition |= Q(**equal, **{f"{name}__{lookup}": position[index]})
+        # Redundant bound on the leading column, so the database seeks into
+        # the index instead of scanning it from the first row.
+        first = self.ordering[0]
+        bound = "lte" if first.startswith("-") else "gte"
+        return Q(**{f"{first.lstrip('-')}__{bound}": position[0]}) & condition
+
+    def get_position(self, instance):
+        if isinstance(instance, dict):
+            # A .values() row
+            return [instance[field.lstrip("-")] for field in self.ordering]
+        return [getattr(instance, field.lstrip("-")) for field in self.ordering]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            position = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) not in self.cursor_lengths:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    @property
+    def cursor_lengths(self):
+        return (len(self.ordering),)
+
+    def encode_cursor(self, position):
+        # str() keeps full microsecond precision, unlike DjangoJSONEncoder,
+        # which matters when two rows share a created_at millisecond.
+        encoded = urlsafe_b64encode(json.dumps(position, default=str).encode("ascii"))
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode("ascii"))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]))
+
+    def get_previous_link(self):
+        return None
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class FeedPagination(KeysetPagination):
+    """
+    Keyset pagination by default, page-number pagination when the client asks
+    for a `page`, for clients that need page numbers and a total count.
+    """
+
+    page_number_class = StandardResultsSetPagination
+
+    def uses_page_numbers(self, request):
+        return self.page_number_class.page_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_number_pagination = None
+        if self.uses_page_numbers(request):
+            self.page_number_pagination = self.page_number_class()
+            return self.page_number_pagination.paginate_queryset(
+                queryset.order_by(*self.ordering), request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.page_number_pagination is not None:
+            return self.page_number_pagination.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class CachedFeedPagination(FeedPagination):
+    """
+    FeedPagination whose keyset pages are read from the cached feed windows
+    (see listings.feed) instead of a queryset. The cursor holds the position
+    of the last row served, followed by the start of the window to resume
+    reading from when that differs.
+    """
+
+    @property
+    def cursor_lengths(self):
+        return (len(self.ordering), 2 * len(self.ordering))
+
+    def paginate_feed(self, request, exclude_seller=None):
+        after, window_start = self.start_feed(request)
+        rows, self.next_position, self.windows_digest = read_feed(
+            self, self.page_size, after, window_start, exclude_seller
+        )
+        return rows
+
+    async def apaginate_feed(self, request, exclude_seller=None):
+        after, window_start = self.start_feed(request)
+        rows, self.next_position, self.windows_digest = await aread_feed(
+            self, self.page_size, after, window_start, exclude_seller
+        )
+        return rows
+
+    def start_feed(self, request):
+        """Read the page size and cursor of `request`; returns (after, window start)."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.page_number_pagination = None
+
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            return None, None
+        columns = len(self.ordering)
+        return self.parse_position(cursor[:columns]), self.parse_position(cursor[columns:] or cursor)
+
+    def parse_position(self, values):
+        # Positions are compared in Python, so restore the column types.
+        if all(value is None for value in values):
+            return None
+        fields = [FurnitureListing._meta.get_field(field.lstrip("-")) for field in self.ordering]
+        try:
+            return tuple(field.to_python(value) for field, value in zip(fields, values))
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        after, window_start = self.next_position
+        if after == window_start:
+            return self.encode_cursor(list(after))
+        return self.encode_cursor(list(after) + list(window_start or [None] * len(after)))
+
+
+class SavedListingsPagination(KeysetPagination):
+    """Keyset pagination over a user's saved listings, most recently saved first."""
+
+    ordering = ("-saved_at", "-save_id")
+
+
+class SearchResultsPagination(KeysetPagination):
+    """Keyset pagination over ranked search results, best match first."""
+
+    ordering = ("-search_score", "-id")
@@ -0,0 +1,277 @@
+import bisect
+import re
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Q, Sum, Value, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.filters import BaseFilterBackend
+
+from .models import FurnitureListing, ListingSearchTerm
+from .signals import listing_status_changed
+
+MAX_TERM_LENGTH = ListingSearchTerm._meta.get_field("term").max_length
+MAX_QUERY_TERMS = 8
+
+# Title hits rank above category/condition hits, which rank above description hits.
+FIELD_WEIGHTS = {
+    "title": 4,
+    "category": 2,
+    "condition": 2,
+    "description": 1,
+}
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return [token[:MAX_TERM_LENGTH] for token in TOKEN_RE.findall(text.lower())]
+
+
+def listing_terms(listing):
+    """
+    Return the {term: weight} postings for a listing. A term's weight is the sum
+    of the field weights of every occurrence, so repeated words rank higher.
+    """
+    fields = {
+        "title": listing.title,
+        "description": listing.description,
+        # Index both the stored value and the label users actually type.
+        "category": f"{listing.category} {listing.get_category_display()}",
+        "condition": f"{listing.condition or ''} {listing.get_condition_display() or ''}",
+    }
+    terms = defaultdict(int)
+    for field, text in fields.items():
+        for token in tokenize(text):
+            terms[token] += FIELD_WEIGHTS[field]
+    return dict(terms)
+
+
+def parse_query(query):
+    """
+    Split a query into (exact_terms, prefix_term). The last word is matched as a
+    prefix unless the query ends with whitespace, so results follow typing.
+    """
+    terms = tokenize(query)[:MAX_QUERY_TERMS]
+    if not terms or query[-1:].isspace():
+        return terms, None
+    return terms[:-1], terms[-1]
+
+
+def no_results():
+    return FurnitureListing.objects.none().annotate(search_score=Value(0, IntegerField()))
+
+
+def is_indexable(listing):
+    return listing.status == FurnitureListing.Status.PUBLISHED
+
+
+class BaseSearchBackend:
+    def index(self, listing):
+        raise NotImplementedError
+
+    def remove(self, listing_id):
+        raise NotImplementedError
+
+    def search(self, query):
+        """
+        Return a queryset of published listings matching every word of `query`,
+        annotated with an integer `search_score`.
+        """
+        raise NotImplementedError
+
+    def rebuild(self, queryset=None):
+        queryset = FurnitureListing.objects.all() if queryset is None else queryset
+        for listing in queryset.iterator():
+            self.index(listing)
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    Inverted index stored in ListingSearchTerm, one row per (term, listing).
+
+    Exact terms are index lookups and the prefix term is an index range scan,
+    so the cost of a query depends on how many postings match rather than on
+    the size of the catalogue. Works on any database Django supports.
+    """
+
+    def index(self, listing):
+        if not is_indexable(listing):
+            self.remove(listing.pk)
+            return
+
+        terms = listing_terms(listing)
+        existing = {
+            posting.term: posting for posting in ListingSearchTerm.objects.filter(listing=listing)
+        }
+        stale = [term for term in existing if term not in terms]
+        changed = []
+        for term, weight in terms.items():
+            posting = existing.get(term)
+            if posting is not None and posting.weight != weight:
+                posting.weight = weight
+                changed.append(posting)
+        added = [
+            ListingSearchTerm(listing=listing, term=term, weight=weight)
+            for term, weight in terms.items()
+            if term not in existing
+        ]
+
+        if stale:
+            ListingSearchTerm.objects.filter(listing=listing, term__in=stale).delete()
+        if changed:
+            ListingSearchTerm.objects.bulk_update(changed, ["weight"])
+        if added:
+            ListingSearchTerm.objects.bulk_create(added)
+
+    def remove(self, listing_id):
+        ListingSearchTerm.objects.filter(listing_id=listing_id).delete()
+
+    def search(self, query):
+        exact_terms, prefix = parse_query(query)
+        conditions = [Q(search_terms__term=term) for term in exact_terms]
+        if prefix:
+            # A range instead of LIKE 'x%', which SQLite cannot serve from an index.
+            conditions.append(
+                Q(search_terms__term__gte=prefix, search_terms__term__lt=prefix + "\uffff")
+            )
+        if not conditions:
+            return no_results()
+
+        any_term = Q()
+        for condition in conditions:
+            any_term |= condition
+        matches = {f"search_match_{i}": Count("search_terms", filter=c) for i, c in enumerate(conditions)}
+
+        return (
+            FurnitureListing.objects.filter(any_term, status=FurnitureListing.Status.PUBLISHED)
+            .annotate(search_score=Sum("search_terms__weight"), **matches)
+            .filter(**{f"{name}__gt": 0 for name in matches})
+        )
+
+
+class InMemorySearchBackend(BaseSearchBackend):
+    """
+    Pure-Python inverted index for tests and local development. Postings live
+    in the current process only, so it must not be used with several workers.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.postings = defaultdict(dict)
+        self.sorted_terms = []
+        self.documents = {}
+
+    def index(self, listing):
+        self.remove(listing.pk)
+        if not is_indexable(listing):
+            return
+        terms = listing_terms(listing)
+        with self.lock:
+            for term, weight in terms.items():
+                if term not in self.postings:
+                    bisect.insort(self.sorted_terms, term)
+                self.postings[term][listing.pk] = weight
+            self.documents[listing.pk] = terms
+
+    def remove(self, listing_id):
+        with self.lock:
+            for term in self.documents.pop(listing_id, {}):
+                postings = self.postings[term]
+                postings.pop(listing_id, None)
+                if not postings:
+                    del self.postings[term]
+                    self.sorted_terms.pop(bisect.bisect_left(self.sorted_terms, term))
+
+    def clear(self):
+        with self.lock:
+            self.postings.clear()
+            self.sorted_terms.clear()
+            self.documents.clear()
+
+    def prefix_postings(self, prefix):
+        merged = defaultdict(int)
+        start = bisect.bisect_left(self.sorted_terms, prefix)
+        for term in self.sorted_terms[start:]:
+            if not term.startswith(prefix):
+                break
+            for listing_id, weight in self.postings[term].items():
+                merged[listing_id] += weight
+        return merged
+
+    def search(self, query):
+        exact_terms, prefix = parse_query(query)
+        with self.lock:
+            term_postings = [dict(self.postings.get(term, {})) for term in exact_terms]
+            if prefix:
+                term_postings.append(self.prefix_postings(prefix))
+        if not term_postings:
+            return no_results()
+
+        listing_ids = set(term_postings[0]).intersection(*term_postings[1:])
+        if not listing_ids:
+            return no_results()
+        scores = {
+            listing_id: sum(postings[listing_id] for postings in term_postings)
+            for listing_id in listing_ids
+        }
+        return FurnitureListing.objects.filter(
+            pk__in=listing_ids, status=FurnitureListing.Status.PUBLISHED
+        ).annotate(
+            search_score=Case(
+                *[When(pk=pk, then=Value(score)) for pk, score in scores.items()],
+                output_field=IntegerField(),
+            )
+        )
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    backend = getattr(
+        settings, "LISTINGS_SEARCH_BACKEND", "listings.search.DatabaseSearchBackend"
+    )
+    return import_string(backend)()
+
+
+class ListingSearchFilter(BaseFilterBackend):
+    """
+    Restrict a listing queryset to the results of `?search=`, using the search
+    index instead of per-field icontains scans.
+    """
+
+    search_param = "search"
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, "")
+        if not query.strip():
+            return queryset
+        matches = get_search_backend().search(query)
+        return queryset.filter(pk__in=matches.values("pk"))
+
+
+INDEXED_FIELDS = {"title", "description", "category", "condition", "status"}
+
+
+@receiver(post_save, sender=FurnitureListing)
+def index_listing(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None and not INDEXED_FIELDS.intersection(update_fields)):
+        return
+    get_search_backend().index(instance)
+
+
+@receiver(listing_status_changed)
+def reindex_listing_status(sender, listing, **kwargs):
+    get_search_backend().index(listing)
+
+
+@receiver(post_delete, sender=FurnitureListing)
+def unindex_listing(sender, instance, **kwargs):
+    listing_id = instance.pk
+    transaction.on_commit(lambda: get_search_backend().remove(listing_id))
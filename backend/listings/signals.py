@@ -0,0 +1,11 @@
+from django.dispatch import Signal
+
+# Sent with `listing_ids` when listing images are added, removed, reordered or
+# change status through paths that send no post_save/post_delete per image:
+# bulk writes, queryset deletes and the image pipeline's updates.
+listing_images_changed = Signal()
+
+# Sent with `listing` (already holding its new status) and `previous_status`
+# when a listing changes status through a conditional UPDATE, which sends no
+# post_save.
+listing_status_changed = Signal()
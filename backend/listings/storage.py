@@ -0,0 +1,182 @@
+"""
+Concurrent storage I/O for listing images.
+
+Each S3 call is a blocking network round trip, so uploads for a whole listing
+are issued together on a bounded thread pool instead of one after another, and
+deletes are sent as batched DeleteObjects requests.
+
+Files of deleted rows are recorded in the StorageDeletion outbox in the same
+transaction as the delete and removed once it commits, so a rollback never
+loses files that are still referenced and a crash never orphans them:
+flush_storage_deletions retries whatever is left in the outbox.
+"""
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
+
+from core.instrumentation import instrument_boto3_session
+
+logger = logging.getLogger(__name__)
+
+# S3 accepts at most 1000 keys per DeleteObjects request.
+DELETE_BATCH_SIZE = 1000
+
+
+class InstrumentedS3Storage(S3Boto3Storage):
+    """S3Boto3Storage that reports its S3 calls to the request instrumentation."""
+
+    def _create_session(self):
+        return instrument_boto3_session(super()._create_session())
+
+
+def get_max_workers():
+    return getattr(settings, "LISTINGS_STORAGE_WORKERS", 8)
+
+
+def run_concurrently(func, items):
+    """
+    Call `func` on every item on a bounded thread pool and wait for all of
+    them. Returns a list of (item, error) pairs for the calls that raised.
+    """
+    items = list(items)
+    if not items:
+        return []
+    if len(items) == 1:
+        try:
+            func(items[0])
+            return []
+        except Exception as error:
+            return [(items[0], error)]
+
+    with ThreadPoolExecutor(max_workers=min(get_max_workers(), len(items))) as executor:
+        # Each call runs in a copy of the caller's context, so its storage
+        # calls are counted against the request (see core.instrumentation).
+        futures = [
+            (item, executor.submit(contextvars.copy_context().run, func, item))
+            for item in items
+        ]
+    return [(item, future.exception()) for item, future in futures if future.exception()]
+
+
+def store_images(images):
+    """
+    Upload the pending files of unsaved ListingImages concurrently, compressing
+    them first unless they defer compression, and return the images uploaded.
+    If any upload fails, everything already stored for `images` is deleted and
+    the first error is raised.
+    """
+    pending = [image for image in images if image.image and not image.image._committed]
+    if not pending:
+        return []
+    field = pending[0].image.field
+
+    failures = run_concurrently(lambda image: field.pre_save(image, add=True), pending)
+    if failures:
+        # Never referenced by a committed row, so deleted right away.
+        stored = [image for image in pending if image.image._committed]
+        delete_objects(field.storage, [name for image in stored for name in image.stored_names()])
+        raise failures[0][1]
+    return pending
+
+
+@contextmanager
+def stored_images(images):
+    """
+    Upload `images` (see store_images) for a block that inserts their rows. If
+    the block raises, the files it uploaded are deleted right away: the rows
+    roll back, so no committed row references them.
+    """
+    stored = store_images(images)
+    try:
+        yield
+    except Exception:
+        if stored:
+            delete_objects(stored[0].image.storage, [name for image in stored for name in image.stored_names()])
+        raise
+
+
+def batches(items, size=DELETE_BATCH_SIZE):
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def delete_s3_batch(storage, names):
+    """Delete up to DELETE_BATCH_SIZE names in one request. Returns the names that failed."""
+    keys = {storage._normalize_name(clean_name(name)): name for name in names}
+    response = storage.bucket.delete_objects(
+        Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True}
+    )
+    for error in response.get("Errors", []):
+        logger.error(f"Failed to delete {error['Key']} from storage: {error.get('Code')}")
+    return [keys[error["Key"]] for error in response.get("Errors", [])]
+
+
+def delete_objects(storage, names):
+    """
+    Delete `names` from `storage` and return the names that could not be
+    deleted. S3 storages get one DeleteObjects request per 1000 names; other
+    storages fall back to concurrent single deletes.
+    """
+    names = list(dict.fromkeys(names))
+    if not isinstance(storage, S3Boto3Storage):
+        failures = run_concurrently(storage.delete, names)
+        for name, error in failures:
+            logger.error(f"Failed to delete {name} from storage: {error!r}")
+        return [name for name, _ in failures]
+
+    failed = []
+
+    def delete_batch(batch):
+        failed.extend(delete_s3_batch(storage, batch))
+
+    for batch, error in run_concurrently(delete_batch, batches(names)):
+        logger.error(f"Failed to delete {len(batch)} names from storage: {error!r}")
+        failed.extend(batch)
+    return failed
+
+
+def image_storage():
+    from .models import ListingImage
+
+    return ListingImage._meta.get_field("image").storage
+
+
+def delete_after_commit(names):
+    """
+    Record `names` in the StorageDeletion outbox and delete them from the
+    listing image storage once the current transaction commits.
+    """
+    from .models import StorageDeletion
+
+    names = list(dict.fromkeys(names))
+    if not names:
+        return
+    pending = StorageDeletion.objects.bulk_create(StorageDeletion(name=name) for name in names)
+    pks = [deletion.pk for deletion in pending]
+    transaction.on_commit(lambda: flush_deletions(pks))
+
+
+def flush_deletions(pks=None, queryset=None):
+    """
+    Delete the files of the given outbox rows (or every row in `queryset`)
+    and drop the rows whose files are gone. Returns (deleted, failed) counts.
+    """
+    from .models import StorageDeletion
+
+    if queryset is None:
+        queryset = StorageDeletion.objects.filter(pk__in=pks)
+    deleted = failed = 0
+    storage = image_storage()
+    pending = list(queryset.order_by("pk").values_list("pk", "name"))
+    for batch in batches(pending):
+        failures = set(delete_objects(storage, [name for _, name in batch]))
+        done = [pk for pk, name in batch if name not in failures]
+        StorageDeletion.objects.filter(pk__in=done).delete()
+        deleted += len(done)
+        failed += len(batch) - len(done)
+    return deleted, failed
@@ -0,0 +1,208 @@
+"""
+Background compression of listing images.
+
+Uploads are stored raw with status "processing" and handed to the configured
+pipeline once the transaction that created them commits, so requests never
+hold a transaction open while PIL decodes and re-encodes photos. Configure it
+with the LISTINGS_IMAGE_PIPELINE setting; without one, multipart uploads are
+compressed inline when they are saved, and direct uploads in-process after
+the commit.
+"""
+import logging
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+import django
+from django.conf import settings
+from django.core.files import File
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from PIL import UnidentifiedImageError
+
+from .images import ImageTooLarge, process_image, rendition_names, save_renditions
+from .signals import listing_images_changed
+from .storage import delete_after_commit
+
+logger = logging.getLogger(__name__)
+
+
+def process_listing_image(image_id, max_attempts):
+    """
+    Compress the raw upload of one processing ListingImage and mark it ready.
+
+    Raises on failure while attempts remain so the pipeline retries the job;
+    the last failure marks the image as failed instead.
+    """
+    from .models import ListingImage
+
+    processing = ListingImage.objects.filter(pk=image_id, status=ListingImage.Status.PROCESSING)
+    processing.update(attempts=F("attempts") + 1)
+    image = processing.first()
+    if image is None:
+        # Deleted, or already handled by an earlier attempt.
+        return None
+
+    field = image.image.field
+    storage = image.image.storage
+    raw_name = image.image.name
+    try:
+        with storage.open(raw_name, "rb") as raw:
+            processed = process_image(raw, field.max_width, field.quality, field.rendition_sizes)
+        name = storage.save(field.generate_filename(image, "image.jpg"), File(processed.image))
+        renditions = save_renditions(storage, name, processed.renditions, field.max_width)
+    except Exception as error:
+        # Retrying cannot fix an upload that is not an image or is too large.
+        permanent = isinstance(error, (ImageTooLarge, UnidentifiedImageError))
+        if image.attempts < max_attempts and not permanent:
+            raise
+        logger.exception(f"Giving up on image {image_id} after {image.attempts} attempts")
+        processing.update(status=ListingImage.Status.FAILED)
+        listing_images_changed.send(sender=ListingImage, listing_ids={image.listing_id})
+        return ListingImage.Status.FAILED
+
+    # Only swap in the compressed file if the row still points at the upload.
+    with transaction.atomic():
+        updated = processing.filter(image=raw_name).update(
+            image=name, renditions=renditions, status=ListingImage.Status.READY
+        )
+        delete_after_commit([raw_name] if updated else rendition_names(renditions))
+        if updated:
+            listing_images_changed.send(sender=ListingImage, listing_ids={image.listing_id})
+    return ListingImage.Status.READY if updated else None
+
+
+class BaseImagePipeline:
+    def __init__(self, max_attempts=3, retry_delay=5):
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def submit(self, image_id):
+        raise NotImplementedError
+
+
+class LocalImagePipeline(BaseImagePipeline):
+    """
+    Run jobs in the current process, for tests and local development.
+
+    Jobs run as soon as they are submitted unless `eager` is False, in which
+    case they wait in `queue` until run_pending() is called. Retries happen
+    immediately, without a delay.
+    """
+
+    def __init__(self, eager=True, **options):
+        super().__init__(**options)
+        self.eager = eager
+        self.queue = deque()
+
+    def submit(self, image_id):
+        self.queue.append(image_id)
+        if self.eager:
+            self.run_pending()
+
+    def run_pending(self):
+        while self.queue:
+            image_id = self.queue.popleft()
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    process_listing_image(image_id, self.max_attempts)
+                    break
+                except Exception:
+                    logger.warning(f"Attempt {attempt} to process image {image_id} failed", exc_info=True)
+
+
+class ProcessPoolImagePipeline(BaseImagePipeline):
+    """
+    Run jobs on a pool of worker processes, so decoding never competes with
+    request threads for the GIL. Failed jobs are resubmitted after
+    `retry_delay * attempt` seconds; a crashed worker breaks the pool, which
+    is then replaced on the next submission.
+    """
+
+    def __init__(self, workers=2, **options):
+        super().__init__(**options)
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    # Forking a threaded server process is unsafe; spawn fresh
+                    # interpreters that set Django up themselves.
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=django.setup,
+                )
+            return self.executor
+
+    def reset_executor(self, executor):
+        with self.lock:
+            if self.executor is executor:
+                self.executor = None
+        executor.shutdown(wait=False)
+
+    def submit(self, image_id, attempt=1):
+        executor = self.get_executor()
+        try:
+            future = executor.submit(process_listing_image, image_id, self.max_attempts)
+        except BrokenProcessPool:
+            self.reset_executor(executor)
+            future = self.get_executor().submit(process_listing_image, image_id, self.max_attempts)
+        future.add_done_callback(lambda done: self.job_done(done, executor, image_id, attempt))
+
+    def job_done(self, future, executor, image_id, attempt):
+        error = future.exception()
+        if error is None:
+            return
+        if isinstance(error, BrokenProcessPool):
+            self.reset_executor(executor)
+        if attempt >= self.max_attempts:
+            # Left in "processing"; process_pending_images picks it up.
+            logger.error(f"Image {image_id} failed {attempt} times: {error!r}")
+            return
+        logger.warning(f"Retrying image {image_id} after attempt {attempt} failed: {error!r}")
+        timer = threading.Timer(self.retry_delay * attempt, self.submit, args=(image_id, attempt + 1))
+        timer.daemon = True
+        timer.start()
+
+
+@lru_cache(maxsize=None)
+def get_image_pipeline():
+    config = getattr(settings, "LISTINGS_IMAGE_PIPELINE", None)
+    if not config or not config.get("BACKEND"):
+        return None
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+
+
+@receiver(setting_changed)
+def reset_image_pipeline(setting, **kwargs):
+    if setting == "LISTINGS_IMAGE_PIPELINE":
+        get_image_pipeline.cache_clear()
+
+
+def image_pipeline_enabled():
+    return get_image_pipeline() is not None
+
+
+def queue_image_processing(images):
+    """
+    Submit the processing images among `images` once the transaction commits.
+    """
+    image_ids = [image.pk for image in images if image.defer_compression]
+    if not image_ids:
+        return
+    pipeline = get_image_pipeline() or LocalImagePipeline()
+
+    def submit():
+        for image_id in image_ids:
+            pipeline.submit(image_id)
+
+    transaction.on_commit(submit)
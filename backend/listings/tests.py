@@ -1,3 +1,1757 @@
-from django.test import TestCase
+import io
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from botocore.awsrequest import AWSResponse
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.files.storage import InMemoryStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db import close_old_connections, connection, models, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from core import profiling
+from core.instrumentation import InstrumentationMiddleware, QueryBudgetExceeded, current_metrics
+
+from .benchmarks import local_image_storage, run_marketplace_benchmarks, sample_jpeg, seed_marketplace
+from .detail_cache import detail_key, get_detail_cache, get_listing_detail, lock_key
+from .image_urls import ImageURLCache, get_image_url_cache
+from .images import RENDITION_SIZES, ProcessedImage, rendition_formats
+from .models import (
+    FurnitureListing, InvalidTransition, ListingImage, ListingSearchTerm, Purchase, SavedListing,
+    StorageDeletion,
+)
+from .pagination import CachedFeedPagination
+from .search import get_search_backend
+from .serializers import ImageURLListSerializer, ListingListSerializer, format_datetimes
+from .signals import listing_status_changed
+from .storage import InstrumentedS3Storage, delete_objects, run_concurrently
+from .uploads import UPLOAD_PREFIX, claim_upload, create_upload_slot, presign_upload
+from .views import HomePageListingsView, ListingViewSet
+
+User = get_user_model()
+
+
+def image_upload(name="photo.png", size=(1600, 1200), mode="RGBA", format="PNG"):
+    buffer = io.BytesIO()
+    Image.new(mode, size, "orange").save(buffer, format=format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f"image/{format.lower()}")
+
+
+class SlowInMemoryStorage(InMemoryStorage):
+    """
+    In-memory storage with an S3-like round trip per call, recording how many
+    calls were in flight at once. The `fail_on`-th save raises.
+    """
+
+    latency = 0.05
+
+    def __init__(self, fail_on=None, **kwargs):
+        super().__init__(**kwargs)
+        self.fail_on = fail_on
+        self.lock = threading.Lock()
+        self.saves = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def round_trip(self):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        with self.lock:
+            self.in_flight -= 1
+
+    def _save(self, name, content):
+        self.round_trip()
+        with self.lock:
+            self.saves += 1
+            failing = self.saves == self.fail_on
+        if failing:
+            raise OSError(f"upload of {name} failed")
+        return super()._save(name, content)
+
+    def delete(self, name):
+        self.round_trip()
+        super().delete(name)
+
+
+class InMemoryImageStorageMixin:
+    """Store listing images in memory instead of S3 for the test's duration."""
+
+    storage_class = InMemoryStorage
+
+    def setUp(self):
+        super().setUp()
+        self.storage = self.storage_class()
+        patcher = mock.patch.object(ListingImage._meta.get_field("image"), "storage", self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stored_files(self, listing):
+        return self.storage.listdir(f"listings/{listing.id}")[1]
+
+
+def create_listings(seller, count, images_per_listing=3, status="published"):
+    listings = FurnitureListing.objects.bulk_create(
+        FurnitureListing(
+            seller=seller,
+            title=f"Listing {i}",
+            description="A sturdy piece of furniture",
+            price=Decimal("100.00"),
+            category=FurnitureListing.Category.CHAIR,
+            status=status,
+        )
+        for i in range(count)
+    )
+    # Images are stored by name only, so no upload happens in tests.
+    ListingImage.objects.bulk_create(
+        ListingImage(
+            listing=listing,
+            image=f"listings/{listing.id}/{order}.jpg",
+            image_name=f"{listing.id}-{order}.jpg",
+            order=order,
+        )
+        for listing in listings
+        for order in range(images_per_listing, 0, -1)
+    )
+    return listings
+
+
+class FeedQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username="seller", password="password")
+        cls.buyer = User.objects.create_user(username="buyer", password="password")
+        cls.listings = create_listings(cls.seller, 60)
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def test_homepage_query_count_is_independent_of_page_size(self):
+        for page_size in (5, 50):
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse("homepage"), {"page_size": page_size})
+            self.assertEqual(len(response.data["results"]), page_size)
+
+    def test_homepage_page_number_query_count_is_independent_of_page_size(self):
+        for page_size in (5, 50):
+            with self.assertNumQueries(2):
+                response = self.client.get(reverse("homepage"), {"page": 1, "page_size": page_size})
+            self.assertEqual(len(response.data["results"]), page_size)
+            self.assertEqual(response.data["count"], 60)
+
+    def test_homepage_thumbnail_is_first_image(self):
+        response = self.client.get(reverse("homepage"), {"page_size": 100})
+        for row in response.data["results"]:
+            self.assertTrue(row["thumbnail"].endswith(f"listings/{row['id']}/1.jpg"))
+
+    def test_my_page_query_count_is_fixed(self):
+        self.client.force_authenticate(self.seller)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("my-listings", args=["published"]))
+        self.assertEqual(len(response.data), 60)
+
+    def test_purchased_listings_query_count_is_fixed(self):
+        Purchase.objects.bulk_create(
+            Purchase(buyer=self.buyer, listing=listing, price_at_time_of_purchase=listing.price)
+            for listing in self.listings[:30]
+        )
+        self.client.force_authenticate(self.buyer)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("purchased-listings"))
+        self.assertEqual(len(response.data), 30)
+
+    def test_thumbnail_falls_back_without_annotation(self):
+        listing = FurnitureListing.objects.get(pk=self.listings[0].pk)
+        self.assertTrue(listing.thumbnail.endswith(f"listings/{listing.id}/1.jpg"))
+
+
+class FeedSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username="seller", password="password")
+        cls.buyer = User.objects.create_user(username="buyer", password="password")
+        cls.listings = create_listings(cls.seller, 4)
+        first, second, third, _ = cls.listings
+        FurnitureListing.objects.filter(pk=first.pk).update(price=Decimal("1234.5"), title=None)
+        FurnitureListing.objects.filter(pk=second.pk).update(
+            price=None, created_at=datetime(2024, 5, 1, 12, 0, tzinfo=dt_timezone.utc),
+        )
+        ListingImage.objects.filter(listing=third, order=1).update(renditions={
+            "webp": {"640": f"listings/{third.id}/1-640.webp", "160": f"listings/{third.id}/1-160.webp"},
+            "jpeg": {"160": f"listings/{third.id}/1-160.jpg"},
+        })
+        ListingImage.objects.filter(listing=cls.listings[3]).delete()
+        SavedListing.objects.create(user=cls.buyer, listing=first)
+
+    def assertRendersLikeListingListSerializer(self, queryset):
+        listings = list(queryset)
+        expected = ImageURLListSerializer(listings, child=ListingListSerializer()).data
+        rows = ListingListSerializer(list(queryset.feed_values("is_saved")), many=True).data
+        self.assertEqual(JSONRenderer().render(rows), JSONRenderer().render(expected))
+        instances = ListingListSerializer(listings, many=True).data
+        self.assertEqual(JSONRenderer().render(instances), JSONRenderer().render(expected))
+
+    def test_matches_the_field_by_field_output(self):
+        listings = FurnitureListing.objects.order_by("id").with_thumbnail()
+        self.assertRendersLikeListingListSerializer(listings.with_is_saved(self.buyer))
+        self.assertRendersLikeListingListSerializer(listings.with_is_saved(AnonymousUser()))
+
+    def test_endpoints_serve_the_same_rows(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+        expected = ImageURLListSerializer(
+            FurnitureListing.objects.with_thumbnail().with_is_saved(self.buyer).order_by("-created_at", "-id"),
+            child=ListingListSerializer(),
+        ).data
+        self.assertEqual(
+            json.loads(self.client.get(reverse("homepage"), {"page": 1}).content)["results"],
+            json.loads(JSONRenderer().render(expected)),
+        )
+
+
+class HomePageCursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username="seller", password="password")
+        cls.listings = create_listings(cls.seller, 25, images_per_listing=1)
+        # Ties on created_at must be broken by id without skipping rows.
+        FurnitureListing.objects.filter(pk__in=[l.pk for l in cls.listings[5:15]]).update(
+            created_at=cls.listings[5].created_at
+        )
+        cls.other = User.objects.create_user(username="other", password="password")
+        FurnitureListing.objects.filter(pk__in=[l.pk for l in cls.listings[3:20:2]]).update(
+            seller=cls.other
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def walk(self, page_size):
+        seen = []
+        url, params = reverse("homepage"), {"page_size": page_size}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("count", response.data)
+            seen.extend(row["id"] for row in response.data["results"])
+            url, params = response.data["next"], None
+        return seen
+
+    def test_windows_use_the_configured_cache_and_timeout(self):
+        feed_cache = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "feed"}
+        with override_settings(
+            CACHES={**settings.CACHES, "feed": feed_cache},
+            LISTINGS_FEED_CACHE="feed", LISTINGS_FEED_CACHE_TIMEOUT=60,
+        ):
+            feed = caches["feed"]
+            with mock.patch.object(feed, "set", wraps=feed.set) as set_window:
+                self.assertEqual(self.client.get(reverse("homepage")).status_code, 200)
+            self.assertTrue(set_window.call_args_list)
+            self.assertEqual({call.args[2] for call in set_window.call_args_list}, {60})
+            feed.clear()
+
+    def test_cursor_walk_returns_every_listing_once_newest_first(self):
+        expected = list(
+            FurnitureListing.objects.order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        for page_size in (1, 4, 7, 25):
+            self.assertEqual(self.walk(page_size), expected)
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get(reverse("homepage"), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_signed_in_walk_skips_own_listings(self):
+        expected = list(
+            FurnitureListing.objects.exclude(seller=self.other)
+            .order_by("-created_at", "-id")
+            .values_list("id", flat=True)
+        )
+        self.client.force_authenticate(self.other)
+        for page_size in (1, 4, 7, 25):
+            self.assertEqual(self.walk(page_size), expected)
+
+    def test_every_user_reads_the_cached_windows(self):
+        self.walk(4)
+        with self.assertNumQueries(0):
+            self.walk(4)
+        # Signed-in users only look up which listings on the page they saved.
+        self.client.force_authenticate(self.other)
+        with self.assertNumQueries(4):
+            self.walk(4)
+
+    def test_committed_changes_invalidate_the_feed(self):
+        self.walk(4)
+        with self.captureOnCommitCallbacks(execute=True):
+            listing = FurnitureListing.objects.create(seller=self.seller, title="New", status="published")
+        self.assertEqual(self.walk(4)[0], listing.pk)
+
+
+class ListingSearchTests(TestCase):
+    def setUp(self):
+        get_search_backend.cache_clear()
+        self.addCleanup(get_search_backend.cache_clear)
+        self.seller = User.objects.create_user(username="seller", password="password")
+        self.oak_table = self.create("Oak dining table", "Seats six.", FurnitureListing.Category.TABLE)
+        self.oak_chair = self.create("Kitchen chair", "Solid oak, oak legs.", FurnitureListing.Category.CHAIR)
+        self.sofa = self.create("Grey sofa", "Three seater.", FurnitureListing.Category.SOFA)
+
+    def create(self, title, description, category, status="published"):
+        return FurnitureListing.objects.create(
+            seller=self.seller,
+            title=title,
+            description=description,
+            price=Decimal("50.00"),
+            category=category,
+            status=status,
+        )
+
+    def search(self, query, **params):
+        response = self.client.get(reverse("listing-search"), {"q": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row["id"] for row in response.data["results"]]
+
+    def test_title_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search("oak "), [self.oak_table.id, self.oak_chair.id])
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.search("oak chair "), [self.oak_chair.id])
+
+    def test_last_word_matches_as_prefix(self):
+        self.assertEqual(self.search("gr"), [self.sofa.id])
+        self.assertEqual(self.search("sea"), [self.sofa.id, self.oak_table.id])
+
+    def test_category_label_is_searchable(self):
+        self.assertEqual(self.search("sofa "), [self.sofa.id])
+
+    def test_index_follows_edits_and_status(self):
+        self.sofa.title = "Blue sofa"
+        self.sofa.save()
+        self.assertEqual(self.search("grey "), [])
+        self.assertEqual(self.search("blue "), [self.sofa.id])
+
+        self.sofa.status = FurnitureListing.Status.DRAFT
+        self.sofa.save()
+        self.assertEqual(self.search("blue "), [])
+
+    def test_results_are_cursor_paginated(self):
+        for i in range(5):
+            self.create(f"Oak shelf {i}", "", FurnitureListing.Category.BOOKSHELF)
+        expected = self.search("oak", page_size=100)
+        seen, url, params = [], reverse("listing-search"), {"q": "oak", "page_size": 2}
+        while url:
+            response = self.client.get(url, params)
+            seen.extend(row["id"] for row in response.data["results"])
+            url, params = response.data["next"], None
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(seen), 7)
+
+
+@override_settings(LISTINGS_SEARCH_BACKEND="listings.search.InMemorySearchBackend")
+class InMemoryListingSearchTests(ListingSearchTests):
+    def test_database_index_is_not_written(self):
+        self.assertFalse(ListingSearchTerm.objects.exists())
+
+
+class ListingFacetsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username="seller", password="password")
+        listings = create_listings(cls.seller, 6, images_per_listing=0)
+        for listing, (category, condition, price) in zip(listings, [
+            ("CHAIR", "good", "20.00"),
+            ("CHAIR", "fair", "75.00"),
+            ("TABLE", "good", "75.00"),
+            ("TABLE", "like_new", "300.00"),
+            ("SOFA", "good", "1500.00"),
+            ("SOFA", "good", "1500.00"),
+        ]):
+            listing.category, listing.condition, listing.price = category, condition, Decimal(price)
+        FurnitureListing.objects.bulk_update(listings, ["category", "condition", "price"])
+        listings[-1].status = FurnitureListing.Status.DRAFT
+        listings[-1].save()
+
+    def setUp(self):
+        cache.clear()
+
+    def get_facets(self, **params):
+        response = self.client.get(reverse("listing-facets"), params)
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        return {
+            facet: {bucket["value"]: bucket["count"] for bucket in data[facet] if bucket["count"]}
+            for facet in ("category", "condition", "price")
+        } | {"total": data["total"]}
+
+    def test_counts_published_listings_in_one_query(self):
+        with self.assertNumQueries(1):
+            facets = self.get_facets()
+        self.assertEqual(facets, {
+            "total": 5,
+            "category": {"CHAIR": 2, "TABLE": 2, "SOFA": 1},
+            "condition": {"good": 3, "fair": 1, "like_new": 1},
+            "price": {"0-50": 1, "50-100": 2, "250-500": 1, "1000+": 1},
+        })
+
+    def test_filters_apply_to_counts(self):
+        facets = self.get_facets(category=["CHAIR", "TABLE"], max_price="100")
+        self.assertEqual(facets["total"], 3)
+        self.assertEqual(facets["condition"], {"good": 2, "fair": 1})
+
+    def test_counts_are_cached_until_a_listing_changes(self):
+        self.get_facets()
+        with self.assertNumQueries(0):
+            self.get_facets()
+
+        listing = FurnitureListing.objects.filter(category="SOFA", status="published").get()
+        listing.category = FurnitureListing.Category.BED
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.save()
+        facets = self.get_facets()
+        self.assertEqual(facets["category"], {"CHAIR": 2, "TABLE": 2, "BED": 1})
+
+    def test_invalid_price_is_rejected(self):
+        response = self.client.get(reverse("listing-facets"), {"min_price": "cheap"})
+        self.assertEqual(response.status_code, 400)
+
+
+class FacetsInvalidationTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        seller = User.objects.create_user(username="seller", password="password")
+        self.listing = create_listings(seller, 1, images_per_listing=0)[0]
+
+    def category_counts(self):
+        # Read by another request, on its own connection
+        counts = []
+
+        def read():
+            try:
+                data = self.client.get(reverse("listing-facets")).data
+                counts.append({bucket["value"]: bucket["count"] for bucket in data["category"] if bucket["count"]})
+            finally:
+                close_old_connections()
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        return counts[0]
+
+    def test_counts_read_during_a_save_are_not_kept(self):
+        with transaction.atomic():
+            self.listing.category = FurnitureListing.Category.BED
+            self.listing.save()
+            self.assertEqual(self.category_counts(), {"CHAIR": 1})
+        self.assertEqual(self.category_counts(), {"BED": 1})
+
+    def test_rolled_back_saves_keep_the_counts(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.listing.category = FurnitureListing.Category.BED
+            self.listing.save()
+            self.assertEqual(self.category_counts(), {"CHAIR": 1})
+            raise RuntimeError
+        self.assertEqual(self.category_counts(), {"CHAIR": 1})
+
+
+LOCAL_PIPELINE = {"BACKEND": "listings.tasks.LocalImagePipeline", "OPTIONS": {"max_attempts": 3}}
+
+
+@override_settings(LISTINGS_IMAGE_PIPELINE=LOCAL_PIPELINE)
+class ImagePipelineTests(InMemoryImageStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user(username="seller", password="password")
+
+    def create_listing(self, count=1, **upload):
+        files = {f"image_{order}": image_upload(**upload) for order in range(1, count + 1)}
+        return FurnitureListing.objects.create_listing_with_images(
+            {"seller": self.seller, "title": "Lamp"},
+            [{"order": order} for order in range(1, count + 1)],
+            files,
+        )
+
+    def test_upload_is_stored_raw_and_compressed_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            listing = self.create_listing()
+        image = listing.images.get()
+        self.assertEqual(image.status, ListingImage.Status.PROCESSING)
+        self.assertTrue(image.image.name.endswith(".png"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for callback in callbacks:
+                callback()
+        image.refresh_from_db()
+        self.assertEqual(image.status, ListingImage.Status.READY)
+        self.assertTrue(image.image.name.endswith(".jpg"))
+        self.assertEqual(
+            sorted(self.stored_files(listing)), sorted(name.split("/")[-1] for name in image.stored_names())
+        )
+        with Image.open(self.storage.open(image.image.name)) as compressed:
+            self.assertEqual((compressed.format, compressed.size), ("JPEG", (1080, 1080)))
+
+    @override_settings(LISTINGS_IMAGE_PIPELINE=None)
+    def test_inline_compression_rejects_oversized_and_invalid_images(self):
+        client = APIClient()
+        client.force_authenticate(self.seller)
+        not_an_image = SimpleUploadedFile("photo.png", b"not an image", content_type="image/png")
+        for file in (image_upload(size=(300, 200)), not_an_image):
+            with mock.patch("listings.images.MAX_SOURCE_PIXELS", 300 * 100):
+                response = client.post(
+                    reverse("listing-list"),
+                    {"title": "Lamp", "image_updates": json.dumps([{"order": 1}]), "image_1": file},
+                    format="multipart",
+                )
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("image_updates", response.data)
+        self.assertFalse(FurnitureListing.objects.exists())
+
+    def test_renditions_are_rendered_in_every_format_and_size(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            listing = self.create_listing()
+        image = listing.images.get()
+        self.assertEqual(set(image.renditions), set(rendition_formats()))
+        for format_name, widths in image.renditions.items():
+            self.assertEqual(sorted(map(int, widths)), sorted(RENDITION_SIZES))
+            for width, name in widths.items():
+                with Image.open(self.storage.open(name)) as rendition:
+                    self.assertEqual(rendition.size, (int(width), int(width)))
+                    self.assertEqual(rendition.format.lower(), format_name)
+
+        listing.status = FurnitureListing.Status.PUBLISHED
+        listing.save()
+        row = self.client.get(reverse("homepage")).data["results"][0]
+        self.assertIn(" 160w, ", row["thumbnail_srcset"]["webp"])
+        self.assertTrue(row["thumbnail_srcset"]["jpeg"].endswith(f"{image.image.name} 1080w"))
+
+    def test_deleting_an_image_removes_its_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            listing = self.create_listing()
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.images.get().delete()
+        self.assertEqual(self.stored_files(listing), [])
+
+    def test_large_jpeg_is_draft_decoded_to_full_size_output(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            listing = self.create_listing(name="photo.jpg", size=(4800, 3600), mode="RGB", format="JPEG")
+        image = listing.images.get()
+        with Image.open(self.storage.open(image.image.name)) as compressed:
+            self.assertEqual(compressed.size, (1080, 1080))
+
+    def test_oversized_image_fails_without_retrying(self):
+        with mock.patch("listings.images.MAX_SOURCE_PIXELS", 1000 * 1000):
+            with self.captureOnCommitCallbacks(execute=True):
+                listing = self.create_listing()
+        image = listing.images.get()
+        self.assertEqual((image.status, image.attempts), (ListingImage.Status.FAILED, 1))
+
+    def test_processing_images_are_not_used_as_thumbnails(self):
+        with self.captureOnCommitCallbacks():
+            listing = self.create_listing()
+        self.assertIsNone(FurnitureListing.objects.with_thumbnail().get(pk=listing.pk).thumbnail)
+
+    def test_failed_job_is_retried(self):
+        with mock.patch("listings.tasks.process_image", side_effect=[OSError("boom"), ProcessedImage(io.BytesIO(b"jpeg"), {})]):
+            with self.captureOnCommitCallbacks(execute=True):
+                listing = self.create_listing()
+        image = listing.images.get()
+        self.assertEqual((image.status, image.attempts), (ListingImage.Status.READY, 2))
+
+    def test_image_is_marked_failed_after_last_attempt(self):
+        with mock.patch("listings.tasks.process_image", side_effect=OSError("boom")):
+            with self.captureOnCommitCallbacks(execute=True):
+                listing = self.create_listing()
+        image = listing.images.get()
+        self.assertEqual((image.status, image.attempts), (ListingImage.Status.FAILED, 3))
+
+    @override_settings(LISTINGS_IMAGE_PIPELINE=None)
+    def test_images_are_compressed_inline_without_a_pipeline(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            listing = self.create_listing()
+        self.assertFalse([callback for callback in callbacks if callback.__name__ == "submit"])
+        image = listing.images.get()
+        self.assertEqual(image.status, ListingImage.Status.READY)
+        self.assertTrue(image.image.name.endswith(".jpg"))
+
+
+@override_settings(LISTINGS_IMAGE_PIPELINE=LOCAL_PIPELINE)
+class ConcurrentImageStorageTests(InMemoryImageStorageMixin, TestCase):
+    storage_class = SlowInMemoryStorage
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user(username="seller", password="password")
+
+    def create_listing(self, count):
+        return FurnitureListing.objects.create_listing_with_images(
+            {"seller": self.seller, "title": "Shelves"},
+            [{"order": order} for order in range(1, count + 1)],
+            {f"image_{order}": image_upload(f"{order}.png", size=(40, 40)) for order in range(1, count + 1)},
+        )
+
+    def test_uploads_run_concurrently_and_rows_are_inserted_at_once(self):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks():
+            listing = self.create_listing(8)
+        inserts = [q for q in queries if q["sql"].startswith('INSERT INTO "listings_listingimage"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(listing.images.count(), 8)
+        self.assertGreater(self.storage.max_in_flight, 1)
+
+    def test_failed_upload_removes_stored_files(self):
+        self.storage.fail_on = 3
+        with self.assertRaises(OSError):
+            self.create_listing(6)
+        self.assertFalse(ListingImage.objects.exists())
+        for directory in self.storage.listdir("listings")[0]:
+            self.assertEqual(self.storage.listdir(f"listings/{directory}"), ([], []))
+
+    def assertNothingStored(self):
+        directories = self.storage.listdir("listings")[0] if self.storage.exists("listings") else []
+        for directory in directories:
+            self.assertEqual(self.storage.listdir(f"listings/{directory}"), ([], []))
+
+    def test_unreachable_status_uploads_nothing(self):
+        # No description, so the listing cannot be published
+        with self.assertRaises(InvalidTransition):
+            FurnitureListing.objects.create_listing_with_images(
+                {"seller": self.seller, "title": "Shelves", "price": 50, "status": "published"},
+                [{"order": 1}], {"image_1": image_upload("1.png", size=(40, 40))},
+            )
+        self.assertFalse(FurnitureListing.objects.exists())
+        self.assertNothingStored()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            listing = FurnitureListing.objects.create(seller=self.seller, title="Shelves", price=50, status="draft")
+        with self.assertRaises(InvalidTransition):
+            listing.update_with_images(
+                {"status": "published"}, [{"order": 1}], {"image_1": image_upload("1.png", size=(40, 40))}
+            )
+        self.assertFalse(ListingImage.objects.exists())
+        self.assertNothingStored()
+
+    def test_failed_transition_removes_uploaded_files(self):
+        # Another request changes the status between the check and the UPDATE
+        with mock.patch.object(FurnitureListing.objects, "change_status", return_value=False):
+            with self.assertRaises(InvalidTransition):
+                FurnitureListing.objects.create_listing_with_images(
+                    {"seller": self.seller, "title": "Shelves", "description": "Pine", "price": 50,
+                     "status": "published"},
+                    [{"order": 1}, {"order": 2}],
+                    {f"image_{order}": image_upload(f"{order}.png", size=(40, 40)) for order in (1, 2)},
+                )
+        self.assertFalse(ListingImage.objects.exists())
+        self.assertNothingStored()
+
+    def test_update_deletes_images_concurrently(self):
+        with self.captureOnCommitCallbacks():
+            listing = self.create_listing(6)
+        self.storage.max_in_flight = 0
+        image_ids = list(listing.images.values_list("id", flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.update_with_images(
+                {}, [{"id": image_id, "delete": True} for image_id in image_ids[:4]], {}
+            )
+        self.assertEqual(listing.images.count(), 2)
+        self.assertEqual(len(self.stored_files(listing)), 2)
+        self.assertGreater(self.storage.max_in_flight, 1)
+
+    def test_deleting_a_listing_deletes_its_image_files(self):
+        with self.captureOnCommitCallbacks():
+            listing = self.create_listing(3)
+        self.assertEqual(len(self.stored_files(listing)), 3)
+        listing_id = listing.id
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.delete()
+        self.assertEqual(self.storage.listdir(f"listings/{listing_id}"), ([], []))
+
+
+@override_settings(LISTINGS_IMAGE_PIPELINE=None)
+class StorageDeletionTests(InMemoryImageStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user(username="seller", password="password")
+        self.listing = FurnitureListing.objects.create_listing_with_images(
+            {"seller": self.seller, "title": "Wardrobe"},
+            [{"order": 1}, {"order": 2}],
+            {"image_1": image_upload("1.png"), "image_2": image_upload("2.png")},
+        )
+
+    def stored_names(self):
+        return sorted(name for image in self.listing.images.all() for name in image.stored_names())
+
+    def test_files_are_deleted_after_commit(self):
+        names = self.stored_names()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.listing.delete()
+        self.assertEqual(sorted(StorageDeletion.objects.values_list("name", flat=True)), names)
+        self.assertEqual(len(self.storage.listdir("listings/1")[1]), len(names))
+
+        for callback in callbacks:
+            callback()
+        self.assertFalse(StorageDeletion.objects.exists())
+        self.assertEqual(self.storage.listdir("listings/1"), ([], []))
+
+    def test_rolled_back_delete_keeps_files(self):
+        names = self.stored_names()
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.listing.images.all().delete()
+                raise RuntimeError
+        self.assertEqual(self.listing.images.count(), 2)
+        self.assertFalse(StorageDeletion.objects.exists())
+        self.assertEqual(len(self.stored_files(self.listing)), len(names))
+
+    def test_failed_deletes_stay_in_outbox_until_flushed(self):
+        names = self.stored_names()
+        with mock.patch.object(self.storage, "delete", side_effect=OSError("S3 unavailable")):
+            with self.assertLogs("listings.storage", "ERROR"), self.captureOnCommitCallbacks(execute=True):
+                self.listing.images.all().delete()
+        self.assertEqual(StorageDeletion.objects.count(), len(names))
+
+        call_command("flush_storage_deletions", older_than=0, stdout=io.StringIO())
+        self.assertFalse(StorageDeletion.objects.exists())
+        self.assertEqual(self.stored_files(self.listing), [])
+
+    def test_s3_deletes_are_batched(self):
+        storage = S3Boto3Storage(bucket_name="listings")
+        storage._bucket = mock.Mock()
+        storage._bucket.delete_objects.side_effect = lambda Delete: {
+            "Errors": [
+                {"Key": item["Key"], "Code": "AccessDenied"}
+                for item in Delete["Objects"] if item["Key"] == "listings/1/7.jpg"
+            ]
+        }
+        names = [f"listings/1/{i}.jpg" for i in range(2500)]
+
+        with self.assertLogs("listings.storage", "ERROR"):
+            failed = delete_objects(storage, names)
+        batch_sizes = sorted(
+            len(call.kwargs["Delete"]["Objects"]) for call in storage._bucket.delete_objects.call_args_list
+        )
+        self.assertEqual(batch_sizes, [500, 1000, 1000])
+        self.assertEqual(failed, ["listings/1/7.jpg"])
+
+
+class DirectUploadStorage(InMemoryStorage):
+    """In-memory stand-in for the bucket that presigns browser uploads itself."""
+
+    def presign_upload(self, key, content_type, max_size, expires_in):
+        return {"url": "https://bucket.test/", "fields": {"key": key, "Content-Type": content_type}}
+
+    def receive(self, slot, file):
+        """Act as the bucket receiving the browser's POST for `slot`."""
+        self.save(slot["fields"]["key"], file)
+
+
+@override_settings(LISTINGS_IMAGE_PIPELINE=None)
+class DirectUploadTests(InMemoryImageStorageMixin, TestCase):
+    storage_class = DirectUploadStorage
+
+    def setUp(self):
+        super().setUp()
+        self.seller = User.objects.create_user(username="seller", password="password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def upload(self, user=None):
+        slot = create_upload_slot(user or self.seller, "image/png")
+        self.storage.receive(slot, image_upload())
+        return slot
+
+    def create_listing(self, image_updates):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse("listing-list"),
+                {"title": "Armchair", "image_updates": image_updates},
+                format="json",
+            )
+
+    def test_slots_are_issued_under_the_temp_prefix(self):
+        response = self.client.post(
+            reverse("upload-slots"), {"content_types": ["image/jpeg", "image/png"]}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        keys = [slot["key"] for slot in response.data["uploads"]]
+        self.assertTrue(all(key.startswith(f"{UPLOAD_PREFIX}/") for key in keys))
+        self.assertEqual([key.rsplit(".", 1)[1] for key in keys], ["jpg", "png"])
+        self.assertEqual(response.data["uploads"][0]["fields"]["key"], keys[0])
+
+    def test_slots_are_only_issued_for_images(self):
+        response = self.client.post(
+            reverse("upload-slots"), {"content_types": ["text/html"]}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_finalize_attaches_uploads_and_compresses_them(self):
+        slot = self.upload()
+        response = self.create_listing([{"order": 1, "upload": slot["token"]}])
+        self.assertEqual(response.status_code, 201)
+
+        image = ListingImage.objects.get()
+        self.assertEqual(image.status, ListingImage.Status.READY)
+        self.assertTrue(image.image.name.startswith(f"listings/{image.listing_id}/"))
+        self.assertFalse(self.storage.exists(slot["key"]))
+        self.assertFalse(StorageDeletion.objects.exists())
+
+    def test_finalize_rejects_another_users_upload(self):
+        other = User.objects.create_user(username="other", password="password")
+        slot = self.upload(user=other)
+        response = self.create_listing([{"order": 1, "upload": slot["token"]}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(FurnitureListing.objects.exists())
+
+    def test_finalize_rejects_missing_and_reused_uploads(self):
+        slot = create_upload_slot(self.seller, "image/png")
+        self.assertEqual(self.create_listing([{"order": 1, "upload": slot["token"]}]).status_code, 400)
+
+        slot = self.upload()
+        # Left unprocessed, so the raw upload is still in the bucket
+        with mock.patch("listings.models.queue_image_processing"):
+            self.assertEqual(self.create_listing([{"order": 1, "upload": slot["token"]}]).status_code, 201)
+        response = self.create_listing([{"order": 1, "upload": slot["token"]}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("already attached", str(response.data["image_updates"]))
+
+    def test_finalize_rejects_an_upload_used_twice(self):
+        slot = self.upload()
+        response = self.create_listing([{"order": 1, "upload": slot["token"]}, {"order": 2, "upload": slot["token"]}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("already attached", str(response.data["image_updates"]))
+        self.assertFalse(FurnitureListing.objects.exists())
+        self.assertTrue(self.storage.exists(slot["key"]))
+
+    def test_concurrent_claims_attach_an_upload_once(self):
+        slot = self.upload()
+        other = FurnitureListing.objects.create(seller=self.seller, title="Lamp")
+
+        def claim_then_lose_the_race(user, token, claimed):
+            key = claim_upload(user, token, claimed)
+            # Another request attaches the same upload after the check passed
+            ListingImage.objects.bulk_create([ListingImage(listing=other, image=key, image_name="other.png", order=1)])
+            return key
+
+        # The budget also counts the other request's INSERT here
+        budget = ListingViewSet.query_budget["create"] + 1
+        with mock.patch("listings.models.claim_upload", claim_then_lose_the_race), \
+                mock.patch.dict(ListingViewSet.query_budget, {"create": budget}):
+            response = self.create_listing([{"order": 1, "upload": slot["token"]}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("already attached", str(response.data["image_updates"]))
+        self.assertFalse(FurnitureListing.objects.filter(title="Armchair").exists())
+
+    def test_purge_deletes_only_abandoned_uploads(self):
+        abandoned = self.upload()
+        attached = self.upload()
+        FurnitureListing.objects.create_listing_with_images(
+            {"seller": self.seller, "title": "Lamp"}, [{"order": 1, "upload": attached["token"]}], {}
+        )
+
+        call_command("purge_temp_uploads", older_than=0, stdout=io.StringIO())
+        self.assertFalse(self.storage.exists(abandoned["key"]))
+        self.assertTrue(self.storage.exists(attached["key"]))
+
+    def test_s3_slots_are_presigned_posts(self):
+        storage = S3Boto3Storage(bucket_name="listings", region_name="us-east-1")
+        post = presign_upload(storage, "temp/photo.png", "image/png")
+        self.assertIn("listings", post["url"])
+        self.assertEqual(post["fields"]["key"], "temp/photo.png")
+        self.assertEqual(post["fields"]["Content-Type"], "image/png")
+        self.assertIn("policy", post["fields"])
+
+
+class ImageURLCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username="seller", password="password")
+        cls.listings = create_listings(cls.seller, 20)
+
+    def setUp(self):
+        self.client = APIClient()
+        get_image_url_cache().clear()
+        self.storage = ListingImage._meta.get_field("image").storage
+        patcher = mock.patch.object(self.storage, "url", wraps=self.storage.url)
+        self.url = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_urls_are_memoized_until_the_ttl_expires(self):
+        cache = ImageURLCache(ttl=60)
+        with mock.patch("listings.image_urls.time.monotonic", return_value=1000):
+            first = cache.get(self.storage, "listings/1/1.jpg")
+            self.assertEqual(cache.get(self.storage, "listings/1/1.jpg"), first)
+        self.assertEqual(self.url.call_count, 1)
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "entries": 1})
+
+        with mock.patch("listings.image_urls.time.monotonic", return_value=1061):
+            cache.get(self.storage, "listings/1/1.jpg")
+        self.assertEqual(self.url.call_count, 2)
+
+    def test_cache_is_bounded(self):
+        cache = ImageURLCache(ttl=60, max_entries=10)
+        cache.get_many(self.storage, [f"listings/1/{i}.jpg" for i in range(25)])
+        self.assertEqual(cache.stats()["entries"], 10)
+
+    def test_feed_page_builds_each_url_once(self):
+        response = self.client.get(reverse("homepage"), {"page_size": 20})
+        self.assertEqual(len(response.data["results"]), 20)
+        self.assertEqual(self.url.call_count, 20)
+
+        cache.clear()  # Rebuild the feed window, this time from memoized URLs
+        self.client.get(reverse("homepage"), {"page_size": 20})
+        self.assertEqual(self.url.call_count, 20)
+        # One lookup per URL and build: 20 misses the first time, 20 hits the second
+        self.assertEqual(get_image_url_cache().stats(), {"hits": 20, "misses": 20, "entries": 20})
+
+
+class ListingDetailCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username="seller", password="password")
+        cls.listing = create_listings(cls.seller, 1)[0]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+        self.cache = get_detail_cache()
+        self.cache.clear()
+        self.url = reverse("listing-details", args=[self.listing.pk])
+
+    def test_repeat_reads_are_served_from_cache(self):
+        first = self.client.get(self.url)
+        self.assertEqual(len(first.data["images"]), 3)
+        with self.assertNumQueries(1):
+            second = self.client.get(self.url)
+        self.assertEqual(second.data, first.data)
+
+    def test_viewset_retrieve_shares_the_cache(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("listing-detail", args=[self.listing.pk]))
+        self.assertEqual(response.data["title"], self.listing.title)
+
+    def test_listing_save_invalidates(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            listing = FurnitureListing.objects.get(pk=self.listing.pk)
+            listing.title = "Renamed"
+            listing.save()
+        self.assertEqual(self.client.get(self.url).data["title"], "Renamed")
+
+    def test_image_changes_invalidate(self):
+        self.client.get(self.url)
+        image = self.listing.images.get(order=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            image.order = 4
+            image.save()
+        orders = [row["order"] for row in self.client.get(self.url).data["images"]]
+        self.assertEqual(orders, [2, 3, 4])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listing.images.filter(order__gt=2).delete()
+        self.assertEqual(len(self.client.get(self.url).data["images"]), 1)
+
+    def test_unpublished_listings_are_not_cached(self):
+        FurnitureListing.objects.filter(pk=self.listing.pk).update(status="draft")
+        with self.assertRaises(FurnitureListing.DoesNotExist):
+            get_listing_detail(self.listing.pk, mock.Mock())
+        self.assertIsNone(self.cache.get(detail_key(self.listing.pk)))
+
+    def test_only_one_request_refreshes_an_entry(self):
+        build = mock.Mock(return_value={"title": "Cached"})
+        get_listing_detail(self.listing.pk, build)
+
+        # Due for refresh while another request holds the lock: serve the entry.
+        entry = self.cache.get(detail_key(self.listing.pk))
+        self.cache.set(detail_key(self.listing.pk), {**entry, "refresh_at": 0})
+        self.cache.add(lock_key(self.listing.pk), 1)
+        self.assertEqual(get_listing_detail(self.listing.pk, build), {"title": "Cached"})
+        self.assertEqual(build.call_count, 1)
+
+        # Released: the next request refreshes it.
+        self.cache.delete(lock_key(self.listing.pk))
+        get_listing_detail(self.listing.pk, build)
+        self.assertEqual(build.call_count, 2)
+
+    @mock.patch("listings.detail_cache.LOCK_WAIT", 0.1)
+    def test_cold_miss_waits_for_the_lock_holder(self):
+        self.cache.add(lock_key(self.listing.pk), 1)
+        build = mock.Mock(return_value={"title": "Uncached"})
+        self.assertEqual(get_listing_detail(self.listing.pk, build), {"title": "Uncached"})
+        # Gave up waiting: built once, without caching over the lock holder.
+        self.assertEqual(build.call_count, 1)
+        self.assertIsNone(self.cache.get(detail_key(self.listing.pk)))
+
+
+class PurchaseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username="seller", password="password")
+        cls.buyer = User.objects.create_user(username="buyer", password="password")
+        cls.listing = create_listings(cls.seller, 1, images_per_listing=0)[0]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+        self.url = reverse("listing-purchase", args=[self.listing.pk])
+
+    def test_purchase_marks_the_listing_sold(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.status, "sold")
+        purchase = Purchase.objects.get(listing=self.listing)
+        self.assertEqual(purchase.buyer, self.buyer)
+        self.assertEqual(purchase.price_at_time_of_purchase, self.listing.price)
+
+        # Only the changed columns are written, and only while still published.
+        update = next(
+            query["sql"] for query in queries.captured_queries
+            if query["sql"].startswith('UPDATE "listings_furniturelisting"')
+        )
+        assignments = update.split(" SET ")[1].split(" WHERE ")[0]
+        self.assertEqual(assignments.count("="), 2)
+        self.assertIn('"status" = ', assignments)
+        self.assertIn('"updated_at" = ', assignments)
+        self.assertIn('"status" = ', update.split(" WHERE ")[1])
+
+    def test_sold_listing_cannot_be_purchased_again(self):
+        self.client.post(self.url)
+        other = User.objects.create_user(username="other", password="password")
+        self.client.force_authenticate(other)
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["error"], "This item has already been sold")
+        self.assertEqual(Purchase.objects.count(), 1)
+
+    def test_seller_and_unpublished_listings_are_rejected(self):
+        self.client.force_authenticate(self.seller)
+        response = self.client.post(self.url)
+        self.assertEqual(response.data["error"], "You cannot buy your own listing")
+
+        FurnitureListing.objects.filter(pk=self.listing.pk).update(status="draft")
+        self.client.force_authenticate(self.buyer)
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["error"], "This item is not available for purchase")
+        self.assertFalse(Purchase.objects.exists())
+
+    def test_purchase_removes_the_listing_from_search_and_the_feed(self):
+        get_search_backend().index(self.listing)
+        self.assertEqual(len(self.client.get(reverse("homepage")).data["results"]), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url)
+        self.assertFalse(get_search_backend().search(self.listing.title).exists())
+        self.assertEqual(self.client.get(reverse("homepage")).data["results"], [])
+
+
+class PurchaseConcurrencyTests(TransactionTestCase):
+    buyers = 200
+
+    def setUp(self):
+        cache.clear()
+        seller = User.objects.create_user(username="seller", password="password")
+        User.objects.bulk_create(
+            User(username=f"buyer{number}") for number in range(self.buyers)
+        )
+        self.listing = create_listings(seller, 1, images_per_listing=0)[0]
+
+    def test_exactly_one_of_many_simultaneous_buyers_wins(self):
+        url = reverse("listing-purchase", args=[self.listing.pk])
+        buyers = list(User.objects.filter(username__startswith="buyer"))
+        barrier = threading.Barrier(len(buyers))
+        responses = []
+
+        def purchase(buyer):
+            client = APIClient()
+            client.force_authenticate(buyer)
+            try:
+                barrier.wait()
+                responses.append(client.post(url))
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=purchase, args=(buyer,)) for buyer in buyers]
+        # Every loser's 400 is logged.
+        with self.assertLogs("django.request", "WARNING"):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        codes = [response.status_code for response in responses]
+        self.assertEqual(len(codes), len(buyers))
+        self.assertEqual(codes.count(200), 1)
+        self.assertEqual(codes.count(400), len(buyers) - 1)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.status, "sold")
+        purchase = Purchase.objects.get(listing=self.listing)
+        winner = next(response for response in responses if response.status_code == 200)
+        self.assertEqual(winner.wsgi_request.user, purchase.buyer)
+
+
+class ListingCounterTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username="seller", password="password")
+        self.buyer = User.objects.create_user(username="buyer", password="password")
+
+    def assertCounters(self, active, sold):
+        self.seller.refresh_from_db()
+        self.assertEqual(
+            (self.seller.number_of_active_listings, self.seller.number_of_sold_listings),
+            (active, sold),
+        )
+
+    def test_status_transitions_move_the_counters(self):
+        listing = FurnitureListing.objects.create(seller=self.seller, title="Chair", price=Decimal("10.00"))
+        self.assertCounters(0, 0)
+
+        listing.status = FurnitureListing.Status.PUBLISHED
+        listing.save()
+        self.assertCounters(1, 0)
+        # Saving again without a status change moves nothing.
+        listing.title = "Armchair"
+        listing.save()
+        self.assertCounters(1, 0)
+
+        listing = FurnitureListing.objects.get(pk=listing.pk)
+        FurnitureListing.objects.purchase_listing(listing, self.buyer)
+        self.assertCounters(0, 1)
+        listing.save()
+        self.assertCounters(0, 1)
+
+        listing.delete()
+        self.assertCounters(0, 0)
+
+    def test_counters_never_go_below_zero(self):
+        # Published through bulk_create, so never counted.
+        listing = create_listings(self.seller, 1, images_per_listing=0)[0]
+        FurnitureListing.objects.get(pk=listing.pk).delete()
+        self.assertCounters(0, 0)
+
+    def test_reconcile_recomputes_drifted_counters(self):
+        create_listings(self.seller, 3, images_per_listing=0)
+        create_listings(self.seller, 2, images_per_listing=0, status="sold")
+        create_listings(self.buyer, 1, images_per_listing=0, status="draft")
+        User.objects.filter(pk=self.buyer.pk).update(number_of_active_listings=4)
+
+        out = io.StringIO()
+        with self.assertNumQueries(1):
+            call_command("reconcile_listing_counters", stdout=out)
+        self.assertIn("Corrected the listing counters of 2 users", out.getvalue())
+        self.assertCounters(3, 2)
+        self.buyer.refresh_from_db()
+        self.assertEqual(self.buyer.number_of_active_listings, 0)
+
+        out = io.StringIO()
+        call_command("reconcile_listing_counters", stdout=out)
+        self.assertIn("of 0 users", out.getvalue())
+
+
+class ListingTransitionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user(username="seller", password="password")
+        self.listing = create_listings(self.seller, 1, images_per_listing=1, status="draft")[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def transition(self, name):
+        return self.client.post(reverse(f"listing-{name}", args=[self.listing.pk]))
+
+    def test_transitions_follow_the_state_machine(self):
+        self.assertEqual(self.transition("publish").data["status"], "published")
+        self.assertEqual(self.transition("reserve").data["status"], "in_progress")
+        response = self.transition("publish")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["error"], "Cannot publish a listing that is in progress")
+        self.assertEqual(self.transition("complete").data["status"], "completed")
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.status, "completed")
+
+    def test_only_the_seller_can_transition(self):
+        self.client.force_authenticate(User.objects.create_user(username="other", password="password"))
+        self.assertEqual(self.transition("publish").status_code, 403)
+
+    def test_publishing_requires_an_image(self):
+        self.listing.images.all().delete()
+        response = self.transition("publish")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("at least one image", response.data["error"])
+
+    def test_can_be_published_uses_prefetched_images(self):
+        listing = FurnitureListing.objects.prefetch_related("images").get(pk=self.listing.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(listing.can_be_published())
+
+    def test_transition_writes_the_status_once_and_sends_one_event(self):
+        handler = mock.Mock()
+        listing_status_changed.connect(handler)
+        self.addCleanup(listing_status_changed.disconnect, handler)
+        listing = FurnitureListing.objects.prefetch_related("images").get(pk=self.listing.pk)
+
+        with CaptureQueriesContext(connection) as queries:
+            listing.publish()
+        updates = [query["sql"] for query in queries.captured_queries if query["sql"].startswith("UPDATE")]
+        listing_update = [sql for sql in updates if sql.startswith('UPDATE "listings_furniturelisting"')]
+        self.assertEqual(len(listing_update), 1)
+        self.assertEqual(listing_update[0].split(" SET ")[1].split(" WHERE ")[0].count("="), 2)
+        handler.assert_called_once()
+        self.assertEqual(handler.call_args.kwargs["previous_status"], "draft")
+
+    def test_stale_listing_cannot_transition(self):
+        stale = FurnitureListing.objects.get(pk=self.listing.pk)
+        self.listing.publish()
+        with self.assertRaises(InvalidTransition):
+            stale.publish()
+
+    def test_updates_save_only_changed_fields_and_validate_status(self):
+        url = reverse("listing-detail", args=[self.listing.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, {"title": "Renamed", "price": "100.00"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        update = next(
+            query["sql"] for query in queries.captured_queries
+            if query["sql"].startswith('UPDATE "listings_furniturelisting"')
+        )
+        assignments = update.split(" SET ")[1].split(" WHERE ")[0]
+        self.assertIn('"title" = ', assignments)
+        self.assertNotIn('"price" = ', assignments)
+        self.assertNotIn('"description" = ', assignments)
+
+        response = self.client.patch(url, {"status": "completed"}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["status"], "A listing cannot go from draft to completed")
+
+        response = self.client.patch(url, {
+            "status": "published", "title": "Renamed", "price": "100.00",
+            "category": "CHAIR", "condition": "good",
+        }, format="json")
+        self.assertEqual(response.data["status"], "published")
+
+
+class QueryPlanTests(TestCase):
+    # A full table scan, or sorting rows an index should have ordered, on
+    # SQLite or PostgreSQL
+    unindexed_plan = r"(?m)^SCAN \S+$|TEMP B-TREE|Seq Scan|(^|\s)(Incremental )?Sort\s+\("
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username="seller", password="password")
+        cls.buyer = User.objects.create_user(username="buyer", password="password")
+        create_listings(cls.seller, 30)
+        create_listings(cls.seller, 10, status="draft")
+        sold = create_listings(cls.seller, 10, status="sold")
+        Purchase.objects.bulk_create(
+            Purchase(buyer=cls.buyer, listing=listing, price_at_time_of_purchase=listing.price)
+            for listing in sold
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                # Tiny test tables are cheaper to scan; ask what the indexes allow.
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute(f"EXPLAIN {sql}")
+            else:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return "\n".join(str(row[-1]) for row in cursor.fetchall())
+
+    def assertQueriesUseIndexes(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        selects = [query["sql"] for query in queries.captured_queries if query["sql"].startswith("SELECT")]
+        self.assertTrue(selects)
+        for sql in selects:
+            plan = self.explain(sql)
+            self.assertNotRegex(plan, self.unindexed_plan, f"{sql}\n{plan}")
+        return response
+
+    def test_homepage_feed_pages(self):
+        response = self.assertQueriesUseIndexes(reverse("homepage") + "?page_size=10")
+        cache.clear()
+        self.assertQueriesUseIndexes(response.data["next"])
+
+    def test_my_listings(self):
+        self.client.force_authenticate(self.seller)
+        self.assertQueriesUseIndexes(reverse("my-listings", args=["draft"]))
+
+    def test_purchased_listings(self):
+        self.client.force_authenticate(self.buyer)
+        self.assertQueriesUseIndexes(reverse("purchased-listings"))
+
+    def test_saved_listings(self):
+        SavedListing.objects.bulk_create(
+            SavedListing(user=self.buyer, listing=listing)
+            for listing in FurnitureListing.objects.filter(status="published")
+        )
+        self.client.force_authenticate(self.buyer)
+        response = self.assertQueriesUseIndexes(reverse("saved-listings") + "?page_size=10")
+        self.assertQueriesUseIndexes(response.data["next"])
+
+
+class SavedListingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username="seller", password="password")
+        cls.user = User.objects.create_user(username="user", password="password")
+        cls.listings = create_listings(cls.seller, 6)
+        for listing in cls.listings:
+            get_search_backend().index(listing)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def save(self, listing):
+        return self.client.post(reverse("listing-save-listing", args=[listing.pk]))
+
+    def test_save_and_remove(self):
+        self.assertEqual(self.save(self.listings[0]).status_code, 200)
+        # Saving twice keeps one row
+        self.save(self.listings[0])
+        self.assertEqual(list(self.user.saved_listings.all()), [self.listings[0]])
+
+        self.client.post(reverse("listing-remove-saved-listing", args=[self.listings[0].pk]))
+        self.assertFalse(SavedListing.objects.exists())
+
+    def test_saved_feed_is_most_recently_saved_first(self):
+        for listing in self.listings[:5]:
+            self.save(listing)
+        other = User.objects.create_user(username="other", password="password")
+        SavedListing.objects.create(user=other, listing=self.listings[5])
+
+        seen = []
+        url, params = reverse("saved-listings"), {"page_size": 2}
+        while url:
+            response = self.client.get(url, params)
+            self.assertTrue(all(row["is_saved"] for row in response.data["results"]))
+            seen.extend(row["id"] for row in response.data["results"])
+            url, params = response.data["next"], None
+        self.assertEqual(seen, [listing.pk for listing in reversed(self.listings[:5])])
+
+    def test_feeds_mark_saved_listings_in_one_query(self):
+        self.save(self.listings[1])
+        self.save(self.listings[4])
+        expected = {self.listings[1].pk, self.listings[4].pk}
+
+        for url in (reverse("homepage"), reverse("homepage") + "?page=1", reverse("listing-search") + "?q=listing"):
+            results = self.client.get(url).data["results"]
+            self.assertEqual({row["id"] for row in results if row["is_saved"]}, expected, url)
+
+        # A cached homepage page costs the one saved lookup
+        with self.assertNumQueries(1):
+            self.client.get(reverse("homepage"))
+
+        self.client.force_authenticate(None)
+        results = self.client.get(reverse("homepage")).data["results"]
+        self.assertFalse(any(row["is_saved"] for row in results))
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username="seller", password="password")
+        cls.user = User.objects.create_user(username="user", password="password")
+        cls.listings = create_listings(cls.seller, 7)
+        create_listings(cls.user, 2)
+        SavedListing.objects.create(user=cls.user, listing=cls.listings[3])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def headers(self, user):
+        return {"Authorization": f"Bearer {RefreshToken.for_user(user).access_token}"}
+
+    async def walk(self, url, **kwargs):
+        pages = []
+        params = {"page_size": 3}
+        while url:
+            response = await self.async_client.get(url, params, **kwargs)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json()["results"])
+            url, params = response.json()["next"], None
+        return pages
+
+    async def test_homepage_matches_the_sync_feed(self):
+        for headers in ({}, self.headers(self.user)):
+            sync_pages = await self.walk(reverse("homepage"), headers=headers)
+            async_pages = await self.walk(reverse("async-homepage"), headers=headers)
+            self.assertEqual(async_pages, sync_pages)
+        self.assertTrue(any(row["is_saved"] for page in async_pages for row in page))
+
+        response = await self.async_client.get(reverse("async-homepage"), {"page": 1})
+        self.assertEqual(response.json()["count"], 9)
+
+    async def test_homepage_rejects_invalid_tokens(self):
+        response = await self.async_client.get(
+            reverse("async-homepage"), headers={"Authorization": "Bearer nonsense"}
+        )
+        self.assertEqual(response.status_code, 401)
+
+    async def test_detail_serves_cache_hits_without_serializing(self):
+        listing = self.listings[0]
+        url = reverse("async-listing-details", args=[listing.pk])
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+
+        headers = self.headers(self.user)
+        first = await self.async_client.get(url, headers=headers)
+        self.assertEqual(first.json()["title"], listing.title)
+        sync = await sync_to_async(self.client.get)(
+            reverse("listing-details", args=[listing.pk]), headers=headers
+        )
+        self.assertEqual(first.content, sync.content)
+
+        with mock.patch("listings.async_views.ListingDetailSerializer") as serializer:
+            second = await self.async_client.get(url, headers=headers)
+        serializer.assert_not_called()
+        self.assertEqual(second.content, first.content)
+
+        draft = (await sync_to_async(create_listings)(self.seller, 1, status="draft"))[0]
+        response = await self.async_client.get(
+            reverse("async-listing-details", args=[draft.pk]), headers=headers
+        )
+        self.assertEqual(response.status_code, 500)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username="seller", password="password")
+        cls.buyer = User.objects.create_user(username="buyer", password="password")
+        cls.listings = create_listings(cls.seller, 5)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def revalidate(self, url, etag, queries, **params):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, params, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+
+    def test_detail_revalidates_with_one_query(self):
+        self.client.force_authenticate(self.buyer)
+        listing = self.listings[0]
+        url = reverse("listing-details", args=[listing.pk])
+        etag = self.client.get(url)["ETag"]
+        with mock.patch("listings.views.ListingDetailSerializer") as serializer:
+            self.revalidate(url, etag, 1)
+        serializer.assert_not_called()
+        self.revalidate(reverse("listing-detail", args=[listing.pk]), etag, 1)
+
+        # An image-only change, which leaves updated_at alone, is a new version
+        image_ids = list(listing.images.order_by("order").values_list("id", flat=True))
+        image_updates = [
+            {"id": str(image_id), "order": order} for order, image_id in enumerate(image_ids[::-1], start=1)
+        ]
+        self.client.force_authenticate(self.seller)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse("listing-detail", args=[listing.pk]), {"image_updates": image_updates}, format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["images"][0]["id"], image_ids[-1])
+
+    def test_feed_revalidates_from_the_cache(self):
+        url = reverse("homepage")
+        etag = self.client.get(url, {"page_size": 2})["ETag"]
+        self.revalidate(url, etag, 0, page_size=2)
+        # Another page is another representation
+        self.assertEqual(self.client.get(url, {"page_size": 3}, headers={"If-None-Match": etag}).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FurnitureListing.objects.filter(pk=self.listings[-1].pk).update(title="Renamed")
+            listing_status_changed.send(
+                sender=FurnitureListing, listing=self.listings[-1], previous_status="published"
+            )
+        response = self.client.get(url, {"page_size": 2}, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["title"], "Renamed")
+
+    def test_signed_in_feed_tracks_saved_listings(self):
+        self.client.force_authenticate(self.buyer)
+        url = reverse("homepage")
+        etag = self.client.get(url)["ETag"]
+        self.revalidate(url, etag, 1)
+
+        SavedListing.objects.create(user=self.buyer, listing=self.listings[0])
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        # Other users see the same windows with their own ETag
+        self.client.force_authenticate(self.seller)
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": etag}).status_code, 200)
+
+    async def test_async_views_share_the_etags(self):
+        headers = {"Authorization": f"Bearer {RefreshToken.for_user(self.buyer).access_token}"}
+        listing = self.listings[0]
+        sync_detail = await sync_to_async(self.client.get)(
+            reverse("listing-details", args=[listing.pk]), headers=headers
+        )
+        sync_feed = await sync_to_async(self.client.get)(reverse("homepage"), headers=headers)
+
+        for url, etag in (
+            (reverse("async-listing-details", args=[listing.pk]), sync_detail["ETag"]),
+            (reverse("async-homepage"), sync_feed["ETag"]),
+        ):
+            response = await self.async_client.get(url, headers={**headers, "If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response["ETag"], etag)
+
+
+class InstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(username="seller", password="password")
+        create_listings(cls.seller, 3)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_responses_carry_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("homepage"))
+        timing = response["Server-Timing"]
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        for metric in ("db;dur=", "storage;dur=", "serialize;dur=", "total;dur="):
+            self.assertIn(metric, timing)
+
+    def test_feed_serialization_is_timed(self):
+        client = APIClient()
+        client.force_authenticate(self.seller)
+
+        def slow_format_datetimes(values):
+            time.sleep(0.01)
+            return format_datetimes(values)
+
+        with mock.patch("listings.serializers.format_datetimes", slow_format_datetimes):
+            response = client.get(reverse("my-listings", args=["published"]))
+        self.assertEqual(len(response.data), 3)
+        serialize_ms = float(re.search(r"serialize;dur=([\d.]+)", response["Server-Timing"]).group(1))
+        self.assertGreaterEqual(serialize_ms, 10)
+
+    @override_settings(INSTRUMENTATION_LOG_SAMPLE_RATE=1)
+    def test_sampled_requests_are_logged(self):
+        with self.assertLogs("core.instrumentation", "INFO") as logs:
+            self.client.get(reverse("homepage"))
+        fields = json.loads(logs.records[0].getMessage())
+        self.assertEqual(fields["view"], "listings.views.HomePageListingsView")
+        self.assertEqual(fields["status"], 200)
+        self.assertEqual(fields["query_budget"], HomePageListingsView.query_budget)
+        self.assertGreater(fields["queries"], 0)
+
+    def test_requests_over_budget_fail(self):
+        with mock.patch.object(HomePageListingsView, "query_budget", 0):
+            with self.assertLogs("core.instrumentation", "WARNING"), self.assertLogs("django.request", "ERROR"):
+                with self.assertRaises(QueryBudgetExceeded):
+                    self.client.get(reverse("homepage"))
+
+                cache.clear()
+                with override_settings(ENFORCE_QUERY_BUDGETS=False):
+                    self.assertEqual(self.client.get(reverse("homepage")).status_code, 200)
+
+    def test_viewset_budgets_are_per_action(self):
+        client = APIClient()
+        client.force_authenticate(self.seller)
+        listing = FurnitureListing.objects.first()
+        with mock.patch.dict("listings.views.ListingViewSet.query_budget", {"retrieve": 0}):
+            with self.assertLogs("core.instrumentation", "WARNING"), self.assertLogs("django.request", "ERROR"):
+                with self.assertRaises(QueryBudgetExceeded):
+                    client.get(f"/api/listings/{listing.pk}/")
+
+    def test_storage_calls_are_counted_across_threads(self):
+        storage = InstrumentedS3Storage()
+        seen = []
+
+        def view(request):
+            events = storage.connection.meta.client.meta.events
+            # Answer at the HTTP layer; a Stubber would also skip the timing hooks.
+            events.register("before-send.s3", lambda request, **kwargs: AWSResponse(
+                request.url, 200, {}, mock.Mock(stream=lambda: iter([b""]))
+            ))
+            self.assertTrue(storage.exists("listings/1/photo.jpg"))
+            run_concurrently(lambda item: seen.append(current_metrics()), [1, 2])
+            seen.append(current_metrics())
+            return HttpResponse()
+
+        response = InstrumentationMiddleware(view)(RequestFactory().get("/"))
+        self.assertIn('desc="1 calls"', response["Server-Timing"])
+        self.assertEqual(len(seen), 3)
+        self.assertIs(seen[0], seen[2])
+        self.assertIs(seen[1], seen[2])
+
+
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username="staff", password="password", is_staff=True)
+        cls.seller = User.objects.create_user(username="seller", password="password")
+        create_listings(cls.seller, 3)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(profiling.forget_session)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def stacks(self, **params):
+        # The sampler copies its counts to the cache once it stops sampling.
+        deadline = time.monotonic() + 5
+        while True:
+            response = self.client.get(reverse("profiling-stacks"), params)
+            if response.content.strip() or time.monotonic() > deadline:
+                return response
+            time.sleep(0.05)
+
+    def test_only_staff_can_profile(self):
+        self.client.force_authenticate(self.seller)
+        self.assertEqual(self.client.get(reverse("profiling")).status_code, 403)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(reverse("profiling-stacks")).status_code, 401)
+
+    def test_unknown_url_names_are_rejected(self):
+        response = self.client.post(
+            reverse("profiling"), {"url_names": ["homepage", "nowhere"], "percent": 100, "duration": 60},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("nowhere", str(response.data["url_names"]))
+
+    def test_profiles_requests_to_the_chosen_url_names(self):
+        response = self.client.post(
+            reverse("profiling"),
+            {"url_names": ["homepage"], "percent": 100, "duration": 60, "interval_ms": 1},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        session = response.data["session"]
+
+        paginate_feed = CachedFeedPagination.paginate_feed
+
+        def slow_paginate_feed(self, *args, **kwargs):
+            time.sleep(0.05)
+            return paginate_feed(self, *args, **kwargs)
+
+        with mock.patch.object(CachedFeedPagination, "paginate_feed", slow_paginate_feed):
+            self.assertEqual(self.client.get(reverse("homepage")).status_code, 200)
+
+        lines = self.stacks().content.decode().splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(" ", 1)
+        self.assertGreater(int(count), 0)
+        self.assertIn("listings.views.HomePageListingsView.list", stack)
+        self.assertTrue(stack.endswith("slow_paginate_feed"))
+
+        profile = self.stacks(output="speedscope", session=session["id"]).json()
+        frames = [frame["name"] for frame in profile["shared"]["frames"]]
+        self.assertIn("listings.views.HomePageListingsView.list", frames)
+        sampled = profile["profiles"][0]
+        self.assertEqual(len(sampled["samples"]), len(sampled["weights"]))
+        self.assertEqual(sampled["endValue"], sum(sampled["weights"]))
+
+        stopped = self.client.delete(reverse("profiling")).data["session"]
+        self.assertLessEqual(stopped["until"], time.time())
+        self.assertIsNone(profiling.get_session())
+
+
+class ImageReorderTests(TestCase):
+    def test_swapping_image_orders(self):
+        seller = User.objects.create_user(username="seller", password="password")
+        listing = create_listings(seller, 1, status="draft")[0]
+        first, second, third = listing.images.order_by("order")
+        self.client = APIClient()
+        self.client.force_authenticate(seller)
+
+        image_updates = [
+            {"id": str(first.id), "order": 3},
+            {"id": str(third.id), "order": 1},
+        ]
+        response = self.client.patch(
+            f"/api/listings/{listing.id}/", {"image_updates": image_updates}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(listing.images.order_by("order").values_list("id", flat=True)),
+            [third.id, second.id, first.id],
+        )
+
+
+class MarketplaceBenchmarkTests(TestCase):
+    def test_seeds_a_consistent_marketplace(self):
+        with local_image_storage() as storage:
+            counts = seed_marketplace(10, 200, images_per_listing=3, image_bytes=b"jpeg")
+            self.assertEqual(len(storage.listdir("listings")[0]), 200)
+
+        self.assertEqual(counts["users"], 10)
+        self.assertEqual(FurnitureListing.objects.count(), 200)
+        self.assertEqual(ListingImage.objects.count(), counts["images"])
+        self.assertTrue(200 <= counts["images"] <= 600)
+        sold = FurnitureListing.objects.filter(status=FurnitureListing.Status.SOLD)
+        self.assertEqual(Purchase.objects.count(), sold.count())
+        self.assertFalse(Purchase.objects.filter(buyer=models.F("listing__seller")).exists())
+        self.assertGreater(
+            FurnitureListing.objects.filter(status=FurnitureListing.Status.PUBLISHED).count(),
+            FurnitureListing.objects.exclude(status=FurnitureListing.Status.PUBLISHED).count(),
+        )
+        user = User.objects.order_by("id").first()
+        self.assertEqual(
+            user.number_of_active_listings,
+            FurnitureListing.objects.filter(seller=user, status=FurnitureListing.Status.PUBLISHED).count(),
+        )
+
+        # The same seed gives the same marketplace
+        titles = list(FurnitureListing.objects.order_by("id").values_list("title", "status"))
+        FurnitureListing.objects.all().delete()
+        User.objects.all().delete()
+        seed_marketplace(10, 200, images_per_listing=3)
+        self.assertEqual(list(FurnitureListing.objects.order_by("id").values_list("title", "status")), titles)
+
+    def test_benchmarks_report_latency_and_queries(self):
+        with local_image_storage():
+            seed_marketplace(5, 60)
+            purchases = Purchase.objects.count()
+            results = run_marketplace_benchmarks(2, sample_jpeg(size=(320, 240)))
+
+        self.assertEqual(set(results), {
+            "homepage_cold", "homepage_warm", "homepage_next_page_signed_in", "detail_cold", "detail_warm",
+            "create_with_images", "update_with_reorder", "purchase",
+        })
+        for result in results.values():
+            self.assertEqual(result["requests"], 2)
+            self.assertLessEqual(result["p50"], result["max"])
+        self.assertEqual(results["homepage_warm"]["queries_max"], 0)
+        self.assertLess(results["detail_warm"]["queries_max"], results["detail_cold"]["queries_max"])
+        self.assertEqual(Purchase.objects.count(), purchases + 2)
@@ -0,0 +1,118 @@
+"""
+Direct-to-bucket uploads of listing images.
+
+The API hands out upload slots: a storage key under UPLOAD_PREFIX, a
+presigned POST the browser sends the file to, and a signed token. Listing
+create/update requests then reference the token instead of carrying the
+file, and the key is attached to a new ListingImage that the image pipeline
+compresses into the listing's own prefix. Uploads never attached are removed
+by the purge_temp_uploads management command.
+"""
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
+
+from .storage import image_storage
+
+UPLOAD_PREFIX = "temp"
+
+# Content types accepted by upload slots, with the extension of their key.
+UPLOAD_CONTENT_TYPES = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/gif": "gif",
+}
+
+MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+MAX_UPLOAD_SLOTS = 20
+
+# Tokens outlive the presigned POST so a slow form can still be submitted,
+# but expire well before purge_temp_uploads considers an upload abandoned.
+UPLOAD_TOKEN_MAX_AGE = 24 * 60 * 60
+
+TOKEN_SALT = "listings.uploads"
+
+
+class InvalidUpload(ValueError):
+    pass
+
+
+def upload_expiry():
+    return getattr(settings, "AWS_QUERYSTRING_EXPIRE", 600)
+
+
+def presign_upload(storage, key, content_type):
+    """
+    Return {"url": ..., "fields": {...}} for a browser form POST of one file of
+    `content_type` to `key`, limited to MAX_UPLOAD_SIZE bytes.
+    """
+    if not isinstance(storage, S3Boto3Storage):
+        # Local stand-ins (e.g. in tests) presign their own uploads.
+        return storage.presign_upload(key, content_type, MAX_UPLOAD_SIZE, upload_expiry())
+
+    return storage.bucket.meta.client.generate_presigned_post(
+        Bucket=storage.bucket_name,
+        Key=storage._normalize_name(clean_name(key)),
+        Fields={"Content-Type": content_type},
+        Conditions=[
+            {"Content-Type": content_type},
+            ["content-length-range", 1, MAX_UPLOAD_SIZE],
+        ],
+        ExpiresIn=upload_expiry(),
+    )
+
+
+def create_upload_slot(user, content_type):
+    key = f"{UPLOAD_PREFIX}/{uuid.uuid4()}.{UPLOAD_CONTENT_TYPES[content_type]}"
+    token = signing.dumps({"key": key, "user": user.pk}, salt=TOKEN_SALT)
+    return {"key": key, "token": token, **presign_upload(image_storage(), key, content_type)}
+
+
+def claim_upload(user, token, claimed):
+    """
+    Return the storage key of the finished upload behind `token` and add it to
+    `claimed`, the keys already claimed by the same request. Raises
+    InvalidUpload unless `user` was issued the token, the file is in the
+    bucket and neither an image nor `claimed` uses it yet.
+
+    A concurrent request can still claim the same key; the unique constraint
+    on ListingImage.image rejects whichever inserts second.
+    """
+    from .models import ListingImage
+
+    try:
+        data = signing.loads(token, salt=TOKEN_SALT, max_age=UPLOAD_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        raise InvalidUpload("Invalid or expired upload token")
+    if data["user"] != user.pk:
+        raise InvalidUpload("Invalid or expired upload token")
+
+    key = data["key"]
+    if not image_storage().exists(key):
+        raise InvalidUpload(f"{key} has not been uploaded")
+    if key in claimed or ListingImage.objects.filter(image=key).exists():
+        raise InvalidUpload(f"{key} is already attached to a listing")
+    claimed.add(key)
+    return key
+
+
+def list_uploads(storage):
+    """Yield (key, last modified) for every object under UPLOAD_PREFIX."""
+    if isinstance(storage, S3Boto3Storage):
+        # One paginated LIST instead of a HEAD per object
+        prefix = storage._normalize_name(f"{UPLOAD_PREFIX}/")
+        for summary in storage.bucket.objects.filter(Prefix=prefix):
+            yield f"{UPLOAD_PREFIX}/{summary.key[len(prefix):]}", summary.last_modified
+        return
+
+    try:
+        names = storage.listdir(UPLOAD_PREFIX)[1]
+    except FileNotFoundError:
+        return
+    for name in names:
+        key = f"{UPLOAD_PREFIX}/{name}"
+        yield key, storage.get_modified_time(key)
@@ -1,55 +1,83 @@
 from django.shortcuts import get_object_or_404
-from rest_framework import viewsets, permissions, status, generics
+from rest_framework import viewsets, permissions, status, generics, filters
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from .models import FurnitureListing, ListingImage, Purchase
-from .serializers import ListingListSerializer, ListingDetailSerializer
+from .models import FurnitureListing, InvalidTransition, ListingImage, Purchase, PurchaseError, SavedListing, saved_listing_ids
+from .serializers import ListingListSerializer, ListingDetailSerializer, UploadSlotRequestSerializer
 from core.permissions import IsOwnerOrReadOnly
-from rest_framework.pagination import PageNumberPagination
+from .pagination import CachedFeedPagination, SavedListingsPagination, SearchResultsPagination
+from .search import ListingSearchFilter, get_search_backend
+from .conditional import make_etag, not_modified
+from .detail_cache import get_detail_entry
+from .facets import ListingFacetFilter, get_facets, get_filter_params
+from .uploads import create_upload_slot
 from rest_framework.exceptions import APIException
-from django.db import transaction
-import uuid
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
 import json
-from django.core.files.storage import default_storage
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-def temp_upload(request):
-    if "image" not in request.FILES:
-        return Response({"error": "No image file provided"}, status=400)
-
-    image = request.FILES["image"]
-    temp_id = str(uuid.uuid4())
-
-    # Save to temporary storage (this could be a local folder or a separate S3 bucket)
-    temp_path = f"temp/{temp_id}_{image.name}"
-    default_storage.save(temp_path, image)
-
-    temp_url = default_storage.url(temp_path)
+class UploadSlotsView(generics.GenericAPIView):
+    """
+    Issue upload slots for listing images. The browser POSTs each file
+    straight to the bucket, then passes the slot tokens as the "upload" of
+    image_updates when creating or updating the listing.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    query_budget = 1
+    serializer_class = UploadSlotRequestSerializer
 
-    return Response({"temp_id": temp_id, "image_url": temp_url})
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        slots = [
+            create_upload_slot(request.user, content_type)
+            for content_type in serializer.validated_data["content_types"]
+        ]
+        return Response({"uploads": slots}, status=status.HTTP_201_CREATED)
 
 
 class ListingViewSet(viewsets.ModelViewSet):
     serializer_class = ListingDetailSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
-    filterset_fields = ["condition", "price", "brand"]
-    search_fields = ["title", "description", "brand"]
+    # Queries per request by action (see core.instrumentation). Writes grow
+    # with the number of image updates; these cover the tested requests.
+    # Like every budget here, they include the token revocation lookup a
+    # request makes when it is not cached (see authentication/users.py).
+    query_budget = {
+        "retrieve": 5,
+        "create": 15,
+        "update": 16,
+        "partial_update": 16,
+        "save_listing": 6,
+        "remove_saved_listing": 3,
+        "publish": 8,
+        "unpublish": 8,
+        "reserve": 7,
+        "complete": 7,
+        "sell": 7,
+        "purchase": 9,
+    }
+    filter_backends = [ListingSearchFilter, ListingFacetFilter, filters.OrderingFilter]
     ordering_fields = ["price", "created_at"]
     parser_classes = [MultiPartParser, FormParser, JSONParser]
 
     def get_queryset(self):
         queryset = FurnitureListing.objects.all()
+        if self.action in FurnitureListing.TRANSITIONS:
+            # Lets can_be_published() and the response share one image query
+            queryset = queryset.prefetch_related("images")
         return queryset
 
     @transaction.atomic
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save(seller=self.request.user)
+        serializer.save(seller_id=self.request.user.pk)
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
@@ -71,11 +99,18 @@ class ListingViewSet(viewsets.ModelViewSet):
     #         ListingImage.objects.create(listing=listing, image=image, order=order)
 
     def retrieve(self, request, pk=None):
+        try:
+            entry = get_detail_entry(pk, lambda: self.get_serializer(self.get_object()).data)
+            return not_modified(request, entry["etag"]) or Response(entry["payload"], headers={"ETag": entry["etag"]})
+        except FurnitureListing.DoesNotExist:
+            # Drafts and sold listings are not cached
+            pass
+
         queryset = FurnitureListing.objects.all()
         listing = get_object_or_404(queryset, pk=pk)
         serializer = self.get_serializer(listing)
         data = serializer.data
-        is_owner = request.user == listing.seller
+        is_owner = listing.seller_id == request.user.pk
         data["is_owner"] = is_owner
         return Response(serializer.data)
 
@@ -84,7 +119,7 @@ class ListingViewSet(viewsets.ModelViewSet):
     )
     def save_listing(self, request, pk=None):
         listing = self.get_object()
-        request.user.saved_listings.add(listing)
+        SavedListing.objects.get_or_create(user_id=request.user.pk, listing=listing)
         return Response({"status": "listing saved"})
 
     @action(
@@ -92,111 +127,200 @@ class ListingViewSet(viewsets.ModelViewSet):
     )
     def remove_saved_listing(self, request, pk=None):
         listing = self.get_object()
-        request.user.saved_listings.remove(listing)
+        SavedListing.objects.filter(user_id=request.user.pk, listing=listing).delete()
         return Response({"status": "listing removed"})
     
+    def apply_transition(self, name):
+        listing = self.get_object()
+        try:
+            listing.transition(name)
+        except InvalidTransition as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(listing).data)
+
+    @action(detail=True, methods=["post"])
+    def publish(self, request, pk=None):
+        return self.apply_transition("publish")
+
+    @action(detail=True, methods=["post"])
+    def unpublish(self, request, pk=None):
+        return self.apply_transition("unpublish")
+
+    @action(detail=True, methods=["post"])
+    def reserve(self, request, pk=None):
+        return self.apply_transition("reserve")
+
+    @action(detail=True, methods=["post"])
+    def complete(self, request, pk=None):
+        return self.apply_transition("complete")
+
+    @action(detail=True, methods=["post"])
+    def sell(self, request, pk=None):
+        return self.apply_transition("sell")
+
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def purchase(self, request, pk=None):
         listing = self.get_object()
-        
-        # Check if listing is already sold
-        if listing.status == 'sold':
-            return Response(
-                {"error": "This item has already been sold"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Check if user is trying to buy their own listing
-        if listing.seller == request.user:
-            return Response(
-                {"error": "You cannot buy your own listing"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Use transaction to ensure atomicity
         try:
-            with transaction.atomic():
-                # Create purchase record
-                Purchase.objects.create(
-                    buyer=request.user,
-                    listing=listing,
-                    price_at_time_of_purchase=listing.price
-                )
-                
-                # Update listing status
-                listing.status = 'sold'
-                listing.save()
-        
-            return Response({
-                "message": "Purchase successful",
-                "listing_id": listing.id,
-            }, status=status.HTTP_200_OK)
-            
+            FurnitureListing.objects.purchase_listing(listing, request.user)
+        except PurchaseError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
         except IntegrityError:
             return Response(
                 {"error": "This item has already been purchased"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        return Response({
+            "message": "Purchase successful",
+            "listing_id": listing.id,
+        }, status=status.HTTP_200_OK)
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = "page_size"
-    max_page_size = 100
+
+def feed_etag(paginator, seller, saved):
+    """
+    The ETag of the keyset page `paginator` just read from the cached feed.
+    The cursor and page size are part of the URL, so only the windows read
+    and the user's view of them vary.
+    """
+    return make_etag(paginator.windows_digest, seller, sorted(saved))
 
 
 class HomePageListingsView(generics.ListAPIView):
     permission_classes = [permissions.AllowAny]
     serializer_class = ListingListSerializer
-    pagination_class = StandardResultsSetPagination
+    pagination_class = CachedFeedPagination
+    query_budget = 4
+
+    def list(self, request, *args, **kwargs):
+        if self.paginator.uses_page_numbers(request):
+            return super().list(request, *args, **kwargs)
+        # Everyone reads the cached feed; signed-in users skip their own listings.
+        seller = request.user.pk if request.user.is_authenticated else None
+        rows = self.paginator.paginate_feed(request, exclude_seller=seller)
+        saved = saved_listing_ids(request.user, [row["id"] for row in rows]) if seller else set()
+        etag = feed_etag(self.paginator, seller, saved)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        if seller:
+            rows = [{**row, "is_saved": row["id"] in saved} for row in rows]
+        response = self.paginator.get_paginated_response(rows)
+        response["ETag"] = etag
+        return response
 
     def get_queryset(self):
-        queryset = FurnitureListing.objects.filter(status="published")
+        queryset = (
+            FurnitureListing.objects.filter(status="published")
+            .with_thumbnail()
+            .with_is_saved(self.request.user)
+        )
 
         if self.request.user.is_authenticated:
-            queryset = queryset.exclude(seller=self.request.user)
+            queryset = queryset.exclude(seller_id=self.request.user.pk)
 
-        return queryset
+        return queryset.feed_values("is_saved")
+
+
+class ListingSearchView(generics.ListAPIView):
+    permission_classes = [permissions.AllowAny]
+    serializer_class = ListingListSerializer
+    pagination_class = SearchResultsPagination
+    query_budget = 2
+    filter_backends = [ListingFacetFilter]
+
+    def get_queryset(self):
+        query = self.request.query_params.get("q", "")
+        queryset = get_search_backend().search(query).with_thumbnail().with_is_saved(self.request.user)
+
+        if self.request.user.is_authenticated:
+            queryset = queryset.exclude(seller_id=self.request.user.pk)
+
+        return queryset.feed_values("is_saved", "search_score")
+
+
+class ListingFacetsView(generics.GenericAPIView):
+    permission_classes = [permissions.AllowAny]
+    query_budget = 2
+
+    def get(self, request, *args, **kwargs):
+        params = get_filter_params(request.query_params)
+        queryset = FurnitureListing.objects.filter(status="published")
+        if "q" in params:
+            matches = get_search_backend().search(params["q"])
+            queryset = queryset.filter(pk__in=matches.values("pk"))
+        return Response(get_facets(queryset, params))
 
 
 class MyPageListingsView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ListingListSerializer
+    query_budget = 2
 
     def get_queryset(self):
         status = self.kwargs.get("status", "published")
         queryset = FurnitureListing.objects.filter(
-            seller=self.request.user, status=status
-        )
+            seller_id=self.request.user.pk, status=status
+        ).with_thumbnail().with_is_saved(self.request.user)
 
-        return queryset
+        return queryset.feed_values("is_saved")
 
 
 class PurchasedListingsView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ListingListSerializer
+    query_budget = 2
 
     def get_queryset(self):
         purchases = FurnitureListing.objects.filter(
-            purchases__buyer=self.request.user
-        ).order_by('-purchases__purchase_date')
-        print(purchases)
-        return purchases
-        
+            purchases__buyer_id=self.request.user.pk
+        ).order_by('-purchases__purchase_date').with_thumbnail().with_is_saved(self.request.user)
+        return purchases.feed_values("is_saved")
+
+
+class SavedListingsView(generics.ListAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = ListingListSerializer
+    pagination_class = SavedListingsPagination
+    query_budget = 2
+
+    def get_queryset(self):
+        # One row per save, carrying its position for the cursor
+        return (
+            FurnitureListing.objects.filter(saves__user_id=self.request.user.pk)
+            .annotate(saved_at=F("saves__saved_at"), save_id=F("saves__id"), is_saved=Value(True))
+            .with_thumbnail()
+            .feed_values("is_saved", "saved_at", "save_id")
+        )
+
+
+def get_published_detail(listing_id):
+    return (
+        FurnitureListing.objects.select_related("seller")
+        .prefetch_related("images")
+        .get(id=listing_id, status="published")
+    )
+
+
 class ListingDetailView(generics.RetrieveAPIView):
     # permission_classes = [permissions.IsAuthenticated]
     serializer_class = ListingDetailSerializer
+    query_budget = 4
 
-    def get_object(self):
+    def retrieve(self, request, *args, **kwargs):
         listing_id = self.kwargs.get("listing_id")
         try:
-            listing = (
-                FurnitureListing.objects.select_related("seller")
-                .prefetch_related("images")
-                .get(id=listing_id, status="published")
+            entry = get_detail_entry(listing_id, lambda: self.get_serializer(self.get_object()).data)
+        except FurnitureListing.DoesNotExist:
+            raise APIException(
+                f"Published FurnitureListing with id {listing_id} not found."
             )
+        return not_modified(request, entry["etag"]) or Response(entry["payload"], headers={"ETag": entry["etag"]})
 
-            return listing
+    def get_object(self):
+        listing_id = self.kwargs.get("listing_id")
+        try:
+            return get_published_detail(listing_id)
         except FurnitureListing.DoesNotExist:
             raise APIException(
                 f"Published FurnitureListing with id {listing_id} not found."
@@ -1,6 +1,26 @@
-from django.db import models
-from django.contrib.auth.models import AbstractUser
-# Create your models here.
+from django.db import models, transaction
+from django.contrib.auth.models import AbstractUser, UserManager as BaseUserManager
+
+from .signals import active_changed
+
+
+class UserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # Updates that may deactivate users send active_changed, so that their
+        # access tokens are revoked (see authentication/users.py)
+        if "is_active" not in kwargs:
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            user_ids = list(self.values_list("pk", flat=True))
+            rows = super().update(**kwargs)
+            active_changed.send(sender=self.model, user_ids=user_ids)
+        return rows
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
+    pass
+
+
 class User(AbstractUser):
     """
     Custom user model extending AbstractUser.
@@ -16,5 +36,7 @@ class User(AbstractUser):
         }
     )
 
+    objects = UserManager()
+
     def __str__(self):
         return self.username
@@ -13,6 +13,9 @@ class UserSerializer(serializers.ModelSerializer):
         ]
         extra_kwargs = {
             'password': {'write_only': True},
+            # Maintained by listings.counters
+            'number_of_active_listings': {'read_only': True},
+            'number_of_sold_listings': {'read_only': True},
         }
 
     def create(self, validated_data):
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent with `user_ids` when a queryset update (including bulk_update) sets
+# is_active, which sends no post_save.
+active_changed = Signal()
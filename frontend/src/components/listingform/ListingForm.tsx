@@ -14,6 +14,7 @@ import {
     Container,
 } from "@mantine/core";
 import { useForm } from "@mantine/form";
+import axios from "axios";
 import api from "../../api";
 import ImageUploader from "../imageuploader/ImageUploader";
 import "./ListingForm.css";
@@ -34,6 +35,13 @@ interface Image {
     order: number;
 }
 
+interface UploadSlot {
+    key: string;
+    token: string;
+    url: string;
+    fields: Record<string, string>;
+}
+
 function ListingForm(): JSX.Element {
     const navigate = useNavigate();
     const { listing_id } = useParams<{ listing_id: string }>();
@@ -158,6 +166,35 @@ function ListingForm(): JSX.Element {
         }
     };
 
+    // Sends new images straight to the bucket and returns their upload
+    // tokens by order; the listing request only carries the tokens.
+    const uploadNewImages = async (): Promise<Record<number, string>> => {
+        const newImages = displayImages.flatMap((img, index) =>
+            img.file ? [{ file: img.file, order: index + 1 }] : []
+        );
+        if (newImages.length === 0) return {};
+
+        const response = await api.post("/api/uploads/", {
+            content_types: newImages.map((img) => img.file.type),
+        });
+        const slots: UploadSlot[] = response.data.uploads;
+
+        const tokens: Record<number, string> = {};
+        await Promise.all(
+            slots.map(async (slot, i) => {
+                const body = new FormData();
+                Object.entries(slot.fields).forEach(([key, value]) =>
+                    body.append(key, value)
+                );
+                // The file must be the last field of an S3 form POST
+                body.append("file", newImages[i].file);
+                await axios.post(slot.url, body);
+                tokens[newImages[i].order] = slot.token;
+            })
+        );
+        return tokens;
+    };
+
     const handleSubmit = async (action: "draft" | "publish") => {
         if (action === "publish") {
             const validation = form.validate();
@@ -176,28 +213,25 @@ function ListingForm(): JSX.Element {
 
         formData.set("status", action === "publish" ? "published" : "draft");
 
-        const imageUpdates = [
-            ...displayImages.map((img, index) => ({
-                id: img.id || null,
-                order: index + 1,
-                delete: false,
-            })),
-            ...deletedImageIds.map((id) => ({
-                id,
-                order: 0,
-                delete: true,
-            })),
-        ];
-
-        formData.append("image_updates", JSON.stringify(imageUpdates));
-
-        displayImages.forEach((img, index) => {
-            if (img.file) {
-                formData.append(`image_${index + 1}`, img.file);
-            }
-        });
-
         try {
+            const uploadTokens = await uploadNewImages();
+
+            const imageUpdates = [
+                ...displayImages.map((img, index) => ({
+                    id: img.id || null,
+                    order: index + 1,
+                    upload: uploadTokens[index + 1],
+                    delete: false,
+                })),
+                ...deletedImageIds.map((id) => ({
+                    id,
+                    order: 0,
+                    delete: true,
+                })),
+            ];
+
+            formData.append("image_updates", JSON.stringify(imageUpdates));
+
             if (listing_id) {
                 await api.patch(`/api/listings/${listing_id}/`, formData, {
                     headers: { "Content-Type": "multipart/form-data" },
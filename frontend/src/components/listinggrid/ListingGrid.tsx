@@ -8,6 +8,7 @@ interface ListingItem {
     title: string;
     price: number;
     thumbnail?: string;
+    thumbnail_srcset?: Record<string, string> | null;
 }
 
 interface ListingGridProps {
@@ -71,6 +72,8 @@ const ListingGrid: FC<ListingGridProps> = ({
                         <Image
                             className={styles.thumbnail}
                             src={item.thumbnail}
+                            srcSet={item.thumbnail_srcset?.webp}
+                            sizes="100px"
                             height={100}
                             width={100}
                             radius="md"
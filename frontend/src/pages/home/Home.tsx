@@ -22,6 +22,7 @@ interface Listing {
     title: string;
     price: number;
     thumbnail: string;
+    thumbnail_srcset?: Record<string, string> | null;
 }
 
 function Home() {
@@ -91,6 +92,8 @@ function Home() {
                                             <Image
                                                 className={styles.image}
                                                 src={listing.thumbnail}
+                                                srcSet={listing.thumbnail_srcset?.webp}
+                                                sizes="(max-width: 768px) 50vw, 320px"
                                                 alt={listing.title}
                                                 fallbackSrc="https://placehold.co/200x200"
                                                 fit="contain"